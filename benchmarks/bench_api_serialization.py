@@ -0,0 +1,85 @@
+"""
+Serialization time of the post API per 1,000 posts.
+
+Compares PostSerializer over the plain queryset (one categories query per
+post), PostSerializer with prefetch_related('categories') and the read path
+of the viewsets (PostValuesSerializer over `.values()` rows), with all fields
+and with a sparse `?fields=id,title,created_at` selection.
+
+Runs against a throwaway test database, the project database is not touched.
+Run from the project root:
+    python benchmarks/bench_api_serialization.py [--posts 1000] [--repeat 5]
+"""
+import argparse
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'newsportal.settings')
+
+import django  # noqa: E402
+
+django.setup()
+
+from django.contrib.auth.models import User  # noqa: E402
+from django.db import connection  # noqa: E402
+from django.test.utils import CaptureQueriesContext, setup_test_environment  # noqa: E402
+
+from news.models import Author, Category, Post, PostCategory  # noqa: E402
+from news.serializers import PostSerializer, PostValuesSerializer  # noqa: E402
+
+
+def seed(n, rnd):
+    author = Author.objects.create(user=User.objects.create(username='bench'))
+    categories = [Category.objects.create(name=f'bench-{i}') for i in range(8)]
+    posts = Post.objects.bulk_create(
+        Post(author=author, post_type=Post.NEWS, title=f'Post {i}', text='lorem ipsum ' * 200)
+        for i in range(n)
+    )
+    PostCategory.objects.bulk_create(
+        PostCategory(post=post, category=category)
+        for post in posts
+        for category in rnd.sample(categories, 2)
+    )
+
+
+def run(label, func, n, repeat):
+    best = None
+    for _ in range(repeat):
+        with CaptureQueriesContext(connection) as queries:
+            started = time.perf_counter()
+            func()
+            elapsed = time.perf_counter() - started
+        best = elapsed if best is None else min(best, elapsed)
+    per_1000 = best * 1000 / n * 1000
+    print(f'  {label:<34} {per_1000:9.1f} ms / 1000 posts  {len(queries):>5} queries')
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--posts', type=int, default=1000)
+    parser.add_argument('--repeat', type=int, default=5)
+    args = parser.parse_args()
+
+    setup_test_environment()
+    old_name = connection.creation.create_test_db(verbosity=0)
+    try:
+        seed(args.posts, random.Random(42))
+        base = Post.objects.filter(post_type=Post.NEWS).order_by('-created_at', '-id')
+        sparse = ('id', 'title', 'created_at')
+        print(f'{args.posts} posts, best of {args.repeat}:')
+        run('PostSerializer (before)', lambda: PostSerializer(base.all(), many=True).data, args.posts, args.repeat)
+        run('PostSerializer + prefetch', lambda: PostSerializer(base.prefetch_related('categories'), many=True).data,
+            args.posts, args.repeat)
+        run('PostValuesSerializer', lambda: PostValuesSerializer(base.values(*PostValuesSerializer.columns())).data,
+            args.posts, args.repeat)
+        run('PostValuesSerializer, ?fields=', lambda: PostValuesSerializer(base.values(*PostValuesSerializer.columns(sparse)), sparse).data,
+            args.posts, args.repeat)
+    finally:
+        connection.creation.destroy_test_db(old_name, verbosity=0)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,83 @@
+"""
+Throughput of the `censor` filter on 10k synthetic posts.
+
+Compares the previous implementation (pattern rebuilt and compiled on every
+call) with news.censor.CensorEngine, cold and memoized, for the built-in word
+list and for a list of several thousand words.
+
+Run from the project root:
+    python benchmarks/bench_censor.py [--posts 10000] [--words 5000]
+"""
+import argparse
+import os
+import random
+import re
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'newsportal.settings')
+
+import django  # noqa: E402
+
+django.setup()
+
+from news.censor import BAD_WORDS, CensorEngine  # noqa: E402
+
+ALPHABET = 'абвгдежзийклмнопрстуфхцчшщыэюя'
+
+
+def legacy_censor(value, words):
+    # The filter as it was: pattern rebuilt on every call
+    def mask(match):
+        return re.sub(r"[A-Za-zА-Яа-яЁё]", "*", match.group(0))
+    escaped = [re.escape(w) for w in words]
+    pattern = r"\b(" + "|".join(escaped) + r")\b"
+    return re.sub(pattern, mask, value, flags=re.IGNORECASE | re.UNICODE)
+
+
+def make_posts(n, words, rnd):
+    vocabulary = [''.join(rnd.choice(ALPHABET) for _ in range(rnd.randint(3, 10))) for _ in range(2000)]
+    words = list(words)
+    posts = []
+    for _ in range(n):
+        tokens = [rnd.choice(vocabulary) for _ in range(80)]
+        for _ in range(2):
+            tokens[rnd.randrange(len(tokens))] = rnd.choice(words).capitalize()
+        posts.append(' '.join(tokens))
+    return posts
+
+
+def run(label, func, posts):
+    started = time.perf_counter()
+    for text in posts:
+        func(text)
+    elapsed = time.perf_counter() - started
+    print(f'  {label:<28} {elapsed:8.3f}s  {len(posts) / elapsed:>12,.0f} posts/s')
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--posts', type=int, default=10000)
+    parser.add_argument('--words', type=int, default=5000)
+    parser.add_argument('--legacy-sample', type=int, default=500, help='Posts timed with the slow legacy filter')
+    args = parser.parse_args()
+    rnd = random.Random(42)
+
+    big = set(BAD_WORDS)
+    while len(big) < args.words:
+        big.add(''.join(rnd.choice(ALPHABET) for _ in range(rnd.randint(4, 9))))
+
+    for name, words in (('built-in list', BAD_WORDS), (f'{len(big)} words', big)):
+        posts = make_posts(args.posts, words, rnd)
+        engine = CensorEngine(words=words)
+        assert all(legacy_censor(t, words) == engine.censor(t) for t in posts[:20])
+        print(f'{name}, {len(posts)} posts:')
+        run('legacy (compile per call)', lambda t: legacy_censor(t, words), posts[:args.legacy_sample])
+        engine = CensorEngine(words=words)
+        run('engine, cold memo', engine.censor, posts)
+        run('engine, warm memo', engine.censor, posts)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,159 @@
+"""
+N parallel writer processes against one database profile: votes (read the
+post, then bump its rating), new posts and subscribe/unsubscribe toggles,
+each in its own transaction. Reports throughput, latency percentiles and
+"database is locked" failures.
+
+Every profile runs in a child process so the settings are read from a
+fresh environment. SQLite profiles use a throwaway file database,
+PostgreSQL a test database created from the NEWS_DB_* variables.
+
+Run from the project root:
+    python benchmarks/bench_db_concurrency.py [--writers 8] [--ops 200] [--profiles sqlite-default,sqlite,postgres]
+"""
+import argparse
+import multiprocessing
+import os
+import random
+import subprocess
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+PROFILES = {
+    # Stock SQLite: rollback journal, deferred transactions
+    'sqlite-default': {'NEWS_DB_PROFILE': 'sqlite', 'NEWS_SQLITE_TUNING': '0'},
+    'sqlite': {'NEWS_DB_PROFILE': 'sqlite', 'NEWS_SQLITE_TUNING': '1'},
+    'postgres': {'NEWS_DB_PROFILE': 'postgres'},
+}
+
+
+def setup_django():
+    sys.path.insert(0, ROOT)
+    os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'newsportal.settings')
+    import django
+    django.setup()
+
+
+def seed():
+    from django.contrib.auth.models import User
+    from news.models import Author, Category, Post
+
+    users = User.objects.bulk_create([User(username=f'writer{i}', email=f'writer{i}@example.com') for i in range(50)])
+    author = Author.objects.create(user=users[0])
+    categories = Category.objects.bulk_create([Category(name=f'cat{i}') for i in range(10)])
+    posts = Post.objects.bulk_create([
+        Post(author=author, post_type=Post.NEWS, title=f'Post {i}', text='text') for i in range(200)
+    ])
+    return {
+        'author': author.pk,
+        'users': [u.pk for u in User.objects.order_by('pk')],
+        'categories': [c.pk for c in categories],
+        'posts': [p.pk for p in Post.objects.order_by('pk')],
+    }
+
+
+def writer(index, ops, ids, results):
+    from django.db import OperationalError, connection, transaction
+    from django.db.models import F
+    from django.utils import timezone
+    from news.models import CategorySubscription, Post
+
+    rnd = random.Random(index)
+    latencies = []
+    errors = 0
+    for _ in range(ops):
+        kind = rnd.random()
+        started = time.perf_counter()
+        try:
+            with transaction.atomic():
+                if kind < 0.6:
+                    # Vote: read, then write in the same transaction
+                    post = Post.objects.only('id', 'rating').get(pk=rnd.choice(ids['posts']))
+                    Post.objects.filter(pk=post.pk).update(rating=F('rating') + 1, updated_at=timezone.now())
+                elif kind < 0.8:
+                    Post.objects.create(author_id=ids['author'], post_type=Post.NEWS, title='New post', text='text')
+                else:
+                    user_id, category_id = rnd.choice(ids['users']), rnd.choice(ids['categories'])
+                    deleted, _ = CategorySubscription.objects.filter(user_id=user_id, category_id=category_id).delete()
+                    if not deleted:
+                        CategorySubscription.objects.create(user_id=user_id, category_id=category_id)
+        except OperationalError:
+            errors += 1
+            continue
+        latencies.append(time.perf_counter() - started)
+    connection.close()
+    results.put((latencies, errors))
+
+
+def run_profile(profile, writers, ops):
+    setup_django()
+    from django.db import connection, connections
+    from django.test.utils import setup_test_environment
+
+    setup_test_environment()
+    if connection.vendor == 'sqlite':
+        from django.core.management import call_command
+        call_command('migrate', verbosity=0)
+        old_name = None
+    else:
+        old_name = connection.creation.create_test_db(verbosity=0)
+    try:
+        ids = seed()
+        connections.close_all()
+
+        context = multiprocessing.get_context('fork')
+        results = context.Queue()
+        processes = [context.Process(target=writer, args=(i, ops, ids, results)) for i in range(writers)]
+        started = time.perf_counter()
+        for process in processes:
+            process.start()
+        collected = [results.get() for _ in processes]
+        for process in processes:
+            process.join()
+        elapsed = time.perf_counter() - started
+    finally:
+        if old_name is not None:
+            connection.creation.destroy_test_db(old_name, verbosity=0)
+
+    latencies = sorted(latency for batch, _errors in collected for latency in batch)
+    errors = sum(errors for _batch, errors in collected)
+
+    def percentile(p):
+        return latencies[min(len(latencies) - 1, int(len(latencies) * p))] * 1000 if latencies else 0.0
+
+    print(
+        f'{profile:<15} {len(latencies) / elapsed:9.0f} tx/s   p50 {percentile(0.5):7.2f} ms   '
+        f'p95 {percentile(0.95):8.2f} ms   p99 {percentile(0.99):8.2f} ms   locked {errors}/{writers * ops}'
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--writers', type=int, default=8)
+    parser.add_argument('--ops', type=int, default=200, help='Transactions per writer')
+    parser.add_argument('--profiles', default='sqlite-default,sqlite', help=f'Comma-separated: {", ".join(PROFILES)}')
+    parser.add_argument('--run', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.run:
+        run_profile(args.run, args.writers, args.ops)
+        return
+
+    print(f'{args.writers} writers x {args.ops} transactions')
+    for profile in args.profiles.split(','):
+        env = dict(os.environ, **PROFILES[profile])
+        with tempfile.TemporaryDirectory() as tmp:
+            if env['NEWS_DB_PROFILE'] == 'sqlite':
+                env['NEWS_DB_NAME'] = os.path.join(tmp, 'bench.sqlite3')
+            subprocess.run(
+                [sys.executable, os.path.abspath(__file__), '--run', profile,
+                 '--writers', str(args.writers), '--ops', str(args.ops)],
+                env=env, check=True,
+            )
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,132 @@
+"""
+SQL queries and time per request of the editor pages (create/edit news and
+articles, "become an author") for a logged-in author.
+
+Compares Django's ModelBackend with news.auth.CachedModelBackend on a cold
+cache (cleared before every request) and on a warm one. The views look the
+Author profile up through news.auth in every run, so the ModelBackend run
+only shows the permission queries the backend saves. The access cache is
+only used with a shared cache backend, so the script runs on a throwaway
+file cache unless NEWS_CACHE_BACKEND is set.
+
+Runs against a throwaway test database, the project database is not touched.
+Run from the project root:
+    python benchmarks/bench_editor_queries.py [--repeat 20]
+"""
+import argparse
+import logging
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'newsportal.settings')
+CACHE_DIR = None
+if 'NEWS_CACHE_BACKEND' not in os.environ:
+    CACHE_DIR = tempfile.mkdtemp(prefix='bench-editor-cache-')
+    os.environ['NEWS_CACHE_BACKEND'] = 'file'
+    os.environ['NEWS_CACHE_LOCATION'] = CACHE_DIR
+
+import django  # noqa: E402
+
+django.setup()
+
+from django.conf import settings  # noqa: E402
+from django.contrib.auth.models import User  # noqa: E402
+from django.db import connection  # noqa: E402
+from django.test import Client, override_settings  # noqa: E402
+from django.test.utils import CaptureQueriesContext, setup_test_environment  # noqa: E402
+
+from news.cache import get_cache  # noqa: E402
+from news.models import Category, Post  # noqa: E402
+
+BACKENDS = {
+    'ModelBackend': 'django.contrib.auth.backends.ModelBackend',
+    'CachedModelBackend': 'news.auth.CachedModelBackend',
+}
+
+
+def seed():
+    editor = User.objects.create_user(username='bench-editor', password='x')
+    category = Category.objects.create(name='bench')
+    client = Client()
+    client.force_login(editor)
+    # Becomes an author: joins the authors group, gets an Author profile
+    client.post('/become-author/')
+    client.post('/create/', {'title': 'Seed news', 'text': 'text', 'categories': [category.pk]})
+    client.post('/articles/create/', {'title': 'Seed article', 'text': 'text', 'categories': [category.pk]})
+    news = Post.objects.get(title='Seed news')
+    article = Post.objects.get(title='Seed article')
+    return editor, category, news, article
+
+
+def pages(category, news, article):
+    form = {'title': 'Edited', 'text': 'text', 'categories': [category.pk]}
+    return [
+        ('GET  /create/', 'get', '/create/', None),
+        ('POST /create/', 'post', '/create/', dict(form, title='Bench news')),
+        ('GET  /<pk>/edit/', 'get', f'/{news.pk}/edit/', None),
+        ('POST /<pk>/edit/', 'post', f'/{news.pk}/edit/', form),
+        ('GET  /articles/create/', 'get', '/articles/create/', None),
+        ('POST /articles/<pk>/edit/', 'post', f'/articles/{article.pk}/edit/', form),
+        ('POST /become-author/', 'post', '/become-author/', {}),
+    ]
+
+
+def run(client, method, path, data, repeat, cold):
+    counts = []
+    elapsed = 0.0
+    for _ in range(repeat):
+        if cold:
+            get_cache().clear()
+        with CaptureQueriesContext(connection) as queries:
+            started = time.perf_counter()
+            response = getattr(client, method)(path, data) if data is not None else getattr(client, method)(path)
+            elapsed += time.perf_counter() - started
+        if response.status_code >= 400 or response.status_code == 302 and 'login' in response.url:
+            raise RuntimeError(f'{method.upper()} {path}: {response.status_code}')
+        counts.append(len(queries))
+    return max(counts), elapsed / repeat * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--repeat', type=int, default=20)
+    args = parser.parse_args()
+
+    # DEBUG settings log every query and request
+    logging.disable(logging.INFO)
+    setup_test_environment()
+    old_name = connection.creation.create_test_db(verbosity=0)
+    try:
+        editor, category, news, article = seed()
+        client = Client()
+        runs = [
+            ('ModelBackend', 'ModelBackend', False),
+            ('Cached, cold cache', 'CachedModelBackend', True),
+            ('Cached, warm cache', 'CachedModelBackend', False),
+        ]
+        print(f'mean of {args.repeat} requests')
+        print(f'{"":<28}' + ''.join(f'{title:>26}' for title, _name, _cold in runs))
+        for label, method, path, data in pages(category, news, article):
+            cells = []
+            for _title, name, cold in runs:
+                backends = (BACKENDS[name],) + tuple(settings.AUTHENTICATION_BACKENDS[1:])
+                with override_settings(AUTHENTICATION_BACKENDS=backends):
+                    # The session names the backend that loads the user
+                    client.force_login(editor, backend=BACKENDS[name])
+                    # Warm-up: fills the caches for the warm runs
+                    run(client, method, path, data, 1, cold)
+                    queries, ms = run(client, method, path, data, args.repeat, cold)
+                cells.append(f'{queries:>4} queries {ms:7.1f} ms')
+            print(f'{label:<28}' + ''.join(f'{cell:>26}' for cell in cells))
+    finally:
+        connection.creation.destroy_test_db(old_name, verbosity=0)
+        if CACHE_DIR:
+            shutil.rmtree(CACHE_DIR, ignore_errors=True)
+
+
+if __name__ == '__main__':
+    main()
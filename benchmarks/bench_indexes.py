@@ -0,0 +1,184 @@
+"""
+Query plans and timings of the list, search, category, API, digest and
+notification queries, before and after the indexes of migration 0008.
+The category feed page (migration 0009) is listed for comparison with the
+category page join.
+
+Seeds a throwaway test database (1M posts and 100k subscriptions by default),
+drops the 0008 indexes for the "before" run and recreates them for "after".
+The "before" search query uses the old `created_at__date__gte` filter.
+
+Run from the project root:
+    python benchmarks/bench_indexes.py [--posts 1000000] [--subscriptions 100000] [--repeat 5]
+"""
+import argparse
+import os
+import random
+import sys
+import time
+from datetime import datetime, timedelta, timezone as dt_timezone
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'newsportal.settings')
+
+import django  # noqa: E402
+
+django.setup()
+
+from django.db import connection, transaction  # noqa: E402
+from django.db.models import Q  # noqa: E402
+from django.test.utils import setup_test_environment  # noqa: E402
+from django.utils import timezone  # noqa: E402
+
+from news.digest import digest_pairs  # noqa: E402
+from news.models import Category, CategoryFeedEntry, CategorySubscription, Post, PostCategory  # noqa: E402
+
+NEW_INDEXES = [
+    (Post, 'news_post_type_created_idx'),
+    (PostCategory, 'news_postcat_category_post_idx'),
+    (CategorySubscription, 'news_sub_category_user_idx'),
+]
+CHUNK = 20000
+
+
+def insert(sql, rows):
+    with connection.cursor() as cursor:
+        for i in range(0, len(rows), CHUNK):
+            cursor.executemany(sql, rows[i:i + CHUNK])
+
+
+def seed(n_posts, n_subscriptions, n_categories, rnd):
+    adapt = connection.ops.adapt_datetimefield_value
+    now = timezone.now()
+    started = time.perf_counter()
+    with transaction.atomic():
+        n_users = max(1, n_subscriptions // n_categories) + 10
+        insert(
+            'INSERT INTO auth_user (username, email, password, is_superuser, first_name, last_name, is_staff, '
+            'is_active, date_joined) VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s)',
+            [(f'user{i}', f'user{i}@example.com', '!', False, '', '', False, True, adapt(now)) for i in range(n_users)],
+        )
+        user_ids = list(connection.cursor().execute('SELECT id FROM auth_user ORDER BY id').fetchall())
+        insert('INSERT INTO news_author (user_id, rating) VALUES (%s, %s)', [(uid, 0) for (uid,) in user_ids[:10]])
+        author_ids = [row[0] for row in connection.cursor().execute('SELECT id FROM news_author').fetchall()]
+        insert('INSERT INTO news_category (name, name_ru) VALUES (%s, %s)',
+               [(f'cat{i}', f'cat{i}') for i in range(n_categories)])
+        category_ids = [row[0] for row in connection.cursor().execute('SELECT id FROM news_category').fetchall()]
+
+        rows = []
+        for i in range(n_posts):
+            created = adapt(now - timedelta(seconds=rnd.randrange(2 * 365 * 24 * 3600)))
+            title = f'Post {i}'
+            rows.append((rnd.choice(author_ids), Post.NEWS if i % 3 else Post.ARTICLE, created, created,
+                         title, title, 'text', 'text', 'text', 'text', 0))
+        insert(
+            'INSERT INTO news_post (author_id, post_type, created_at, updated_at, title, title_ru, text, text_ru, '
+            'preview, preview_ru, rating) VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s)',
+            rows,
+        )
+        rows = None
+        post_ids = connection.cursor().execute('SELECT id FROM news_post').fetchall()
+        insert('INSERT INTO news_postcategory (post_id, category_id) VALUES (%s, %s)',
+               [(pid, rnd.choice(category_ids)) for (pid,) in post_ids])
+        pairs = [(uid, cid) for (uid,) in user_ids for cid in category_ids][:n_subscriptions]
+        insert('INSERT INTO news_categorysubscription (user_id, category_id, created_at) VALUES (%s, %s, %s)',
+               [(uid, cid, adapt(now)) for uid, cid in pairs])
+        # Category feed (migration 0009), filled the same way as its backfill
+        feed_columns = 'created_at, post_type, title, title_ru, title_en_us, preview, preview_ru, preview_en_us'
+        connection.cursor().execute(
+            f'INSERT INTO news_categoryfeedentry (category_id, post_id, {feed_columns}) '
+            f'SELECT pc.category_id, pc.post_id, {", ".join("p." + c for c in feed_columns.split(", "))} '
+            f'FROM news_postcategory pc INNER JOIN news_post p ON p.id = pc.post_id'
+        )
+    print(f'Seeded {n_posts} posts, {len(pairs)} subscriptions in {time.perf_counter() - started:.1f}s')
+    return category_ids
+
+
+def analyze():
+    if connection.vendor in ('sqlite', 'postgresql'):
+        with connection.cursor() as cursor:
+            cursor.execute('ANALYZE')
+
+
+def set_indexes(enabled):
+    with connection.schema_editor() as editor:
+        for model, name in NEW_INDEXES:
+            index = next(index for index in model._meta.indexes if index.name == name)
+            if enabled:
+                editor.add_index(model, index)
+            else:
+                editor.remove_index(model, index)
+    analyze()
+
+
+def queries(category_ids, before):
+    middle = Post.objects.filter(post_type=Post.NEWS).order_by('created_at').values_list('created_at', 'id')[1000]
+    week_ago = timezone.now() - timedelta(days=7)
+    month_ago = (timezone.now() - timedelta(days=30)).date()
+    cursor_filter = Q(created_at__lt=middle[0]) | Q(created_at=middle[0], id__lt=middle[1])
+    if before:
+        date_filter = Q(created_at__date__gte=month_ago)
+    else:
+        date_filter = Q(created_at__gte=datetime.combine(month_ago, datetime.min.time(), tzinfo=dt_timezone.utc))
+        # Same shape as KeysetPaginator.page(): a range bound in front of the OR
+        cursor_filter = Q(created_at__lte=middle[0]) & cursor_filter
+    keyset = ('-created_at', '-id')
+    return {
+        'news list, first page': Post.objects.filter(post_type=Post.NEWS)
+            .only('id', 'title', 'preview', 'created_at').order_by(*keyset)[:11],
+        'news list, cursor page': Post.objects.filter(post_type=Post.NEWS)
+            .filter(cursor_filter)
+            .only('id', 'title', 'preview', 'created_at').order_by(*keyset)[:11],
+        'news list, capped count': Post.objects.filter(post_type=Post.NEWS).order_by().values('id')[:1001],
+        'api articles': Post.objects.filter(post_type=Post.ARTICLE)
+            .values('id', 'author', 'post_type', 'created_at', 'title', 'rating').order_by(*keyset)[:11],
+        'search, date_after': Post.objects.filter(post_type=Post.NEWS).filter(date_filter)
+            .only('id', 'title', 'preview', 'created_at').order_by(*keyset)[:11],
+        'category page': Category.objects.get(pk=category_ids[0]).posts
+            .only('id', 'post_type', 'title', 'created_at').order_by('-created_at')[:50],
+        'category feed page': CategoryFeedEntry.objects.filter(category_id=category_ids[0])
+            .only('post', 'post_type', 'title', 'created_at').order_by('-created_at', '-post_id')[:21],
+        'digest pairs, 7 days': digest_pairs(since=week_ago),
+        'notification emails': CategorySubscription.objects.filter(category_id__in=category_ids[:2])
+            .values_list('user__email', flat=True).distinct().order_by('user__email'),
+    }
+
+
+def run(label, category_ids, before, repeat, show_plans):
+    print(f'\n== {label} ==')
+    for name, qs in queries(category_ids, before).items():
+        best = None
+        for _ in range(repeat):
+            started = time.perf_counter()
+            len(list(qs.all()))
+            elapsed = time.perf_counter() - started
+            best = elapsed if best is None else min(best, elapsed)
+        print(f'  {name:<26} {best * 1000:10.2f} ms')
+        if show_plans:
+            for line in qs.explain().splitlines():
+                print(f'      {line}')
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--posts', type=int, default=1000000)
+    parser.add_argument('--subscriptions', type=int, default=100000)
+    parser.add_argument('--categories', type=int, default=20)
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--no-plans', action='store_true', help='Only print timings')
+    args = parser.parse_args()
+
+    setup_test_environment()
+    old_name = connection.creation.create_test_db(verbosity=0)
+    try:
+        category_ids = seed(args.posts, args.subscriptions, args.categories, random.Random(42))
+        set_indexes(False)
+        run('before (no 0008 indexes, created_at__date filter, OR-only cursor)', category_ids, True, args.repeat, not args.no_plans)
+        set_indexes(True)
+        run('after', category_ids, False, args.repeat, not args.no_plans)
+    finally:
+        connection.creation.destroy_test_db(old_name, verbosity=0)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,165 @@
+"""
+Signup latency against a slow mail server.
+
+Starts a local SMTP stand-in that waits --smtp-delay seconds before every
+reply and signs users up through /accounts/signup/ (username, email,
+password):
+
+- "mail in request": the old behaviour, emulated: the outbox is relayed
+  right after each signup with Celery running tasks eagerly, so the welcome
+  email is sent within the timed request;
+- "queued": signup only writes an outbox row (news/outbox.py). The relay
+  then sends the rows to the memory:// broker and the worker's share is
+  run in-process to show the batching: one SMTP session per
+  NEWS_WELCOME_BATCH_SIZE emails.
+
+Runs against a throwaway test database, the project database is not touched.
+Run from the project root:
+    python benchmarks/bench_signup_latency.py [--signups 20] [--smtp-delay 0.05]
+"""
+import argparse
+import logging
+import os
+import socketserver
+import statistics
+import sys
+import threading
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'newsportal.settings')
+# In-process broker: queued tasks wait in memory, no Redis needed
+os.environ['CELERY_BROKER_URL'] = 'memory://'
+os.environ['CELERY_RESULT_BACKEND'] = 'cache+memory://'
+
+import django  # noqa: E402
+
+django.setup()
+
+from django.contrib.auth.models import User  # noqa: E402
+from django.db import connection  # noqa: E402
+from django.test import Client, override_settings  # noqa: E402
+from django.test.utils import setup_test_environment  # noqa: E402
+
+from newsportal.celery import app  # noqa: E402
+from news import tasks  # noqa: E402
+from news.outbox import relay_all  # noqa: E402
+
+
+class SlowSMTPHandler(socketserver.StreamRequestHandler):
+    """Just enough SMTP for smtplib: every reply after server.delay seconds."""
+
+    def reply(self, line):
+        time.sleep(self.server.delay)
+        self.wfile.write(line.encode() + b'\r\n')
+
+    def handle(self):
+        self.server.sessions += 1
+        self.reply('220 localhost stand-in')
+        while True:
+            line = self.rfile.readline()
+            if not line:
+                return
+            command = line.decode(errors='replace').strip().upper()
+            if command.startswith(('EHLO', 'HELO')):
+                self.reply('250 localhost')
+            elif command == 'DATA':
+                self.reply('354 end with .')
+                while self.rfile.readline() not in (b'.\r\n', b''):
+                    pass
+                self.server.messages += 1
+                self.reply('250 queued')
+            elif command == 'QUIT':
+                self.reply('221 bye')
+                return
+            else:
+                self.reply('250 ok')
+
+
+class SlowSMTPServer(socketserver.ThreadingTCPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(self, delay):
+        super().__init__(('127.0.0.1', 0), SlowSMTPHandler)
+        self.delay = delay
+        self.sessions = self.messages = 0
+
+
+def sign_up(prefix, n, after=None):
+    latencies = []
+    for i in range(n):
+        client = Client()
+        data = {
+            'username': f'{prefix}{i}', 'email': f'{prefix}{i}@example.com',
+            'password1': 'bench-pass-123', 'password2': 'bench-pass-123',
+        }
+        started = time.perf_counter()
+        response = client.post('/accounts/signup/', data)
+        if after is not None:
+            after()
+        latencies.append(time.perf_counter() - started)
+        if response.status_code != 302:
+            raise RuntimeError(f'Signup failed: {response.status_code}')
+    return latencies
+
+
+def report(label, latencies, smtp):
+    print(
+        f'{label:<18} mean {statistics.mean(latencies) * 1000:7.1f} ms   '
+        f'max {max(latencies) * 1000:7.1f} ms   '
+        f'SMTP sessions {smtp.sessions:>3}   messages {smtp.messages:>3}'
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--signups', type=int, default=20)
+    parser.add_argument('--smtp-delay', type=float, default=0.05, help='Seconds before every SMTP reply')
+    args = parser.parse_args()
+
+    # DEBUG settings log every query and request
+    logging.disable(logging.INFO)
+    smtp = SlowSMTPServer(args.smtp_delay)
+    threading.Thread(target=smtp.serve_forever, daemon=True).start()
+    setup_test_environment()
+    old_name = connection.creation.create_test_db(verbosity=0)
+    mail = override_settings(
+        EMAIL_BACKEND='django.core.mail.backends.smtp.EmailBackend',
+        EMAIL_HOST='127.0.0.1', EMAIL_PORT=smtp.server_address[1], EMAIL_USE_TLS=False, EMAIL_USE_SSL=False,
+        ACCOUNT_SIGNUP_FIELDS=['username*', 'email', 'password1*', 'password2*'],
+        # Password hashing would otherwise dominate the signup time
+        PASSWORD_HASHERS=['django.contrib.auth.hashers.MD5PasswordHasher'],
+    )
+    try:
+        with mail:
+            print(f'{args.signups} signups, SMTP reply delay {args.smtp_delay * 1000:.0f} ms')
+            app.conf.task_always_eager = True
+            # No batching window: every signup sends its own email at once
+            with override_settings(NEWS_WELCOME_BATCH_DELAY=0):
+                report('mail in request', sign_up('eager', args.signups, after=relay_all), smtp)
+
+            smtp.sessions = smtp.messages = 0
+            app.conf.task_always_eager = False
+            report('queued', sign_up('queued', args.signups), smtp)
+
+            started = time.perf_counter()
+            relayed = relay_all()
+            print(f'{"relay":<18} {relayed["relayed"]} outbox rows to the broker in {(time.perf_counter() - started) * 1000:.0f} ms')
+
+            # What a worker does with the queue: onboard every user, then one batch task
+            started = time.perf_counter()
+            for user_id in User.objects.filter(username__startswith='queued').values_list('id', flat=True):
+                tasks.onboard_user(user_id)
+            sent = tasks.send_welcome_emails()
+            print(
+                f'{"worker":<18} {sent} emails in {(time.perf_counter() - started) * 1000:.0f} ms   '
+                f'SMTP sessions {smtp.sessions:>3}   messages {smtp.messages:>3}'
+            )
+    finally:
+        connection.creation.destroy_test_db(old_name, verbosity=0)
+        smtp.shutdown()
+
+
+if __name__ == '__main__':
+    main()
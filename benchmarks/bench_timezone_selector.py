@@ -0,0 +1,105 @@
+"""
+Cost of the time zone selector in the page header, per response.
+
+Renders the old selector (every common time zone as an <option>, from the
+removed all_timezones context processor) and the current one (only the
+active zone; the list comes from /timezones/ when the selector is opened),
+then requests the news list page and compares its size with the old
+selector put back. Also times TimezoneMiddleware's lookup: pytz.timezone()
+per request against the memoized news.timezones.get_zone().
+
+Runs against a throwaway test database, the project database is not touched.
+Run from the project root:
+    python benchmarks/bench_timezone_selector.py [--repeat 2000]
+"""
+import argparse
+import logging
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'newsportal.settings')
+
+import django  # noqa: E402
+
+django.setup()
+
+import pytz  # noqa: E402
+from django.db import connection  # noqa: E402
+from django.template import engines  # noqa: E402
+from django.test import Client, RequestFactory  # noqa: E402
+from django.test.utils import setup_test_environment  # noqa: E402
+from django.utils import timezone  # noqa: E402
+
+from news.timezones import TIMEZONES_JSON, get_zone  # noqa: E402
+
+OLD_SELECTOR = """{% load tz %}{% get_current_timezone as TIMEZONE %}
+<select name="timezone">
+    {% for tz in all_timezones %}
+        <option value="{{ tz }}"{% if tz == TIMEZONE %} selected{% endif %}>{{ tz }}</option>
+    {% endfor %}
+</select>"""
+
+NEW_SELECTOR = """{% load tz %}{% get_current_timezone as TIMEZONE %}
+<select name="timezone" id="timezone-select" data-url="{% url 'news:timezones' %}">
+    <option value="{{ TIMEZONE }}" selected>{{ TIMEZONE }}</option>
+</select>"""
+
+
+def best_time(func, repeat):
+    best = None
+    for _ in range(5):
+        started = time.perf_counter()
+        for _ in range(repeat):
+            func()
+        elapsed = (time.perf_counter() - started) / repeat
+        best = elapsed if best is None else min(best, elapsed)
+    return best
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--repeat', type=int, default=2000)
+    args = parser.parse_args()
+
+    # DEBUG settings log every query and request
+    logging.disable(logging.INFO)
+    engine = engines['django']
+    request = RequestFactory().get('/')
+    timezone.activate(get_zone('Asia/Tokyo'))
+
+    old = engine.from_string(OLD_SELECTOR)
+    new = engine.from_string(NEW_SELECTOR)
+    old_context = {'all_timezones': pytz.common_timezones}
+    old_html = old.render(old_context, request)
+    new_html = new.render({}, request)
+    old_render = best_time(lambda: old.render(old_context, request), max(1, args.repeat // 20))
+    new_render = best_time(lambda: new.render({}, request), args.repeat)
+    print('Selector             bytes     render')
+    print(f'  old ({len(pytz.common_timezones)} options) {len(old_html.encode()):>7}  {old_render * 1e6:8.1f} us')
+    print(f'  new (lazy list)   {len(new_html.encode()):>7}  {new_render * 1e6:8.1f} us')
+    print(f'  /timezones/ JSON  {len(TIMEZONES_JSON):>7}  once per browser (Cache-Control max-age=86400, ETag)')
+
+    setup_test_environment()
+    old_name = connection.creation.create_test_db(verbosity=0)
+    try:
+        client = Client()
+        client.get('/')
+        page = len(client.get('/').content)
+        saved = len(old_html.encode()) - len(new_html.encode())
+        print(f'News list page: {page} bytes now, {page + saved} with the old selector ({saved / (page + saved):.0%} smaller)')
+    finally:
+        connection.creation.destroy_test_db(old_name, verbosity=0)
+
+    timezone.deactivate()
+    names = ['Asia/Tokyo', 'Europe/Paris', 'America/New_York', 'Europe/Moscow']
+    pytz_lookup = best_time(lambda: [pytz.timezone(name) for name in names], args.repeat) / len(names)
+    zone_lookup = best_time(lambda: [get_zone(name) for name in names], args.repeat) / len(names)
+    print('Middleware lookup per request')
+    print(f'  pytz.timezone()   {pytz_lookup * 1e6:8.2f} us')
+    print(f'  get_zone()        {zone_lookup * 1e6:8.2f} us')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,211 @@
+"""
+Throughput of the read-heavy pages under many concurrent keep-alive
+connections: uvicorn with the async views (NEWS_ASYNC_VIEWS=1) against
+gunicorn with the sync views.
+
+Seeds a throwaway SQLite database, starts each server on it with the same
+number of worker processes and hammers the list, detail, category and
+search pages from --connections client connections (asyncio, HTTP/1.1
+keep-alive) for --duration seconds. Requests are anonymous, so list,
+detail and category pages are mostly served from the fragment cache;
+search pages always query the database.
+
+Needs uvicorn and gunicorn (pip install uvicorn gunicorn). Run from the
+project root:
+    python benchmarks/loadtest.py [--connections 1000] [--duration 20] [--workers 2] [--servers asgi,wsgi]
+"""
+import argparse
+import asyncio
+import os
+import random
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+from collections import Counter
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+SERVERS = {
+    'asgi': lambda port, args: [
+        sys.executable, '-m', 'uvicorn', 'newsportal.asgi:application',
+        '--host', '127.0.0.1', '--port', str(port), '--workers', str(args.workers),
+        '--no-access-log', '--log-level', 'warning',
+    ],
+    'wsgi': lambda port, args: [
+        sys.executable, '-m', 'gunicorn', 'newsportal.wsgi:application',
+        '--bind', f'127.0.0.1:{port}', '--workers', str(args.workers),
+        '--worker-class', 'gthread', '--threads', str(args.threads),
+        '--worker-connections', str(args.connections), '--log-level', 'warning',
+    ],
+}
+
+
+def seed(posts, categories):
+    sys.path.insert(0, ROOT)
+    os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'newsportal.settings')
+    import django
+    django.setup()
+    from django.contrib.auth.models import User
+    from django.core.management import call_command
+    from news.feed import add_entries
+    from news.models import Author, Category, Post, PostCategory
+
+    call_command('migrate', verbosity=0)
+    rnd = random.Random(0)
+    words = ['economy', 'sport', 'science', 'weather', 'culture', 'market', 'election', 'health']
+    author = Author.objects.create(user=User.objects.create(username='loadtest'))
+    created = Category.objects.bulk_create([Category(name=f'category {i}') for i in range(categories)])
+    created_posts = Post.objects.bulk_create([
+        Post(author=author, post_type=Post.NEWS, title=f'{rnd.choice(words)} news {i}',
+             text=' '.join(rnd.choice(words) for _ in range(80)))
+        for i in range(posts)
+    ], batch_size=1000)
+    links = [(post.pk, rnd.choice(created).pk) for post in created_posts]
+    PostCategory.objects.bulk_create([PostCategory(post_id=p, category_id=c) for p, c in links], batch_size=1000)
+    add_entries(links, created_posts)
+
+
+async def read_response(reader):
+    head = await reader.readuntil(b'\r\n\r\n')
+    lines = head.decode('latin-1').split('\r\n')
+    status = int(lines[0].split()[1])
+    headers = {}
+    for line in lines[1:]:
+        if ':' in line:
+            name, value = line.split(':', 1)
+            headers[name.strip().lower()] = value.strip()
+    if 'content-length' in headers:
+        await reader.readexactly(int(headers['content-length']))
+    elif headers.get('transfer-encoding') == 'chunked':
+        while True:
+            size = int((await reader.readuntil(b'\r\n')).strip(), 16)
+            await reader.readexactly(size + 2)
+            if size == 0:
+                break
+    return status, headers.get('connection', '').lower() != 'close'
+
+
+async def client(port, paths, deadline, timeout, stats, rnd):
+    reader = writer = None
+    while time.perf_counter() < deadline:
+        path = rnd.choice(paths)
+        started = time.perf_counter()
+        try:
+            if writer is None:
+                reader, writer = await asyncio.wait_for(asyncio.open_connection('127.0.0.1', port), timeout)
+            writer.write(f'GET {path} HTTP/1.1\r\nHost: 127.0.0.1\r\nConnection: keep-alive\r\n\r\n'.encode())
+            await writer.drain()
+            status, keep_alive = await asyncio.wait_for(read_response(reader), timeout)
+        except (OSError, asyncio.TimeoutError, asyncio.IncompleteReadError, asyncio.LimitOverrunError, ValueError):
+            stats['errors'] += 1
+            if writer is not None:
+                writer.close()
+            reader = writer = None
+            continue
+        stats['latencies'].append(time.perf_counter() - started)
+        stats['statuses'][status] += 1
+        if not keep_alive:
+            writer.close()
+            reader = writer = None
+    if writer is not None:
+        writer.close()
+
+
+async def load(port, paths, connections, duration, timeout):
+    stats = {'latencies': [], 'statuses': Counter(), 'errors': 0}
+    started = time.perf_counter()
+    deadline = started + duration
+    await asyncio.gather(*[
+        client(port, paths, deadline, timeout, stats, random.Random(i)) for i in range(connections)
+    ])
+    return stats, time.perf_counter() - started
+
+
+def wait_for_port(port, process, timeout=30):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError('The server exited during startup')
+        try:
+            socket.create_connection(('127.0.0.1', port), timeout=1).close()
+            return
+        except OSError:
+            time.sleep(0.2)
+    raise RuntimeError(f'Nothing listens on port {port}')
+
+
+def run_server(name, args, env, paths, workdir):
+    port = args.port
+    log = open(os.path.join(workdir, f'{name}.log'), 'w')
+    # cwd: the servers write their log files there, not into the project
+    process = subprocess.Popen(SERVERS[name](port, args), env=env, cwd=workdir, stdout=log, stderr=subprocess.STDOUT)
+    try:
+        wait_for_port(port, process)
+        # Warm-up: fills the fragment caches of every worker
+        asyncio.run(load(port, paths, min(args.connections, 50), 2, args.timeout))
+        stats, elapsed = asyncio.run(load(port, paths, args.connections, args.duration, args.timeout))
+    finally:
+        process.terminate()
+        process.wait()
+        log.close()
+
+    latencies = sorted(stats['latencies'])
+
+    def percentile(p):
+        return latencies[min(len(latencies) - 1, int(len(latencies) * p))] * 1000 if latencies else 0.0
+
+    ok = sum(count for status, count in stats['statuses'].items() if status < 400)
+    print(
+        f'{name:<5} {len(latencies) / elapsed:8.0f} req/s   p50 {percentile(0.5):8.1f} ms   '
+        f'p95 {percentile(0.95):8.1f} ms   p99 {percentile(0.99):8.1f} ms   '
+        f'ok {ok}   other {len(latencies) - ok}   errors/timeouts {stats["errors"]}'
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--connections', type=int, default=1000)
+    parser.add_argument('--duration', type=float, default=20, help='Seconds per server')
+    parser.add_argument('--workers', type=int, default=2, help='Server processes')
+    parser.add_argument('--threads', type=int, default=8, help='Threads per gunicorn worker')
+    parser.add_argument('--timeout', type=float, default=30, help='Per-request timeout, seconds')
+    parser.add_argument('--posts', type=int, default=5000)
+    parser.add_argument('--categories', type=int, default=20)
+    parser.add_argument('--port', type=int, default=8765)
+    parser.add_argument('--servers', default='asgi,wsgi', help=f'Comma-separated: {", ".join(SERVERS)}')
+    parser.add_argument('--seed', action='store_true', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.seed:
+        seed(args.posts, args.categories)
+        return
+
+    with tempfile.TemporaryDirectory() as workdir:
+        env = dict(os.environ, NEWS_DB_PROFILE='sqlite', NEWS_DB_NAME=os.path.join(workdir, 'loadtest.sqlite3'))
+        env['PYTHONPATH'] = os.pathsep.join(filter(None, [ROOT, env.get('PYTHONPATH')]))
+        # DEBUG settings log every seeding query; only show them on failure
+        seeded = subprocess.run(
+            [sys.executable, os.path.abspath(__file__), '--seed',
+             '--posts', str(args.posts), '--categories', str(args.categories)],
+            env=env, cwd=workdir, capture_output=True, text=True,
+        )
+        if seeded.returncode:
+            sys.exit(seeded.stderr[-5000:])
+        rnd = random.Random(1)
+        paths = (
+            ['/'] * 4
+            + [f'/{rnd.randint(1, args.posts)}/' for _ in range(8)]
+            + [f'/categories/{rnd.randint(1, args.categories)}/' for _ in range(4)]
+            + ['/search/?q=economy', '/search/?title=sport']
+        )
+
+        print(f'{args.connections} connections, {args.duration:g}s per server, {args.workers} workers')
+        for name in args.servers.split(','):
+            server_env = dict(env, NEWS_ASYNC_VIEWS='1' if name == 'asgi' else '0')
+            run_server(name, args, server_env, paths, workdir)
+
+
+if __name__ == '__main__':
+    main()
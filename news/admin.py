@@ -1,6 +1,6 @@
 from django.contrib import admin
 from modeltranslation.admin import TranslationAdmin
-from .models import Author, Category, Post, PostCategory, Comment, CategorySubscription
+from .models import Author, BannedWord, Category, Post, PostCategory, Comment, CategorySubscription
 
 
 @admin.register(Author)
@@ -16,6 +16,12 @@ class CategoryAdmin(TranslationAdmin):
     search_fields = ('name',)
 
 
+@admin.register(BannedWord)
+class BannedWordAdmin(admin.ModelAdmin):
+    list_display = ('word',)
+    search_fields = ('word',)
+
+
 @admin.register(CategorySubscription)
 class CategorySubscriptionAdmin(admin.ModelAdmin):
     list_display = ('user', 'category', 'created_at')
@@ -8,3 +8,4 @@ class NewsConfig(AppConfig):
     def ready(self):
         # Import signals to ensure they are registered
         from . import signals  # noqa: F401
+        from . import db  # noqa: F401
@@ -0,0 +1,257 @@
+"""
+Async variants of the read-heavy pages, for ASGI servers (uvicorn).
+
+They subclass the sync views, so URLs, templates, cache tags and
+validators stay the same, and replace get() with a coroutine that uses the
+async ORM and cache APIs. news/urls.py mounts them instead of the sync
+views when NEWS_ASYNC_VIEWS is on.
+
+Django runs the async ORM calls of one request on its thread-sensitive
+worker thread, so asyncio.gather() below does not open extra database
+connections: it issues the independent queries of a page back to back
+without the view awaiting each in turn, while the event loop keeps serving
+other connections.
+"""
+import asyncio
+import time
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.contrib import messages
+from django.core.handlers.asgi import ASGIRequest
+from django.http import Http404, HttpResponse, HttpResponseBadRequest, StreamingHttpResponse
+from django.template.loader import render_to_string
+from django.template.response import TemplateResponse
+from django.utils.safestring import mark_safe
+from django.views.generic import View
+
+from .cache import aget_many, aget_tag_versions, arecord_lookup, get_cache, make_fragment_key
+from .conditional import ConditionalViewMixin, aconditional, aload_last_modified, last_modified_key, make_etag
+from .events import Subscription, encode_event, get_event_backend, hub
+from .middleware import record_template_time
+from .models import Category, Post
+from .pagination import InvalidCursor
+from .subscriptions import get_subscribed_category_ids
+from .views import CategoryDetailView, NewsDetailView, NewsListView, NewsSearchView
+
+
+async def alist(queryset):
+    return [obj async for obj in queryset]
+
+
+async def apage_or_404(paginator, cursor):
+    try:
+        return await paginator.apage(cursor)
+    except InvalidCursor:
+        raise Http404('Invalid cursor')
+
+
+def _has_messages(request):
+    # Message storage may read the session, which is sync-only
+    return bool(len(messages.get_messages(request)))
+
+
+class AsyncPageMixin:
+    """
+    get() of FragmentCacheMixin and ConditionalViewMixin as a coroutine:
+    304 from the validators, the cached fragment for anonymous readers,
+    otherwise aget_context_data() and the fragment template. Rendering runs
+    in a thread, Django templates are sync.
+
+    Every async cache call is a hop to a worker thread, so the tag versions
+    are read once for the ETag, the Last-Modified entry and the fragment
+    key, and the last two are fetched with one get_many().
+    """
+
+    async def aget_context_data(self, user):
+        raise NotImplementedError
+
+    async def get(self, request, *args, **kwargs):
+        user = await request.auser()
+        has_messages = await sync_to_async(_has_messages)(request)
+        conditional = isinstance(self, ConditionalViewMixin) and not has_messages
+        cacheable = not user.is_authenticated and not has_messages
+        name = type(self).__name__
+        # Fragments contain censored text, so they also depend on the word list
+        fragment_tags = self.get_cache_tags() + ['censor-words']
+        validator_tags = self.get_validator_tags() if conditional else []
+
+        versions = await aget_tag_versions(set(fragment_tags) | set(validator_tags))
+        keys = {}
+        if conditional:
+            queryset = self.get_validator_queryset()
+            keys['last_modified'] = last_modified_key(queryset, {tag: versions[tag] for tag in validator_tags})
+        if cacheable:
+            keys['fragment'] = make_fragment_key(request, name, {tag: versions[tag] for tag in fragment_tags})
+        found = await aget_many(keys.values()) if keys else {}
+
+        etag = last_modified = None
+        if conditional:
+            etag = make_etag(
+                request, name, {tag: versions[tag] for tag in validator_tags}, user, self.get_validator_extra(),
+            )
+            last_modified = found.get(keys['last_modified'])
+            if last_modified is None:
+                last_modified = await aload_last_modified(queryset, validator_tags, keys['last_modified'])
+
+        async def render():
+            if not cacheable:
+                return await self.arender_page(user)
+            cached = found.get(keys['fragment'])
+            await arecord_lookup(hit=cached is not None)
+            if cached is not None:
+                return self.page_response(cached['title'], mark_safe(cached['fragment']))
+            response = await self.arender_page(user)
+            await get_cache().aset(
+                keys['fragment'],
+                {'title': str(response.context_data['page_title']), 'fragment': str(response.context_data['fragment'])},
+                getattr(settings, 'NEWS_PAGE_CACHE_TIMEOUT', 300),
+            )
+            return response
+
+        return await aconditional(request, etag, last_modified, render)
+
+    async def arender_page(self, user):
+        context = await self.aget_context_data(user)
+        title, fragment = await sync_to_async(self.render_fragment)(context)
+        return self.page_response(title, fragment)
+
+    def render_fragment(self, context):
+        title = str(self.get_page_title(context))
+        started = time.perf_counter()
+        fragment = mark_safe(render_to_string(self.fragment_template_name, context, self.request))
+        record_template_time(time.perf_counter() - started)
+        return title, fragment
+
+    def page_response(self, title, fragment):
+        return TemplateResponse(
+            self.request,
+            [self.template_name],
+            {'view': self, 'page_title': title, 'fragment': fragment},
+        )
+
+
+class AsyncNewsListView(AsyncPageMixin, NewsListView):
+    async def aget_context_data(self, user):
+        paginator = self.get_keyset_paginator(self.get_queryset(), self.paginate_by)
+        page = await apage_or_404(paginator, self.request.GET.get(self.cursor_query_param))
+        return {
+            'view': self,
+            'paginator': paginator,
+            'page_obj': page,
+            'is_paginated': page.has_other_pages(),
+            'object_list': page.object_list,
+            self.context_object_name: page.object_list,
+        }
+
+
+class AsyncNewsDetailView(AsyncPageMixin, NewsDetailView):
+    async def aget_context_data(self, user):
+        pk = self.kwargs['pk']
+        try:
+            post, categories = await asyncio.gather(
+                self.get_queryset().aget(pk=pk),
+                alist(Category.objects.filter(posts=pk)),
+            )
+        except Post.DoesNotExist:
+            raise Http404('No news found matching the query')
+        self.object = post
+        return {'view': self, 'object': post, self.context_object_name: post, 'categories': categories}
+
+
+class AsyncCategoryDetailView(AsyncPageMixin, CategoryDetailView):
+    async def aget_context_data(self, user):
+        pk = self.kwargs['pk']
+        try:
+            category, page, subscribed = await asyncio.gather(
+                Category.objects.aget(pk=pk),
+                apage_or_404(self.get_feed_paginator(pk), self.request.GET.get('cursor')),
+                # Session-cached index (news/subscriptions.py); the session is sync-only
+                sync_to_async(get_subscribed_category_ids)(self.request),
+            )
+        except Category.DoesNotExist:
+            raise Http404('No category found matching the query')
+        self.object = category
+        return {
+            'view': self,
+            'object': category,
+            self.context_object_name: category,
+            'posts': page,
+            'page_obj': page,
+            'is_paginated': page.has_other_pages(),
+            'is_subscribed': category.pk in subscribed,
+        }
+
+
+class AsyncNewsSearchView(NewsSearchView):
+    async def get(self, request, *args, **kwargs):
+        # Building the queryset may run the backend's ranking query (raw SQL)
+        queryset = await sync_to_async(self.get_queryset)()
+        paginator = self.get_keyset_paginator(queryset, self.paginate_by)
+        page, categories = await asyncio.gather(
+            apage_or_404(paginator, request.GET.get(self.cursor_query_param)),
+            alist(Category.objects.all()),
+        )
+        self.object_list = page.object_list
+        context = {
+            'view': self,
+            'paginator': paginator,
+            'page_obj': page,
+            'is_paginated': page.has_other_pages(),
+            'object_list': page.object_list,
+            self.context_object_name: page.object_list,
+            'categories': categories,
+            **self.get_filters(),
+        }
+        return TemplateResponse(request, self.get_template_names(), context)
+
+
+class PostEventStreamView(View):
+    """
+    text/event-stream of new posts: /events/posts/?category=1&category=2&type=NE.
+    Without `category` every new post is sent once, with it a post is sent
+    when it is linked to one of the categories. Needs an ASGI server: the
+    WSGI handler would consume the endless stream before sending anything,
+    holding a worker thread per listener, so it gets 501 instead.
+    """
+
+    async def get(self, request, *args, **kwargs):
+        if not isinstance(request, ASGIRequest):
+            return HttpResponse('Event stream needs an ASGI server', status=501)
+        try:
+            categories = {int(value) for value in request.GET.getlist('category')}
+        except ValueError:
+            return HttpResponseBadRequest('category must be an integer')
+        post_types = set(request.GET.getlist('type'))
+        if not post_types <= {value for value, _label in Post.POST_TYPES}:
+            return HttpResponseBadRequest('Unknown post type')
+        if hub.count >= getattr(settings, 'NEWS_EVENTS_MAX_CONNECTIONS', 10000):
+            response = HttpResponse('Too many listeners', status=503)
+            response['Retry-After'] = '30'
+            return response
+
+        get_event_backend().start()
+        response = StreamingHttpResponse(
+            self.stream(Subscription(categories, post_types)), content_type='text/event-stream',
+        )
+        response['Cache-Control'] = 'no-cache'
+        # nginx: pass events through without buffering
+        response['X-Accel-Buffering'] = 'no'
+        return response
+
+    async def stream(self, subscription):
+        heartbeat = getattr(settings, 'NEWS_EVENTS_HEARTBEAT', 15)
+        hub.subscribe(subscription)
+        try:
+            yield f'retry: {heartbeat * 1000}\n\n'.encode()
+            while True:
+                frames, dropped = await subscription.next(heartbeat)
+                if dropped:
+                    yield encode_event('overflow', {'dropped': dropped})
+                if frames:
+                    yield b''.join(frames)
+                elif not dropped:
+                    yield b': keepalive\n\n'
+        finally:
+            # Client disconnected: the server cancels or closes the generator
+            hub.unsubscribe(subscription)
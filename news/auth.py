@@ -0,0 +1,124 @@
+"""
+Cached permission, author-profile and group lookups for the editor views.
+
+CachedModelBackend replaces ModelBackend: a user's permissions and Author
+id are loaded together once and kept in the page cache (news/cache.py)
+under a key that carries two tag versions:
+
+- `user-access:<id>`: bumped by the signals in news/signals.py when the
+  user's groups or own permissions change or their Author row is saved
+  or deleted;
+- `group-permissions`: bumped when the permissions of any group change, or
+  a group's members are cleared from the group side.
+
+A bump makes the old key unreachable, nothing is deleted. Superusers are
+left to ModelBackend, they get every permission anyway.
+
+Nothing is cached across requests without a shared cache backend: a bump
+in locmem would not reach the other workers, which would keep a revoked
+permission. settings.py then uses plain ModelBackend, and get_user_access()
+and get_group_id() query the database every time.
+"""
+from django.conf import settings
+from django.contrib.auth.backends import ModelBackend
+from django.contrib.auth.models import Group
+from django.db import transaction
+
+from .cache import bump_tags, get_cache, get_tag_versions, has_shared_cache
+from .models import Author
+
+GROUP_PERMISSIONS_TAG = 'group-permissions'
+
+
+def user_access_tag(user_id):
+    return f'user-access:{user_id}'
+
+
+def _access_key(user_id):
+    tags = [user_access_tag(user_id), GROUP_PERMISSIONS_TAG]
+    versions = get_tag_versions(tags)
+    return f'access:{user_id}:' + ':'.join(str(versions[tag]) for tag in tags)
+
+
+def get_user_access(user):
+    """
+    {'permissions': set of 'app_label.codename', 'author_id': id or None}
+    for an active, non-superuser user; cached on the user object for the
+    rest of the request.
+    """
+    access = getattr(user, '_news_access', None)
+    if access is None:
+        shared = has_shared_cache()
+        if shared:
+            cache = get_cache()
+            key = _access_key(user.pk)
+            access = cache.get(key)
+        if access is None:
+            backend = ModelBackend()
+            access = {
+                'permissions': backend.get_user_permissions(user) | backend.get_group_permissions(user),
+                'author_id': Author.objects.filter(user_id=user.pk).values_list('pk', flat=True).first(),
+            }
+            if shared:
+                cache.set(key, access, getattr(settings, 'NEWS_ACCESS_CACHE_TIMEOUT', 3600))
+        user._news_access = access
+    return access
+
+
+def get_author_id(user):
+    """Id of the user's Author profile, created on first use."""
+    author_id = get_user_access(user)['author_id']
+    if author_id is None:
+        # post_save of Author bumps the user's version, the next request reloads
+        author_id = Author.objects.get_or_create(user=user)[0].pk
+        user._news_access = dict(user._news_access, author_id=author_id)
+    return author_id
+
+
+def invalidate_user_access(user_ids):
+    user_ids = list(user_ids)
+    if user_ids:
+        bump_tags([user_access_tag(user_id) for user_id in user_ids])
+    return len(user_ids)
+
+
+def invalidate_group_permissions():
+    bump_tags([GROUP_PERMISSIONS_TAG])
+
+
+def _group_key(name):
+    return f'group-id:{name}'
+
+
+def get_group_id(name):
+    """Id of the group `name`, created if missing; the id is cached until the group is deleted."""
+    if not has_shared_cache():
+        return Group.objects.get_or_create(name=name)[0].pk
+    cache = get_cache()
+    key = _group_key(name)
+    group_id = cache.get(key)
+    if group_id is None:
+        group, created = Group.objects.get_or_create(name=name)
+        group_id = group.pk
+        if created:
+            # A rolled back group must not stay in the cache
+            transaction.on_commit(lambda: cache.set(key, group_id, None))
+        else:
+            cache.set(key, group_id, None)
+    return group_id
+
+
+def forget_group(name):
+    get_cache().delete(_group_key(name))
+
+
+class CachedModelBackend(ModelBackend):
+    """ModelBackend whose permission set comes from get_user_access()."""
+
+    def get_all_permissions(self, user_obj, obj=None):
+        if not user_obj.is_active or user_obj.is_anonymous or obj is not None or user_obj.is_superuser:
+            return super().get_all_permissions(user_obj, obj)
+        if not hasattr(user_obj, '_perm_cache'):
+            # ModelBackend's per-request attribute, other backends reuse it
+            user_obj._perm_cache = get_user_access(user_obj)['permissions']
+        return user_obj._perm_cache
@@ -0,0 +1,217 @@
+import hashlib
+import time
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.contrib import messages
+from django.core.cache import caches
+from django.core.cache.backends.dummy import DummyCache
+from django.core.cache.backends.locmem import LocMemCache
+from django.template.loader import render_to_string
+from django.utils import timezone, translation
+from django.utils.safestring import mark_safe
+
+from .middleware import record_template_time
+
+# Counters are kept in the cache itself, so they are shared by all processes
+# that use a shared backend (file, Redis)
+HITS_KEY = 'pagecache:stats:hits'
+MISSES_KEY = 'pagecache:stats:misses'
+
+
+def get_cache():
+    return caches[getattr(settings, 'NEWS_PAGE_CACHE_ALIAS', 'default')]
+
+
+def has_shared_cache():
+    """
+    Whether get_cache() is seen by every process. A tag bump in locmem only
+    reaches the current process, so data that must not go stale in other
+    workers (permissions, subscriptions) is cached only when this is true.
+    """
+    return not isinstance(get_cache(), (LocMemCache, DummyCache))
+
+
+def _version_key(tag):
+    return f'pagecache:tag:{tag}'
+
+
+def _bumped_at_key(tag):
+    return f'pagecache:tagtime:{tag}'
+
+
+def get_tag_versions(tags):
+    """
+    Current version of every tag. A missing version (never bumped, or
+    evicted) starts at the current time in nanoseconds, so a restarted
+    counter never repeats an old value.
+    """
+    cache = get_cache()
+    keys = {tag: _version_key(tag) for tag in tags}
+    found = cache.get_many(keys.values())
+    missing = [key for key in keys.values() if key not in found]
+    if missing:
+        for key in missing:
+            cache.add(key, time.time_ns(), None)
+        found.update(cache.get_many(missing))
+    return {tag: found.get(key, 0) for tag, key in keys.items()}
+
+
+async def aget_many(keys):
+    """
+    get_many() for async views. BaseCache.aget_many() awaits aget() once
+    per key, a thread hop each; this is one hop and one backend round trip.
+    """
+    return await sync_to_async(get_cache().get_many)(list(keys))
+
+
+async def aget_tag_versions(tags):
+    """get_tag_versions() for async views."""
+    cache = get_cache()
+    keys = {tag: _version_key(tag) for tag in tags}
+    found = await aget_many(keys.values())
+    missing = [key for key in keys.values() if key not in found]
+    if missing:
+        for key in missing:
+            await cache.aadd(key, time.time_ns(), None)
+        found.update(await aget_many(missing))
+    return {tag: found.get(key, 0) for tag, key in keys.items()}
+
+
+def bump_tags(tags):
+    """Invalidates every cached entry that depends on one of `tags`."""
+    cache = get_cache()
+    tags = set(tags)
+    for tag in tags:
+        key = _version_key(tag)
+        try:
+            cache.incr(key)
+        except ValueError:
+            cache.set(key, time.time_ns(), None)
+    # Wall-clock time of the bump, used for Last-Modified (news/conditional.py)
+    now = time.time()
+    cache.set_many({_bumped_at_key(tag): now for tag in tags}, None)
+
+
+def get_tag_bumped_at(tags):
+    """Unix time of the latest bump of any of `tags`, or None if none is known."""
+    found = get_cache().get_many([_bumped_at_key(tag) for tag in tags])
+    return max(found.values()) if found else None
+
+
+async def aget_tag_bumped_at(tags):
+    found = await aget_many([_bumped_at_key(tag) for tag in tags])
+    return max(found.values()) if found else None
+
+
+def _incr(key):
+    cache = get_cache()
+    try:
+        cache.incr(key)
+    except ValueError:
+        cache.add(key, 0, None)
+        cache.incr(key)
+
+
+async def arecord_lookup(hit):
+    """Counts a fragment cache hit or miss of an async view (see cache_stats())."""
+    cache = get_cache()
+    key = HITS_KEY if hit else MISSES_KEY
+    try:
+        await cache.aincr(key)
+    except ValueError:
+        await cache.aadd(key, 0, None)
+        await cache.aincr(key)
+
+
+def cache_stats():
+    values = get_cache().get_many([HITS_KEY, MISSES_KEY])
+    return {'hits': values.get(HITS_KEY, 0), 'misses': values.get(MISSES_KEY, 0)}
+
+
+def fragment_key(request, name, tags):
+    """
+    Cache key for a rendered fragment: view name, active language and time
+    zone, the full path (page or cursor included) and the versions of the
+    fragment's tags. Bumping a tag changes the key, so stale entries are
+    simply never read again.
+    """
+    return make_fragment_key(request, name, get_tag_versions(tags))
+
+
+def make_fragment_key(request, name, versions):
+    parts = [
+        name,
+        translation.get_language() or '',
+        timezone.get_current_timezone_name(),
+        request.get_full_path(),
+    ] + [f'{tag}={versions[tag]}' for tag in sorted(versions)]
+    digest = hashlib.sha1('|'.join(parts).encode()).hexdigest()
+    return f'pagecache:fragment:{name}:{digest}'
+
+
+class FragmentCacheMixin:
+    """
+    Caches the rendered content of a page for anonymous readers.
+
+    The page template only wraps `{{ fragment }}`, which is rendered from
+    `fragment_template_name`. On a hit, the view skips get_object() /
+    get_queryset() and the fragment template entirely; only the thin
+    per-request wrapper (header forms with CSRF tokens, messages) is rendered.
+    Entries are invalidated through the tags returned by get_cache_tags().
+    """
+
+    fragment_template_name = None
+    page_title = ''
+
+    def get_cache_tags(self):
+        raise NotImplementedError
+
+    def get_page_title(self, context):
+        return self.page_title
+
+    def is_cacheable(self):
+        request = self.request
+        if request.method not in ('GET', 'HEAD'):
+            return False
+        if request.user.is_authenticated:
+            return False
+        # Pending flash messages make the page personal
+        return not len(messages.get_messages(request))
+
+    def get(self, request, *args, **kwargs):
+        if not self.is_cacheable():
+            return super().get(request, *args, **kwargs)
+
+        cache = get_cache()
+        # Fragments contain censored text, so they also depend on the word list
+        key = fragment_key(request, type(self).__name__, self.get_cache_tags() + ['censor-words'])
+        cached = cache.get(key)
+        if cached is not None:
+            _incr(HITS_KEY)
+            # No object or queryset was loaded, so go around get_template_names()
+            return self.response_class(
+                request=request,
+                template=[self.template_name],
+                context={
+                    'view': self,
+                    'page_title': cached['title'],
+                    'fragment': mark_safe(cached['fragment']),
+                },
+                using=self.template_engine,
+            )
+
+        _incr(MISSES_KEY)
+        response = super().get(request, *args, **kwargs)
+        context = response.context_data
+        timeout = getattr(settings, 'NEWS_PAGE_CACHE_TIMEOUT', 300)
+        cache.set(key, {'title': str(context['page_title']), 'fragment': str(context['fragment'])}, timeout)
+        return response
+
+    def render_to_response(self, context, **response_kwargs):
+        if 'fragment' not in context:
+            context['page_title'] = self.get_page_title(context)
+            started = time.perf_counter()
+            context['fragment'] = mark_safe(render_to_string(self.fragment_template_name, context, self.request))
+            record_template_time(time.perf_counter() - started)
+        return super().render_to_response(context, **response_kwargs)
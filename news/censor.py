@@ -0,0 +1,150 @@
+import os
+import re
+import threading
+import time
+from functools import lru_cache
+
+from django.conf import settings
+from django.db import DatabaseError
+
+# Built-in set of undesirable words (lowercase), used when no word file is configured
+BAD_WORDS = {
+    'редиска',
+    'дурак',
+    'идиот',
+    'плохой',
+    'плохое',
+    'плохая',
+}
+
+LETTER_RE = re.compile(r"[A-Za-zА-Яа-яЁё]")
+
+
+def _mask_word(match: re.Match) -> str:
+    # Replace all letters (cyrillic/latin) with '*', keep other chars as is
+    return LETTER_RE.sub('*', match.group(0))
+
+
+def build_trie_pattern(words) -> str:
+    """
+    One regex alternation built from a trie of the words, e.g.
+    {'плохой', 'плохая'} -> 'плох(?:ая|ой)'. Shared prefixes are matched once,
+    so the pattern stays fast with thousands of words.
+    """
+    trie = {}
+    for word in words:
+        node = trie
+        for ch in word:
+            node = node.setdefault(ch, {})
+        node[''] = {}
+
+    def walk(node):
+        if list(node) == ['']:
+            return None
+        alternatives = []
+        optional = False
+        for ch in sorted(node):
+            if ch == '':
+                optional = True
+                continue
+            rest = walk(node[ch])
+            alternatives.append(re.escape(ch) + (rest or ''))
+        if len(alternatives) == 1 and not optional:
+            return alternatives[0]
+        result = '(?:' + '|'.join(alternatives) + ')'
+        return result + '?' if optional else result
+
+    return walk(trie) or ''
+
+
+def load_file_words(path):
+    with open(path, encoding='utf-8') as f:
+        return {line.strip().lower() for line in f if line.strip() and not line.startswith('#')}
+
+
+def load_db_words():
+    from .models import BannedWord
+    try:
+        return set(BannedWord.objects.values_list('word', flat=True))
+    except DatabaseError:
+        # Table may not exist yet (migrations pending)
+        return set()
+
+
+class CensorEngine:
+    """
+    Compiled censor for the `censor` template filter.
+
+    The pattern is compiled once per word-list version and results are
+    memoized per (text, version) in an LRU cache. Without an explicit `words`
+    list the engine reloads its words when NEWS_CENSOR_WORDS_FILE changes on
+    disk or BannedWord rows change, checking at most every
+    NEWS_CENSOR_RELOAD_INTERVAL seconds.
+    """
+
+    def __init__(self, words=None, memo_size=None):
+        self.static_words = set(words) if words is not None else None
+        self.memo_size = memo_size if memo_size is not None else getattr(settings, 'NEWS_CENSOR_MEMO_SIZE', 10000)
+        self.reload_interval = getattr(settings, 'NEWS_CENSOR_RELOAD_INTERVAL', 5)
+        self.version = None
+        self._checked_at = 0.0
+        self._lock = threading.Lock()
+        self._pattern = None
+        self._censor = None
+
+    def current_version(self):
+        if self.static_words is not None:
+            return 'static'
+        from .cache import get_tag_versions
+        path = getattr(settings, 'NEWS_CENSOR_WORDS_FILE', None)
+        mtime = os.path.getmtime(path) if path and os.path.exists(path) else None
+        return (mtime, get_tag_versions(['censor-words'])['censor-words'])
+
+    def load_words(self):
+        if self.static_words is not None:
+            return self.static_words
+        path = getattr(settings, 'NEWS_CENSOR_WORDS_FILE', None)
+        words = load_file_words(path) if path and os.path.exists(path) else set(BAD_WORDS)
+        return words | load_db_words()
+
+    def compile(self, words):
+        words = {w.lower() for w in words if w}
+        if words:
+            self._pattern = re.compile(r"\b(" + build_trie_pattern(words) + r")\b", re.IGNORECASE | re.UNICODE)
+        else:
+            self._pattern = None
+        self._censor = lru_cache(maxsize=self.memo_size)(self._censor_uncached)
+
+    def _censor_uncached(self, value):
+        # re.sub always returns a plain str, so a memoized result never
+        # carries the "safe" mark of whichever input was seen first
+        return self._pattern.sub(_mask_word, value)
+
+    def _refresh(self):
+        now = time.monotonic()
+        if self._censor is not None and now - self._checked_at < self.reload_interval:
+            return
+        with self._lock:
+            self._checked_at = now
+            version = self.current_version()
+            if version != self.version or self._censor is None:
+                self.compile(self.load_words())
+                self.version = version
+
+    def censor(self, value):
+        if not isinstance(value, str) or not value:
+            return value
+        self._refresh()
+        if self._pattern is None:
+            return value
+        return self._censor(value)
+
+
+_engine = None
+
+
+def get_censor_engine():
+    global _engine
+    if _engine is None:
+        _engine = CensorEngine()
+    return _engine
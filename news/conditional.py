@@ -0,0 +1,146 @@
+import asyncio
+import hashlib
+from datetime import datetime, timezone as dt_timezone
+
+from django.conf import settings
+from django.contrib import messages
+from django.db.models import Max
+from django.utils import timezone, translation
+from django.utils.cache import get_conditional_response
+from django.utils.http import http_date, quote_etag
+from django.views.decorators.http import condition
+
+from .cache import aget_tag_bumped_at, get_cache, get_tag_bumped_at, get_tag_versions
+
+
+def compute_etag(request, name, tags, extra=()):
+    """
+    ETag from the versions of the cache tags a response depends on, plus
+    everything that makes the same URL render differently: user, language,
+    time zone, CSRF cookie (embedded in forms) and `extra` (e.g. Accept).
+    No post rows are loaded.
+    """
+    return make_etag(request, name, get_tag_versions(tags), getattr(request, 'user', None), extra)
+
+
+def make_etag(request, name, versions, user, extra=()):
+    parts = [
+        name,
+        request.get_full_path(),
+        translation.get_language() or '',
+        timezone.get_current_timezone_name(),
+        str(user.pk if user is not None and user.is_authenticated else 0),
+        request.META.get('CSRF_COOKIE', ''),
+        *extra,
+    ] + [f'{tag}={versions[tag]}' for tag in sorted(versions)]
+    return hashlib.sha1('|'.join(parts).encode()).hexdigest()
+
+
+def compute_last_modified(queryset, tags):
+    """
+    Latest of Max(updated_at) over `queryset` and the last bump of `tags`.
+    The tag time covers changes that leave no updated_at behind: deleted
+    posts, category renames, changed category links.
+
+    The result is cached per (query, tag versions), so repeated polls of an
+    unchanged resource cost no database query at all.
+    """
+    key = last_modified_key(queryset, get_tag_versions(tags))
+    cache = get_cache()
+    cached = cache.get(key)
+    if cached is not None:
+        return cached
+
+    last_modified = _latest(queryset.order_by().aggregate(last=Max('updated_at'))['last'], get_tag_bumped_at(tags))
+    if last_modified is not None:
+        cache.set(key, last_modified, getattr(settings, 'NEWS_PAGE_CACHE_TIMEOUT', 300))
+    return last_modified
+
+
+async def aload_last_modified(queryset, tags, key):
+    """
+    The uncached half of compute_last_modified() for async views, which
+    look `key` (from last_modified_key()) up together with their other
+    cache entries: queries the value and stores it under `key`.
+    """
+    aggregate, bumped_at = await asyncio.gather(
+        queryset.order_by().aaggregate(last=Max('updated_at')),
+        aget_tag_bumped_at(tags),
+    )
+    last_modified = _latest(aggregate['last'], bumped_at)
+    if last_modified is not None:
+        await get_cache().aset(key, last_modified, getattr(settings, 'NEWS_PAGE_CACHE_TIMEOUT', 300))
+    return last_modified
+
+
+def last_modified_key(queryset, versions):
+    raw = str(queryset.query) + '|' + '|'.join(f'{tag}={versions[tag]}' for tag in sorted(versions))
+    return 'validators:last-modified:' + hashlib.sha1(raw.encode()).hexdigest()
+
+
+def _latest(updated_at, bumped_at):
+    candidates = [updated_at]
+    if bumped_at is not None:
+        candidates.append(datetime.fromtimestamp(bumped_at, tz=dt_timezone.utc))
+    candidates = [value for value in candidates if value is not None]
+    if not candidates:
+        return None
+    # HTTP dates have one-second resolution
+    return max(candidates).replace(microsecond=0)
+
+
+async def aconditional(request, etag, last_modified, handler):
+    """
+    What condition() does around a view, for validators an async view has
+    already computed: answers 304 / 412 without awaiting `handler`,
+    otherwise adds ETag and Last-Modified to its response.
+    """
+    etag = quote_etag(etag) if etag is not None else None
+    timestamp = int(last_modified.timestamp()) if last_modified is not None else None
+    response = get_conditional_response(request, etag=etag, last_modified=timestamp)
+    if response is None:
+        response = await handler()
+    if request.method in ('GET', 'HEAD'):
+        if timestamp and not response.has_header('Last-Modified'):
+            response.headers['Last-Modified'] = http_date(timestamp)
+        if etag:
+            response.headers.setdefault('ETag', etag)
+    return response
+
+
+class ConditionalViewMixin:
+    """
+    Answers If-None-Match / If-Modified-Since with 304 before the view loads
+    objects or renders anything. Views list their cache tags in
+    get_validator_tags() and the posts behind the response in
+    get_validator_queryset(). Requests with pending flash messages are never
+    answered with 304.
+    """
+
+    def get_validator_tags(self):
+        raise NotImplementedError
+
+    def get_validator_queryset(self):
+        raise NotImplementedError
+
+    def get_validator_extra(self):
+        return ()
+
+    def has_validators(self):
+        return not len(messages.get_messages(self.request))
+
+    def get_etag(self, request, *args, **kwargs):
+        if not self.has_validators():
+            return None
+        return compute_etag(request, type(self).__name__, self.get_validator_tags(), self.get_validator_extra())
+
+    def get_last_modified(self, request, *args, **kwargs):
+        if not self.has_validators():
+            return None
+        return compute_last_modified(self.get_validator_queryset(), self.get_validator_tags())
+
+    def conditional(self, handler):
+        return condition(etag_func=self.get_etag, last_modified_func=self.get_last_modified)(handler)
+
+    def get(self, request, *args, **kwargs):
+        return self.conditional(super().get)(request, *args, **kwargs)
@@ -1,4 +1,8 @@
-import pytz
+from django.utils.functional import SimpleLazyObject
 
-def all_timezones(request):
-    return {'all_timezones': pytz.common_timezones}
+from .subscriptions import get_subscribed_category_ids
+
+
+def subscriptions(request):
+    # Loaded on first use only, pages that do not show subscriptions pay nothing
+    return {'subscribed_category_ids': SimpleLazyObject(lambda: get_subscribed_category_ids(request))}
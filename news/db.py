@@ -0,0 +1,37 @@
+from django.conf import settings
+from django.db.backends.signals import connection_created
+from django.dispatch import receiver
+
+from .middleware import track_query
+
+
+@receiver(connection_created)
+def configure_sqlite(sender, connection, **kwargs):
+    """
+    Applies NEWS_SQLITE_PRAGMAS to every new SQLite connection (WAL journal,
+    synchronous=NORMAL, mmap, busy timeout). Other databases are left as is.
+    """
+    if connection.vendor != 'sqlite':
+        return
+    pragmas = getattr(settings, 'NEWS_SQLITE_PRAGMAS', {})
+    if not pragmas:
+        return
+    # Raw DB-API cursor: these statements are not request queries and must
+    # not show up in the per-request metrics (news/middleware.py)
+    cursor = connection.connection.cursor()
+    try:
+        for name, value in pragmas.items():
+            if name == 'journal_mode' and connection.is_in_memory_db():
+                # In-memory databases (tests) have no journal file
+                continue
+            cursor.execute(f'PRAGMA {name} = {value}')
+    finally:
+        cursor.close()
+
+
+@receiver(connection_created)
+def instrument_connection(sender, connection, **kwargs):
+    """Installs the per-request query tracking (news/middleware.py) on every connection."""
+    # connection_created fires again when a closed connection reconnects
+    if track_query not in connection.execute_wrappers:
+        connection.execute_wrappers.append(track_query)
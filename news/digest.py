@@ -0,0 +1,113 @@
+from itertools import groupby
+
+from django.conf import settings
+from django.contrib.sites.models import Site
+from django.core.mail import EmailMessage, get_connection
+from django.db.models.functions import Mod
+from django.urls import reverse
+
+from .models import CategorySubscription, Post
+from .routers import use_replica
+
+DIGEST_SUBJECT = 'Еженедельный дайджест новых статей'
+DIGEST_HEADING = 'Новые статьи за неделю:'
+
+
+def load_articles(since=None, post_ids=None, post_id_range=None):
+    """Article table for the digest, loaded once: id -> (created_at, title, path)."""
+    qs = Post.objects.filter(post_type=Post.ARTICLE)
+    if since is not None:
+        qs = qs.filter(created_at__gte=since)
+    if post_ids is not None:
+        qs = qs.filter(id__in=post_ids)
+    if post_id_range is not None:
+        qs = qs.filter(id__range=post_id_range)
+    return {
+        pk: (created_at, title, reverse('news:article_detail', args=[pk]))
+        for pk, created_at, title in qs.values_list('id', 'created_at', 'title')
+    }
+
+
+def digest_pairs(since=None, post_ids=None, shard=None, post_id_range=None):
+    """
+    (user_id, email, post_id) rows for every subscriber and every new article
+    in one of their categories, as a single join over CategorySubscription,
+    PostCategory and Post. Rows are ordered by user so they can be grouped
+    while streaming. `shard` is a (index, total) pair with a 0-based index,
+    `post_id_range` an inclusive (first, last) pair of post ids.
+    """
+    post_field = 'category__postcategory__post'
+    # One filter() call, so all conditions apply to the same joined post
+    conditions = {f'{post_field}__post_type': Post.ARTICLE}
+    if since is not None:
+        conditions[f'{post_field}__created_at__gte'] = since
+    if post_ids is not None:
+        conditions[f'{post_field}__in'] = post_ids
+    if post_id_range is not None:
+        conditions[f'{post_field}__id__range'] = post_id_range
+    qs = CategorySubscription.objects.filter(**conditions)
+    qs = qs.exclude(user__email='').exclude(user__email__isnull=True)
+    if shard is not None:
+        index, total = shard
+        qs = qs.annotate(shard=Mod('user_id', total)).filter(shard=index)
+    return (
+        qs.values_list('user_id', 'user__email', f'{post_field}_id')
+        .distinct()
+        .order_by('user_id', f'{post_field}_id')
+    )
+
+
+def render_digest(post_ids, articles, domain, heading=DIGEST_HEADING):
+    lines = [
+        heading,
+        '',
+    ]
+    for pk in sorted(post_ids, key=lambda pk: articles[pk][0], reverse=True):
+        _created_at, title, path = articles[pk]
+        lines.append(f"- {title}: https://{domain}{path}")
+    return "\n".join(lines)
+
+
+def send_digests(since=None, post_ids=None, shard=None, dry_run=False, batch_size=100, subject=DIGEST_SUBJECT,
+                 post_id_range=None, heading=DIGEST_HEADING, replica=True):
+    """
+    Builds and sends one digest per subscriber. Messages go out in batches
+    of `batch_size`, each batch over one SMTP connection. Returns a stats dict.
+
+    With `replica` the articles and (user, post) pairs may be read from a
+    replica (news/routers.py); pass False for posts written a moment ago.
+    """
+    # The pairs iterator picks its database when it starts, so the whole
+    # loop stays inside the block
+    with use_replica(replica):
+        return _send_digests(since, post_ids, shard, dry_run, batch_size, subject, post_id_range, heading)
+
+
+def _send_digests(since, post_ids, shard, dry_run, batch_size, subject, post_id_range, heading):
+    articles = load_articles(since, post_ids, post_id_range)
+    stats = {'articles': len(articles), 'recipients': 0, 'sent': 0}
+    if not articles:
+        return stats
+
+    domain = Site.objects.get_current().domain
+    from_email = getattr(settings, 'DEFAULT_FROM_EMAIL', None)
+    pairs = digest_pairs(since, post_ids, shard, post_id_range).iterator(chunk_size=2000)
+
+    batch = []
+
+    def flush():
+        if batch and not dry_run:
+            with get_connection(fail_silently=True) as connection:
+                stats['sent'] += connection.send_messages(batch) or 0
+        batch.clear()
+
+    for (_user_id, email), rows in groupby(pairs, key=lambda row: (row[0], row[1])):
+        user_post_ids = [post_id for _u, _e, post_id in rows if post_id in articles]
+        if not user_post_ids:
+            continue
+        stats['recipients'] += 1
+        batch.append(EmailMessage(subject, render_digest(user_post_ids, articles, domain, heading), from_email, [email.strip()]))
+        if len(batch) >= batch_size:
+            flush()
+    flush()
+    return stats
@@ -0,0 +1,285 @@
+"""
+Pub/sub of newly published posts for the server-sent event stream
+(PostEventStreamView in news/async_views.py).
+
+Signals call publish_post() when a post is created or linked to
+categories; after the transaction commits the event goes to the backend
+named by NEWS_EVENTS_BACKEND, which delivers it to the EventHub of every
+process serving listeners:
+
+- InProcessBackend: straight to the hub of the same process (runserver,
+  a single uvicorn worker). Events published by other processes, e.g.
+  Celery workers, are not seen.
+- RedisBackend: Redis pub/sub, for several workers or hosts.
+
+Every listener has a Subscription with a bounded queue. The hub encodes an
+event once and queues the same bytes for every matching listener. A
+listener that does not read fast enough loses its oldest events and is
+told how many with an `overflow` event, so a slow client cannot make the
+server buffer without limit. An idle listener is a Subscription and one
+waiting coroutine, no thread and no polling.
+"""
+import asyncio
+import json
+import logging
+import threading
+import time
+from collections import defaultdict, deque
+
+from django.conf import settings
+from django.db import transaction
+from django.utils.module_loading import import_string
+
+from .censor import get_censor_engine
+
+logger = logging.getLogger(__name__)
+
+PUBLISHED = 'published'
+CATEGORIZED = 'categorized'
+
+
+def encode_event(event, data, event_id=None):
+    """One server-sent event frame."""
+    lines = []
+    if event_id is not None:
+        lines.append(f'id: {event_id}')
+    lines.append(f'event: {event}')
+    lines.append('data: ' + json.dumps(data, ensure_ascii=False, separators=(',', ':')))
+    return ('\n'.join(lines) + '\n\n').encode()
+
+
+class Subscription:
+    """
+    One listener: its filters and a queue bounded by NEWS_EVENTS_QUEUE_SIZE
+    events and NEWS_EVENTS_QUEUE_BYTES bytes. offer() may be called from any
+    thread; next() runs on the listener's event loop.
+    """
+
+    __slots__ = (
+        'categories', 'post_types', 'max_events', 'max_bytes', 'loop',
+        'queue', 'queued_bytes', 'dropped', '_pending', '_ready', '_lock',
+    )
+
+    def __init__(self, categories=(), post_types=(), max_events=None, max_bytes=None, loop=None):
+        self.categories = frozenset(categories)
+        self.post_types = frozenset(post_types)
+        self.max_events = max_events or getattr(settings, 'NEWS_EVENTS_QUEUE_SIZE', 100)
+        self.max_bytes = max_bytes or getattr(settings, 'NEWS_EVENTS_QUEUE_BYTES', 64 * 1024)
+        self.loop = loop or asyncio.get_running_loop()
+        # Created on the first event, idle listeners never allocate one
+        self.queue = None
+        self.queued_bytes = 0
+        self.dropped = 0
+        self._pending = False
+        self._ready = asyncio.Event()
+        self._lock = threading.Lock()
+
+    def accepts(self, post_type):
+        return not self.post_types or post_type in self.post_types
+
+    def offer(self, frame):
+        with self._lock:
+            if self.queue is None:
+                self.queue = deque()
+            self.queue.append(frame)
+            self.queued_bytes += len(frame)
+            # Drop the oldest events of a listener that does not keep up
+            while len(self.queue) > self.max_events or (self.queued_bytes > self.max_bytes and len(self.queue) > 1):
+                self.queued_bytes -= len(self.queue.popleft())
+                self.dropped += 1
+            wake = not self._pending
+            self._pending = True
+        if wake:
+            try:
+                self.loop.call_soon_threadsafe(self._ready.set)
+            except RuntimeError:
+                # The listener's loop is closed, it is about to unsubscribe
+                pass
+
+    async def next(self, timeout):
+        """
+        Waits up to `timeout` seconds and returns (frames, dropped): every
+        queued frame and the number of frames dropped since the last call.
+        Returns ([], 0) on timeout.
+        """
+        deadline = time.monotonic() + timeout
+        while True:
+            with self._lock:
+                if self.queue:
+                    frames = list(self.queue)
+                    self.queue.clear()
+                    self.queued_bytes = 0
+                    dropped, self.dropped = self.dropped, 0
+                    return frames, dropped
+                self._pending = False
+                self._ready.clear()
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                return [], 0
+            try:
+                await asyncio.wait_for(self._ready.wait(), remaining)
+            except asyncio.TimeoutError:
+                return [], 0
+
+
+class EventHub:
+    """
+    Fans events out to the subscriptions of this process. Subscriptions
+    are indexed by category, so an event only visits listeners that can
+    match it.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._by_category = defaultdict(set)
+        self._unfiltered = set()
+        self.count = 0
+
+    def subscribe(self, subscription):
+        with self._lock:
+            if subscription.categories:
+                for category_id in subscription.categories:
+                    self._by_category[category_id].add(subscription)
+            else:
+                self._unfiltered.add(subscription)
+            self.count += 1
+
+    def unsubscribe(self, subscription):
+        with self._lock:
+            if subscription.categories:
+                for category_id in subscription.categories:
+                    listeners = self._by_category.get(category_id)
+                    if listeners is not None:
+                        listeners.discard(subscription)
+                        if not listeners:
+                            del self._by_category[category_id]
+            else:
+                self._unfiltered.discard(subscription)
+            self.count -= 1
+
+    def dispatch(self, message):
+        """
+        Queues `message` for the matching listeners. A new post goes to
+        listeners without a category filter, a post linked to categories
+        to the listeners of those categories; both honour the post type
+        filter. Returns the number of listeners reached.
+        """
+        with self._lock:
+            if message['kind'] == PUBLISHED:
+                targets = list(self._unfiltered)
+            else:
+                targets = set()
+                for category_id in message['categories']:
+                    targets.update(self._by_category.get(category_id, ()))
+        if not targets:
+            return 0
+        post = message['post']
+        frame = encode_event('post', dict(post, categories=message['categories']), post['id'])
+        delivered = 0
+        for subscription in targets:
+            if subscription.accepts(post['type']):
+                subscription.offer(frame)
+                delivered += 1
+        return delivered
+
+
+class InProcessBackend:
+    """Delivers events to the listeners of the publishing process."""
+
+    local_only = True
+
+    def __init__(self, hub):
+        self.hub = hub
+
+    def start(self):
+        pass
+
+    def publish(self, message):
+        self.hub.dispatch(message)
+
+
+class RedisBackend:
+    """
+    Redis pub/sub on NEWS_EVENTS_REDIS_URL: every process publishes to one
+    channel, and a process that has listeners runs a daemon thread that
+    feeds the channel into its hub.
+    """
+
+    local_only = False
+
+    def __init__(self, hub):
+        import redis
+
+        self.hub = hub
+        self.channel = getattr(settings, 'NEWS_EVENTS_CHANNEL', 'newsportal:post-events')
+        self.client = redis.Redis.from_url(getattr(settings, 'NEWS_EVENTS_REDIS_URL', 'redis://localhost:6379/3'))
+        self._thread = None
+        self._lock = threading.Lock()
+
+    def start(self):
+        with self._lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._listen, name='news-events', daemon=True)
+                self._thread.start()
+
+    def publish(self, message):
+        self.client.publish(self.channel, json.dumps(message))
+
+    def _listen(self):
+        while True:
+            try:
+                pubsub = self.client.pubsub(ignore_subscribe_messages=True)
+                pubsub.subscribe(self.channel)
+                for item in pubsub.listen():
+                    self.hub.dispatch(json.loads(item['data']))
+            except Exception:
+                logger.exception('Post event listener lost Redis, reconnecting')
+                time.sleep(1)
+
+
+hub = EventHub()
+_backend = None
+
+
+def get_event_backend():
+    global _backend
+    if _backend is None:
+        path = getattr(settings, 'NEWS_EVENTS_BACKEND', 'news.events.InProcessBackend')
+        _backend = import_string(path)(hub)
+    return _backend
+
+
+def post_message(post, categories, kind):
+    return {
+        'kind': kind,
+        'categories': sorted(categories),
+        'post': {
+            'id': post.pk,
+            'type': post.post_type,
+            'title': get_censor_engine().censor(str(post.title)),
+            'url': post.get_absolute_url(),
+            'created_at': post.created_at.isoformat() if post.created_at else None,
+        },
+    }
+
+
+def has_listeners():
+    """False when no process can receive events: local backend, no listeners here."""
+    return not get_event_backend().local_only or hub.count > 0
+
+
+def publish_post(post, categories=(), kind=PUBLISHED):
+    """Publishes a new post (or its new categories) once the current transaction commits."""
+    if not has_listeners():
+        return
+    backend = get_event_backend()
+    message = post_message(post, categories, kind)
+
+    def send():
+        try:
+            backend.publish(message)
+        except Exception:
+            # Listeners are a convenience, never fail the save because of them
+            logger.exception('Could not publish post event %s', message['post']['id'])
+
+    transaction.on_commit(send)
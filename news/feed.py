@@ -0,0 +1,86 @@
+"""
+Maintenance of CategoryFeedEntry, the denormalised per-category post feed.
+
+The signals in news/signals.py call these helpers when posts or their
+category links change; code that bypasses signals (bulk_create of
+PostCategory rows, bulk_update of posts) calls them directly or relies on
+`manage.py rebuild_category_feed`.
+"""
+from .models import CategoryFeedEntry, Post, PostCategory
+from .transfer import translation_columns
+
+FEED_BATCH_SIZE = 1000
+
+
+def feed_columns():
+    """Post columns copied into the feed, translation columns included."""
+    columns = ['created_at', 'post_type']
+    for field in ('title', 'preview'):
+        columns += [field] + translation_columns(field)
+    return columns
+
+
+def add_entries(pairs, posts=None):
+    """
+    Adds feed rows for (post_id, category_id) pairs; rows that already exist
+    are kept. `posts` are Post instances already in memory (e.g. just
+    bulk-created), which saves reading them back.
+    """
+    pairs = set(pairs)
+    if not pairs:
+        return 0
+    columns = feed_columns()
+    if posts is not None:
+        # Stored values straight from __dict__, without language fallbacks
+        posts = {post.pk: {name: post.__dict__[name] for name in columns} for post in posts}
+    else:
+        # rewrite(False): the raw base and translation columns, without fallbacks
+        posts = {
+            row.pop('id'): row
+            for row in Post.objects.rewrite(False).filter(pk__in={post_id for post_id, _c in pairs}).values('id', *columns)
+        }
+    entries = [
+        CategoryFeedEntry(category_id=category_id, post_id=post_id, **posts[post_id])
+        for post_id, category_id in pairs
+        if post_id in posts
+    ]
+    CategoryFeedEntry.objects.bulk_create(entries, batch_size=FEED_BATCH_SIZE, ignore_conflicts=True)
+    return len(entries)
+
+
+def remove_entries(post_ids=None, category_ids=None):
+    """Removes the feed rows of the given posts and/or categories (both given: their pairs)."""
+    rows = CategoryFeedEntry.objects.all()
+    if post_ids is not None:
+        rows = rows.filter(post_id__in=post_ids)
+    if category_ids is not None:
+        rows = rows.filter(category_id__in=category_ids)
+    return rows.delete()[0]
+
+
+def refresh_entries(post, update_fields=None):
+    """Copies the feed columns of a saved post into its feed rows."""
+    columns = feed_columns()
+    if update_fields is not None:
+        # Post.save() has already added the preview fields when the text changed
+        columns = [name for name in columns if name in update_fields]
+    # Stored values straight from __dict__; deferred columns are not loaded
+    values = {name: post.__dict__[name] for name in columns if name in post.__dict__}
+    if not values:
+        return 0
+    return CategoryFeedEntry.objects.rewrite(False).filter(post_id=post.pk).update(**values)
+
+
+def rebuild_feed(batch_size=FEED_BATCH_SIZE):
+    """Recreates the whole feed from PostCategory; returns the number of rows."""
+    CategoryFeedEntry.objects.all().delete()
+    total = 0
+    batch = []
+    for pair in PostCategory.objects.order_by('pk').values_list('post_id', 'category_id').iterator(chunk_size=batch_size):
+        batch.append(pair)
+        if len(batch) >= batch_size:
+            total += add_entries(batch)
+            batch = []
+    if batch:
+        total += add_entries(batch)
+    return total
@@ -0,0 +1,27 @@
+from django.core.management.base import BaseCommand
+
+from news.models import Post
+
+
+class Command(BaseCommand):
+    help = 'Fill Post.preview (all languages) from the post text.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000, help='Posts updated per query batch')
+
+    def handle(self, *args, **options):
+        batch_size = options['batch_size']
+        fields = None
+        batch = []
+        total = 0
+        for post in Post.objects.only('id', 'text').order_by('pk').iterator(chunk_size=batch_size):
+            fields = post.fill_previews()
+            batch.append(post)
+            if len(batch) >= batch_size:
+                Post.objects.bulk_update(batch, fields)
+                total += len(batch)
+                batch = []
+        if batch:
+            Post.objects.bulk_update(batch, fields)
+            total += len(batch)
+        self.stdout.write(self.style.SUCCESS(f'Updated previews of {total} posts.'))
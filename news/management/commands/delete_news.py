@@ -1,5 +1,13 @@
+import time
+from collections import defaultdict
+
 from django.core.management.base import BaseCommand, CommandError
-from news.models import Post, Category
+from django.db import models, router, transaction
+from django.db.models import F, Sum
+
+from news.cache import bump_tags
+from news.models import Author, Category, Comment, Post, PostCategory, POST_RATING_WEIGHT
+from news.search import get_search_backend
 
 
 class Command(BaseCommand):
@@ -7,23 +15,120 @@ class Command(BaseCommand):
 
     def add_arguments(self, parser):
         parser.add_argument('category_name', type=str, help='Название категории')
+        parser.add_argument('--batch-size', type=int, default=500, help='Постов в одной транзакции')
+        parser.add_argument('--yes', action='store_true', help='Не спрашивать подтверждение')
+        parser.add_argument('--dry-run', action='store_true', help='Только посчитать, что будет удалено')
+        parser.add_argument(
+            '--raw', action='store_true',
+            help='Удалять зависимые строки прямыми DELETE без загрузки объектов и сигналов; '
+                 'рейтинги, поисковый индекс и кэш обновляются пачкой',
+        )
 
     def handle(self, *args, **options):
         category_name = options['category_name']
-        
+        # Invalid options fail before anything is counted or confirmed
+        batch_size = options['batch_size']
+        if batch_size < 1:
+            raise CommandError('--batch-size должен быть положительным')
+        if options['raw']:
+            self.check_raw_delete()
+
         try:
             category = Category.objects.get(name=category_name)
         except Category.DoesNotExist:
             self.stdout.write(self.style.ERROR(f'Категория "{category_name}" не найдена'))
             return
 
-        self.stdout.write(f'Вы действительно хотите удалить все статьи в категории {category.name}? yes/no')
-        answer = input()
+        posts = Post.objects.filter(categories=category)
+        count = posts.count()
+        if options['dry_run']:
+            comments = Comment.objects.filter(post__categories=category).count()
+            links = PostCategory.objects.filter(post__categories=category).count()
+            self.stdout.write(
+                f'Будет удалено постов: {count}, комментариев: {comments}, '
+                f'связей с категориями: {links} (категория {category.name})'
+            )
+            return
+        if not count:
+            self.stdout.write(f'В категории {category.name} нет постов')
+            return
+
+        if not options['yes']:
+            self.stdout.write(f'Вы действительно хотите удалить все статьи в категории {category.name} ({count})? yes/no')
+            answer = input()
+            if answer.lower() != 'yes':
+                self.stdout.write(self.style.ERROR('Отменено'))
+                return
+
+        deleted = 0
+        started = time.monotonic()
+        while True:
+            # Each batch is taken afresh: deleted rows are gone from the query
+            ids = list(posts.order_by('pk').values_list('pk', flat=True)[:batch_size])
+            if not ids:
+                break
+            if options['raw']:
+                self.raw_delete(ids)
+            else:
+                with transaction.atomic():
+                    Post.objects.filter(pk__in=ids).delete()
+            deleted += len(ids)
+            self.progress(deleted, count, started)
+        self.stderr.write('')
+        self.stdout.write(self.style.SUCCESS(f'Успешно удалено {deleted} постов из категории {category.name}'))
+
+    def progress(self, done, total, started, width=30):
+        elapsed = time.monotonic() - started
+        total = max(total, done)
+        filled = int(width * done / total)
+        rate = done / elapsed if elapsed else 0
+        bar = '#' * filled + '.' * (width - filled)
+        self.stderr.write(f'\r[{bar}] {done}/{total} {done * 100 // total}% {rate:,.0f} постов/с', ending='')
+        self.stderr.flush()
+
+    @staticmethod
+    def dependent_relations():
+        return [rel for rel in Post._meta.related_objects if rel.on_delete is not models.DO_NOTHING]
+
+    def check_raw_delete(self):
+        # Raw deletes skip the collector, so every dependent table must be a
+        # leaf reached by CASCADE; otherwise rows would be left dangling.
+        for rel in self.dependent_relations():
+            model = rel.related_model
+            if rel.on_delete is not models.CASCADE or any(
+                r.on_delete is not models.DO_NOTHING for r in model._meta.related_objects
+            ):
+                raise CommandError(f'--raw недоступен: {model._meta.label} требует каскадного удаления через ORM')
+
+    def raw_delete(self, ids):
+        db = router.db_for_write(Post)
+        with transaction.atomic(using=db):
+            self.subtract_ratings(ids)
+            rows = Post.objects.filter(pk__in=ids)
+            tags = {f'posts:{post_type}' for post_type in rows.values_list('post_type', flat=True).distinct()}
+            tags.update(f'post:{pk}' for pk in ids)
+            tags.update(
+                f'category:{cid}' for cid in
+                PostCategory.objects.filter(post_id__in=ids).values_list('category_id', flat=True).distinct()
+            )
+            tags.add('post-categories')
+            for rel in self.dependent_relations():
+                rel.related_model._base_manager.using(db).filter(**{f'{rel.field.name}__in': ids})._raw_delete(db)
+            rows._raw_delete(db)
+            transaction.on_commit(lambda: get_search_backend().remove_posts(ids), using=db)
+            transaction.on_commit(lambda: bump_tags(tags), using=db)
 
-        if answer.lower() == 'yes':
-            posts = Post.objects.filter(categories=category)
-            count = posts.count()
-            posts.delete()
-            self.stdout.write(self.style.SUCCESS(f'Успешно удалено {count} постов из категории {category.name}'))
-        else:
-            self.stdout.write(self.style.ERROR('Отменено'))
+    def subtract_ratings(self, ids):
+        # The same rules as the post/comment delete signals, aggregated per author
+        deltas = defaultdict(int)
+        for author_id, total in Post.objects.filter(pk__in=ids).values_list('author_id').annotate(total=Sum('rating')):
+            deltas[author_id] -= (total or 0) * POST_RATING_WEIGHT
+        comments = Comment.objects.filter(post_id__in=ids).exclude(rating=0)
+        for author_id, total in comments.values_list('post__author_id').annotate(total=Sum('rating')):
+            deltas[author_id] -= total or 0
+        user_totals = dict(comments.values_list('user_id').annotate(total=Sum('rating')))
+        for author_id, user_id in Author.objects.filter(user_id__in=user_totals).values_list('pk', 'user_id'):
+            deltas[author_id] -= user_totals[user_id] or 0
+        for author_id, delta in deltas.items():
+            if delta:
+                Author.objects.filter(pk=author_id).update(rating=F('rating') + delta)
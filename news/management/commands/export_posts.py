@@ -0,0 +1,53 @@
+import json
+import sys
+
+from django.core.management.base import BaseCommand
+
+from news.models import Category, Post, PostCategory
+from news.transfer import json_default, value_columns
+
+
+class Command(BaseCommand):
+    help = 'Export posts as JSON Lines (one post per line), streaming with constant memory.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--output', '-o', default='-', help='Output file (default: stdout)')
+        parser.add_argument('--type', choices=[Post.ARTICLE, Post.NEWS], help='Only export posts of this type')
+        parser.add_argument('--batch-size', type=int, default=2000, help='Posts read per query')
+
+    def handle(self, *args, **options):
+        batch_size = options['batch_size']
+        # rewrite(False): read the stored columns, not the active-language values
+        qs = Post.objects.rewrite(False).order_by('pk')
+        if options['type']:
+            qs = qs.filter(post_type=options['type'])
+        category_names = dict(Category.objects.rewrite(False).values_list('pk', 'name'))
+
+        out = sys.stdout if options['output'] == '-' else open(options['output'], 'w', encoding='utf-8')
+        total = 0
+        try:
+            batch = []
+            for row in qs.values(*value_columns()).iterator(chunk_size=batch_size):
+                batch.append(row)
+                if len(batch) >= batch_size:
+                    total += self.write_batch(out, batch, category_names)
+                    batch = []
+            if batch:
+                total += self.write_batch(out, batch, category_names)
+        finally:
+            if out is not sys.stdout:
+                out.close()
+        self.stderr.write(self.style.SUCCESS(f'Exported {total} posts.'))
+
+    def write_batch(self, out, rows, category_names):
+        categories = {row['id']: [] for row in rows}
+        links = PostCategory.objects.filter(post_id__in=categories).order_by('post_id', 'category_id')
+        for post_id, category_id in links.values_list('post_id', 'category_id'):
+            categories[post_id].append(category_names[category_id])
+        lines = []
+        for row in rows:
+            row['author'] = row.pop('author__user__username')
+            row['categories'] = categories[row['id']]
+            lines.append(json.dumps(row, ensure_ascii=False, default=json_default))
+        out.write('\n'.join(lines) + '\n')
+        return len(rows)
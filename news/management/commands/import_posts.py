@@ -0,0 +1,231 @@
+import json
+import sys
+import time
+from collections import defaultdict
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.core.management.color import no_style
+from django.db import connections, router, transaction
+from django.db.models import F
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+from modeltranslation.utils import build_localized_fieldname
+
+from news.cache import bump_tags
+from news.feed import add_entries
+from news.models import Author, Category, Post, PostCategory, POST_RATING_WEIGHT, make_preview
+from news.search import get_search_backend
+from news.tasks import send_import_summary_task
+from news.transfer import TRANSLATED_FIELDS, keep_timestamps, translation_columns
+
+
+class Command(BaseCommand):
+    help = (
+        'Import posts from JSON Lines (see news/transfer.py) with bulk inserts. '
+        'No per-post signals or Celery tasks are fired; previews, search index, '
+        'author ratings and page cache are updated per batch.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help='JSONL file, "-" for stdin')
+        parser.add_argument('--batch-size', type=int, default=1000, help='Posts per bulk insert / transaction')
+        parser.add_argument('--notify', choices=['none', 'summary'], default='none',
+                            help='none: no notifications; summary: one digest task for all imported articles')
+        parser.add_argument('--create-categories', action='store_true', help='Create categories missing in the database')
+        parser.add_argument('--keep-ids', action='store_true', help='Keep post ids from the file')
+        parser.add_argument('--no-index', action='store_true',
+                            help='Skip the search index (run rebuild_search_index afterwards)')
+
+    def handle(self, *args, **options):
+        self.options = options
+        self.columns = [field.attname for field in Post._meta.concrete_fields]
+        self.translation_columns = {
+            field: translation_columns(field) for field in TRANSLATED_FIELDS + ('preview',)
+        }
+        self.authors = dict(Author.objects.values_list('user__username', 'pk'))
+        self.categories = dict(Category.objects.rewrite(False).values_list('name', 'pk'))
+        self.backend = None if options['no_index'] else get_search_backend()
+        self.stats = {'imported': 0, 'skipped': 0}
+        # Ids of the imported articles, for the summary email
+        self.article_ids = []
+
+        started = time.monotonic()
+        try:
+            stream = sys.stdin if options['path'] == '-' else open(options['path'], encoding='utf-8')
+        except OSError as e:
+            raise CommandError(f"Cannot open {options['path']}: {e}")
+        try:
+            batch = []
+            for lineno, line in enumerate(stream, 1):
+                if not line.strip():
+                    continue
+                item = self.parse(lineno, line)
+                if item is None:
+                    continue
+                batch.append((lineno, *item))
+                if len(batch) >= options['batch_size']:
+                    self.write_batch(batch)
+                    batch = []
+            if batch:
+                self.write_batch(batch)
+        finally:
+            if stream is not sys.stdin:
+                stream.close()
+
+        if options['keep_ids'] and self.stats['imported']:
+            self.reset_sequence()
+        if options['notify'] == 'summary' and self.article_ids:
+            send_import_summary_task.delay(self.article_ids)
+
+        elapsed = time.monotonic() - started
+        rate = self.stats['imported'] / elapsed * 60 if elapsed else 0
+        self.stdout.write(self.style.SUCCESS(
+            f"Imported {self.stats['imported']} posts, skipped {self.stats['skipped']} "
+            f"in {elapsed:.1f}s ({rate:,.0f} posts/min)."
+        ))
+
+    def skip(self, lineno, reason):
+        self.stats['skipped'] += 1
+        self.stderr.write(self.style.WARNING(f'line {lineno}: {reason}, skipped'))
+
+    def category_id(self, name):
+        if name not in self.categories and self.options['create_categories']:
+            self.categories[name] = Category.objects.create(name=name).pk
+        return self.categories.get(name)
+
+    def parse(self, lineno, line):
+        """JSON line -> (Post, category ids), or None if the record is skipped."""
+        try:
+            record = json.loads(line)
+        except ValueError as e:
+            return self.skip(lineno, f'invalid JSON ({e})')
+        if not isinstance(record, dict):
+            return self.skip(lineno, 'not an object')
+
+        author_id = self.authors.get(record.get('author'))
+        if author_id is None:
+            return self.skip(lineno, f"unknown author {record.get('author')!r}")
+        post_type = record.get('post_type', Post.NEWS)
+        if post_type not in (Post.ARTICLE, Post.NEWS):
+            return self.skip(lineno, f'invalid post_type {post_type!r}')
+        category_ids = []
+        for name in record.get('categories') or []:
+            category_id = self.category_id(name)
+            if category_id is None:
+                return self.skip(lineno, f'unknown category {name!r} (use --create-categories)')
+            if category_id not in category_ids:
+                category_ids.append(category_id)
+
+        try:
+            rating = int(record.get('rating') or 0)
+        except (TypeError, ValueError):
+            return self.skip(lineno, f"invalid rating {record.get('rating')!r}")
+        post_id = record.get('id') if self.options['keep_ids'] else None
+        if post_id is not None and (type(post_id) is not int or post_id < 1):
+            return self.skip(lineno, f'invalid id {post_id!r}')
+
+        try:
+            # ValueError for an impossible date (2024-02-30), TypeError for a non-string
+            created_at = parse_datetime(record['created_at']) if record.get('created_at') else timezone.now()
+            updated_at = parse_datetime(record['updated_at']) if record.get('updated_at') else created_at
+        except (ValueError, TypeError):
+            return self.skip(lineno, 'invalid date')
+        if created_at is None or updated_at is None:
+            return self.skip(lineno, 'invalid date')
+        if timezone.is_naive(created_at):
+            created_at = timezone.make_aware(created_at)
+        if timezone.is_naive(updated_at):
+            updated_at = timezone.make_aware(updated_at)
+
+        values = {
+            'id': post_id,
+            'author_id': author_id,
+            'post_type': post_type,
+            'rating': rating,
+            'created_at': created_at,
+            'updated_at': updated_at,
+        }
+        for field in TRANSLATED_FIELDS:
+            columns = self.translation_columns[field]
+            translations = {column: record.get(column) for column in columns}
+            values_given = [record.get(field), *translations.values()]
+            if any(value is not None and not isinstance(value, str) for value in values_given):
+                return self.skip(lineno, f'invalid {field}')
+            base = record.get(field) or next((value for value in translations.values() if value), None)
+            if not base:
+                return self.skip(lineno, f'empty {field}')
+            if not any(translations.values()):
+                # Untranslated record: the text is in the site's main language
+                translations[build_localized_fieldname(field, settings.LANGUAGE_CODE)] = base
+            values[field] = base
+            values.update(translations)
+        values['preview'] = make_preview(values['text'])
+        for preview_column, text_column in zip(self.translation_columns['preview'], self.translation_columns['text']):
+            text = values[text_column]
+            values[preview_column] = None if text is None else make_preview(text)
+        # Positional arguments in column order: much cheaper than keyword
+        # arguments, which make every missing translation field compute its
+        # default. Translation columns come after their base column, so the
+        # values set through the translation descriptor are overwritten.
+        post = Post(*[values[name] for name in self.columns])
+        return post, category_ids
+
+    def reset_sequence(self):
+        """Moves the id sequence past the kept ids (PostgreSQL); SQLite needs nothing."""
+        connection = connections[router.db_for_write(Post)]
+        statements = connection.ops.sequence_reset_sql(no_style(), [Post])
+        if statements:
+            with connection.cursor() as cursor:
+                for sql in statements:
+                    cursor.execute(sql)
+
+    def drop_existing_ids(self, batch):
+        """Skips records whose kept id is already in the database or earlier in the batch."""
+        ids = [post.pk for _lineno, post, _category_ids in batch if post.pk is not None]
+        existing = set(Post.objects.filter(pk__in=ids).values_list('pk', flat=True))
+        kept = []
+        for lineno, post, category_ids in batch:
+            if post.pk is not None:
+                if post.pk in existing:
+                    self.skip(lineno, f'post id {post.pk} already exists')
+                    continue
+                existing.add(post.pk)
+            kept.append((lineno, post, category_ids))
+        return kept
+
+    def write_batch(self, batch):
+        if self.options['keep_ids']:
+            batch = self.drop_existing_ids(batch)
+            if not batch:
+                return
+        posts = [post for _lineno, post, _category_ids in batch]
+        # Ratings and page cache follow every committed batch, so a later
+        # failure leaves them in line with what was imported
+        author_deltas = defaultdict(int)
+        tags = {'post-categories'}
+        for _lineno, post, category_ids in batch:
+            author_deltas[post.author_id] += post.rating * POST_RATING_WEIGHT
+            tags.add(f'posts:{post.post_type}')
+            tags.update(f'category:{category_id}' for category_id in category_ids)
+        with transaction.atomic(), keep_timestamps():
+            Post.objects.bulk_create(posts)
+            links = [
+                PostCategory(post_id=post.pk, category_id=category_id)
+                for _lineno, post, category_ids in batch
+                for category_id in category_ids
+            ]
+            PostCategory.objects.bulk_create(links)
+            # bulk_create() sends no signals, so the category feed is filled here
+            add_entries([(link.post_id, link.category_id) for link in links], posts)
+            if self.backend is not None:
+                self.backend.index_posts(posts, replace=False)
+            for author_id, delta in author_deltas.items():
+                if delta:
+                    Author.objects.filter(pk=author_id).update(rating=F('rating') + delta)
+            transaction.on_commit(lambda: bump_tags(tags))
+
+        # Exact ids: with --keep-ids a range could include articles that were already there
+        self.article_ids.extend(post.pk for post in posts if post.post_type == Post.ARTICLE)
+        self.stats['imported'] += len(posts)
+        self.stdout.write(f"{self.stats['imported']} posts imported...")
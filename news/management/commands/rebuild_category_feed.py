@@ -0,0 +1,19 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from news.cache import bump_tags
+from news.feed import FEED_BATCH_SIZE, rebuild_feed
+from news.models import Category
+
+
+class Command(BaseCommand):
+    help = 'Rebuild the denormalised category feed (CategoryFeedEntry) from the post/category links.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=FEED_BATCH_SIZE, help='Links read and inserted per batch')
+
+    def handle(self, *args, **options):
+        with transaction.atomic():
+            total = rebuild_feed(batch_size=options['batch_size'])
+        bump_tags([f'category:{pk}' for pk in Category.objects.values_list('pk', flat=True)])
+        self.stdout.write(self.style.SUCCESS(f'Category feed rebuilt: {total} entries.'))
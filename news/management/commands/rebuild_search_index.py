@@ -0,0 +1,15 @@
+from django.core.management.base import BaseCommand
+
+from news.search import get_search_backend
+
+
+class Command(BaseCommand):
+    help = 'Rebuild the full-text search index for all posts.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000, help='Posts indexed per batch')
+
+    def handle(self, *args, **options):
+        backend = get_search_backend()
+        total = backend.rebuild(batch_size=options['batch_size'])
+        self.stdout.write(self.style.SUCCESS(f'Indexed {total} posts with {type(backend).__name__}.'))
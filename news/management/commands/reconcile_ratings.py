@@ -0,0 +1,33 @@
+from django.core.management.base import BaseCommand
+from django.db.models import F
+
+from news.models import Author
+
+
+class Command(BaseCommand):
+    help = 'Recompute all author ratings in one query and report drift from the incrementally kept values.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--dry-run', action='store_true', help='Only report drift, do not fix it')
+
+    def handle(self, *args, **options):
+        drifted = (
+            Author.objects
+            .annotate(computed=Author.computed_rating())
+            .exclude(rating=F('computed'))
+            .values_list('pk', 'user__username', 'rating', 'computed')
+            .order_by('pk')
+        )
+        count = 0
+        for pk, username, rating, computed in drifted.iterator():
+            count += 1
+            self.stdout.write(f'{username} (id={pk}): stored {rating}, computed {computed}, drift {rating - computed:+d}')
+
+        if not count:
+            self.stdout.write(self.style.SUCCESS('All author ratings are consistent.'))
+            return
+        if options['dry_run']:
+            self.stdout.write(self.style.WARNING(f'{count} authors drifted (dry run, nothing changed).'))
+            return
+        Author.objects.update(rating=Author.computed_rating())
+        self.stdout.write(self.style.SUCCESS(f'Fixed {count} drifted author ratings.'))
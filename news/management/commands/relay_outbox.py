@@ -0,0 +1,41 @@
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from news.outbox import outbox_stats, relay_all
+
+
+class Command(BaseCommand):
+    help = (
+        'Send pending outbox rows (task calls recorded by signals) to the Celery broker. '
+        'Runs once, or keeps relaying with --loop; --stats prints backlog and lag.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--loop', action='store_true', help='Keep relaying until interrupted')
+        parser.add_argument(
+            '--interval', type=float, default=None,
+            help='Seconds between runs with --loop (default NEWS_OUTBOX_RELAY_INTERVAL)',
+        )
+        parser.add_argument('--batch-size', type=int, default=None, help='Rows per batch (default NEWS_OUTBOX_BATCH_SIZE)')
+        parser.add_argument('--stats', action='store_true', help='Only print backlog and lag figures')
+
+    def handle(self, *args, **options):
+        if options['stats']:
+            stats = outbox_stats()
+            for name in sorted(stats):
+                self.stdout.write(f'{name}: {stats[name]}')
+            return
+
+        interval = options['interval'] or getattr(settings, 'NEWS_OUTBOX_RELAY_INTERVAL', 5)
+        while True:
+            result = relay_all(options['batch_size'])
+            if result['relayed'] or not options['loop']:
+                self.stdout.write(
+                    f"Relayed {result['relayed']} rows as {result['calls']} task calls, "
+                    f"{result['backlog']} pending, lag {result['lag']:.3f}s."
+                )
+            if not options['loop']:
+                return
+            time.sleep(interval)
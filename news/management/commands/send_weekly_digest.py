@@ -1,64 +1,56 @@
-from django.core.management.base import BaseCommand
-from django.contrib.sites.models import Site
-from django.core.mail import send_mail
-from django.conf import settings
+from datetime import datetime, time, timedelta
+
+from django.core.management.base import BaseCommand, CommandError
 from django.utils import timezone
-from datetime import timedelta
+from django.utils.dateparse import parse_date, parse_datetime
 
-from news.models import CategorySubscription, Post
+from news.digest import send_digests
 
 
 class Command(BaseCommand):
     help = 'Send weekly digest of new articles to users subscribed to categories.'
 
-    def handle(self, *args, **options):
-        since = timezone.now() - timedelta(days=7)
-        current_site = Site.objects.get_current()
+    def add_arguments(self, parser):
+        parser.add_argument('--since', help='Include articles created since this date or datetime (default: 7 days ago)')
+        parser.add_argument('--shard', help='Only handle recipients of shard N out of M, e.g. 1/4')
+        parser.add_argument('--dry-run', action='store_true', help='Build digests and report counts without sending')
+        parser.add_argument('--batch-size', type=int, default=100, help='Messages sent per SMTP connection')
+
+    def parse_since(self, value):
+        if not value:
+            return timezone.now() - timedelta(days=7)
+        since = parse_datetime(value)
+        if since is None:
+            d = parse_date(value)
+            if d is None:
+                raise CommandError(f'Invalid --since value: {value}')
+            since = datetime.combine(d, time.min)
+        if timezone.is_naive(since):
+            since = timezone.make_aware(since)
+        return since
+
+    def parse_shard(self, value):
+        if not value:
+            return None
+        try:
+            n, m = (int(part) for part in value.split('/'))
+        except ValueError:
+            raise CommandError(f'Invalid --shard value: {value} (expected N/M)')
+        if m < 1 or not 1 <= n <= m:
+            raise CommandError(f'Invalid --shard value: {value} (need 1 <= N <= M)')
+        return n - 1, m
 
-        # Map user_id -> set of Post ids to avoid duplicates across categories
-        user_posts = {}
+    def handle(self, *args, **options):
+        since = self.parse_since(options['since'])
+        shard = self.parse_shard(options['shard'])
 
-        # Only consider article posts within last week
-        recent_articles = (
-            Post.objects.filter(post_type=Post.ARTICLE, created_at__gte=since)
-            .prefetch_related('categories')
-        )
-        if not recent_articles.exists():
-            self.stdout.write(self.style.WARNING('No recent articles for the last 7 days.'))
+        stats = send_digests(since=since, shard=shard, dry_run=options['dry_run'], batch_size=options['batch_size'])
+        if not stats['articles']:
+            self.stdout.write(self.style.WARNING(f'No recent articles since {since:%Y-%m-%d %H:%M}.'))
             return
-
-        # For each subscription, check if any of the user's categories match article categories
-        subs = CategorySubscription.objects.select_related('user', 'category').all()
-        # Build mapping category_id -> list of (user_id, user_email)
-        cat_to_users = {}
-        for s in subs:
-            email = (s.user.email or '').strip()
-            if not email:
-                continue
-            cat_to_users.setdefault(s.category_id, []).append((s.user_id, email))
-
-        for article in recent_articles:
-            cat_ids = set(article.categories.values_list('id', flat=True))
-            for cid in cat_ids:
-                for user_id, email in cat_to_users.get(cid, []):
-                    user_posts.setdefault((user_id, email), set()).add(article.id)
-
-        # Send emails
-        sent = 0
-        for (user_id, email), post_ids in user_posts.items():
-            posts = Post.objects.filter(id__in=post_ids)
-            if not posts:
-                continue
-            lines = [
-                'Новые статьи за неделю:',
-                '',
-            ]
-            for p in posts.order_by('-created_at'):
-                link = f"https://{current_site.domain}{p.get_absolute_url()}"
-                lines.append(f"- {p.title}: {link}")
-            message = "\n".join(lines)
-            subject = 'Еженедельный дайджест новых статей'
-            send_mail(subject, message, getattr(settings, 'DEFAULT_FROM_EMAIL', None), [email], fail_silently=True)
-            sent += 1
-
-        self.stdout.write(self.style.SUCCESS(f'Sent {sent} weekly digests.'))
+        if options['dry_run']:
+            self.stdout.write(self.style.SUCCESS(
+                f"Dry run: {stats['recipients']} digests with {stats['articles']} articles would be sent."
+            ))
+            return
+        self.stdout.write(self.style.SUCCESS(f"Sent {stats['sent']} weekly digests."))
@@ -0,0 +1,32 @@
+import sqlite3
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import DEFAULT_DB_ALIAS, connections
+
+from news.routers import replica_aliases
+
+
+class Command(BaseCommand):
+    help = (
+        'Copy the SQLite primary into every SQLite replica file (NEWS_DB_REPLICAS). '
+        'Stands in for replication when trying the replica router locally.'
+    )
+
+    def handle(self, *args, **options):
+        primary = connections[DEFAULT_DB_ALIAS]
+        if primary.vendor != 'sqlite':
+            raise CommandError('The primary database is not SQLite.')
+        aliases = [alias for alias in replica_aliases() if connections[alias].vendor == 'sqlite']
+        if not aliases:
+            raise CommandError('No SQLite replicas configured, set NEWS_DB_REPLICAS.')
+
+        primary.ensure_connection()
+        for alias in aliases:
+            # Close Django's own handle first, the backup replaces the file contents
+            connections[alias].close()
+            target = sqlite3.connect(connections[alias].settings_dict['NAME'])
+            try:
+                primary.connection.backup(target)
+            finally:
+                target.close()
+            self.stdout.write(self.style.SUCCESS(f'{alias}: copied from {primary.settings_dict["NAME"]}.'))
@@ -1,15 +1,278 @@
-import pytz
+import json
+import logging
+import re
+import time
+from contextvars import ContextVar
 
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction, sync_to_async
+
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.db import DEFAULT_DB_ALIAS
 from django.utils import timezone
 
+from .routers import replica_aliases, replica_switch
+from .timezones import get_zone
+
+logger = logging.getLogger('news.performance')
+
+# Metrics of the request being handled in the current thread / task
+_current_metrics = ContextVar('news_request_metrics', default=None)
+# Set by ReplicaPinMiddleware: non-empty once the request wrote to the primary
+_primary_writes = ContextVar('news_primary_writes', default=None)
+# Table written by an INSERT/UPDATE/DELETE statement
+WRITE_RE = re.compile(r'\s*(?:INSERT\s+INTO|UPDATE|DELETE\s+FROM)\s+["`]?(\w+)', re.IGNORECASE)
+# Written by almost every request (session, last_login) and never read from a replica
+PIN_IGNORED_TABLES = ('django_session', 'auth_')
+
+
 class TimezoneMiddleware:
+    """
+    Activates the time zone stored in the session. Works in both sync (WSGI)
+    and async (ASGI) stacks; in an async stack the session is read with the
+    async session API, so the event loop is not blocked.
+    """
+
+    sync_capable = True
+    async_capable = True
+
     def __init__(self, get_response):
         self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
 
     def __call__(self, request):
-        tzname = request.session.get('django_timezone')
-        if tzname:
-            timezone.activate(pytz.timezone(tzname))
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        self.activate(request.session.get('django_timezone'))
+        return self.get_response(request)
+
+    async def __acall__(self, request):
+        session = request.session
+        if hasattr(session, 'aget'):
+            tzname = await session.aget('django_timezone')
+        else:
+            # Django < 5.1 has no async session API
+            tzname = await sync_to_async(session.get)('django_timezone')
+        self.activate(tzname)
+        return await self.get_response(request)
+
+    def activate(self, tzname):
+        # Memoized zoneinfo lookup, unknown names fall back to TIME_ZONE
+        zone = get_zone(tzname) if tzname else None
+        if zone is not None:
+            timezone.activate(zone)
         else:
             timezone.deactivate()
-        return self.get_response(request)
+
+
+class QueryBudgetExceeded(Exception):
+    pass
+
+
+class RequestMetrics:
+    def __init__(self):
+        self.queries = 0
+        self.db_time = 0.0
+        self.template_time = 0.0
+
+
+def track_query(execute, sql, params, many, context):
+    """
+    connection.execute_wrapper() hook that news/db.py installs on every
+    connection. Counts the query for the request of the current context and
+    notes writes to the primary for ReplicaPinMiddleware.
+
+    It is installed once per connection rather than per request because
+    under ASGI the async ORM runs queries on a worker thread, whose
+    connections the middleware never sees; the context variables follow
+    the request there.
+    """
+    writes = _primary_writes.get()
+    if writes is not None and not writes and context['connection'].alias == DEFAULT_DB_ALIAS:
+        match = WRITE_RE.match(sql)
+        if match and not match.group(1).lower().startswith(PIN_IGNORED_TABLES):
+            writes.append(True)
+    metrics = _current_metrics.get()
+    if metrics is None:
+        return execute(sql, params, many, context)
+    started = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        metrics.db_time += time.perf_counter() - started
+        metrics.queries += 1
+
+
+def record_template_time(seconds):
+    """Adds template rendering done outside TemplateResponse (e.g. cached fragments) to the current request."""
+    metrics = _current_metrics.get()
+    if metrics is not None:
+        metrics.template_time += seconds
+
+
+class QueryInstrumentationMiddleware:
+    """
+    Per-request query count, DB time, template render time and response size.
+
+    Metrics are logged as one JSON line to the `news.performance` logger and,
+    with NEWS_SERVER_TIMING, sent in a `Server-Timing` header. NEWS_QUERY_BUDGETS
+    maps URL names (e.g. 'news:search') to a maximum number of queries; over
+    budget the request is logged as a warning, or with NEWS_QUERY_BUDGET_STRICT
+    fails with QueryBudgetExceeded (meant for test runs).
+    """
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+            # Django runs sync hooks of async middleware in a thread; this
+            # one only registers a callback and needs no thread hop
+            self.process_template_response = self.aprocess_template_response
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        metrics = RequestMetrics()
+        token = _current_metrics.set(metrics)
+        started = time.perf_counter()
+        try:
+            response = self.get_response(request)
+        finally:
+            _current_metrics.reset(token)
+        return self.report(request, response, metrics, time.perf_counter() - started)
+
+    async def __acall__(self, request):
+        metrics = RequestMetrics()
+        token = _current_metrics.set(metrics)
+        started = time.perf_counter()
+        try:
+            response = await self.get_response(request)
+        finally:
+            _current_metrics.reset(token)
+        return self.report(request, response, metrics, time.perf_counter() - started)
+
+    def report(self, request, response, metrics, total):
+        match = getattr(request, 'resolver_match', None)
+        view_name = match.view_name if match else None
+        size = None if response.streaming else len(response.content)
+        record = {
+            'method': request.method,
+            'path': request.path,
+            'view': view_name,
+            'status': response.status_code,
+            'queries': metrics.queries,
+            'db_ms': round(metrics.db_time * 1000, 2),
+            'template_ms': round(metrics.template_time * 1000, 2),
+            'total_ms': round(total * 1000, 2),
+            'size': size,
+        }
+
+        if getattr(settings, 'NEWS_SERVER_TIMING', False):
+            response['Server-Timing'] = ', '.join([
+                f'db;dur={record["db_ms"]};desc="{metrics.queries} queries"',
+                f'tpl;dur={record["template_ms"]}',
+                f'total;dur={record["total_ms"]}',
+            ])
+
+        budget = getattr(settings, 'NEWS_QUERY_BUDGETS', {}).get(view_name)
+        if budget is not None and metrics.queries > budget:
+            record['budget'] = budget
+            message = f'{view_name} issued {metrics.queries} queries, budget is {budget}'
+            if getattr(settings, 'NEWS_QUERY_BUDGET_STRICT', False):
+                raise QueryBudgetExceeded(message)
+            logger.warning(json.dumps(record))
+        else:
+            logger.info(json.dumps(record))
+        return response
+
+    def process_template_response(self, request, response):
+        return self.time_rendering(response)
+
+    async def aprocess_template_response(self, request, response):
+        return self.time_rendering(response)
+
+    def time_rendering(self, response):
+        # The response is rendered right after the last template middleware
+        # returns; the post-render callback closes the measurement.
+        metrics = _current_metrics.get()
+        if metrics is not None:
+            started = time.perf_counter()
+
+            def rendered(response):
+                metrics.template_time += time.perf_counter() - started
+
+            response.add_post_render_callback(rendered)
+        return response
+
+
+class ReplicaPinMiddleware:
+    """
+    Lets GET/HEAD requests to views with `read_from_replica = True` read from
+    a replica (news/routers.py). A request that writes to the primary sets a
+    cookie that keeps the browser on the primary for
+    NEWS_DB_REPLICA_PIN_SECONDS, so the user sees their own vote, post or
+    subscription even while the replicas lag behind. Session and auth writes
+    do not pin, and without a replica in DATABASES the middleware is unused.
+    """
+
+    cookie_name = 'news_db_pin'
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        if not replica_aliases():
+            raise MiddlewareNotUsed('no read replica configured')
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+            # Flipping the switch needs no thread hop around a sync hook
+            self.process_view = self.aprocess_view
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        writes = []
+        token = _primary_writes.set(writes)
+        try:
+            # process_view() switches replica reads on; they stay on until
+            # the (template) response is rendered
+            with replica_switch() as request._replica_switch:
+                response = self.get_response(request)
+        finally:
+            _primary_writes.reset(token)
+        return self.pin(response, writes)
+
+    async def __acall__(self, request):
+        writes = []
+        token = _primary_writes.set(writes)
+        try:
+            with replica_switch() as request._replica_switch:
+                response = await self.get_response(request)
+        finally:
+            _primary_writes.reset(token)
+        return self.pin(response, writes)
+
+    def pin(self, response, writes):
+        if writes:
+            seconds = getattr(settings, 'NEWS_DB_REPLICA_PIN_SECONDS', 5)
+            response.set_cookie(self.cookie_name, '1', max_age=seconds, httponly=True, samesite='Lax')
+        return response
+
+    def process_view(self, request, view_func, args, kwargs):
+        self.switch_replica(request, view_func)
+
+    async def aprocess_view(self, request, view_func, args, kwargs):
+        self.switch_replica(request, view_func)
+
+    def switch_replica(self, request, view_func):
+        view_class = getattr(view_func, 'view_class', None) or getattr(view_func, 'cls', None)
+        if (
+            request.method in ('GET', 'HEAD')
+            and getattr(view_class, 'read_from_replica', False)
+            and self.cookie_name not in request.COOKIES
+        ):
+            request._replica_switch.enabled = True
@@ -0,0 +1,28 @@
+from django.db import migrations
+
+
+def create_fts_table(apps, schema_editor):
+    # FTS5 is SQLite-specific; other databases use a different search backend
+    if schema_editor.connection.vendor != 'sqlite':
+        return
+    schema_editor.execute(
+        "CREATE VIRTUAL TABLE IF NOT EXISTS news_post_fts "
+        "USING fts5(title, text, tokenize='unicode61 remove_diacritics 2')"
+    )
+
+
+def drop_fts_table(apps, schema_editor):
+    if schema_editor.connection.vendor != 'sqlite':
+        return
+    schema_editor.execute("DROP TABLE IF EXISTS news_post_fts")
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('news', '0003_alter_author_options_alter_category_options_and_more'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_fts_table, drop_fts_table),
+    ]
@@ -0,0 +1,28 @@
+# Generated by Django 5.2.18 on 2026-10-18 18:54
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('news', '0005_bannedword'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='post',
+            name='preview',
+            field=models.CharField(blank=True, editable=False, max_length=127, verbose_name='Превью'),
+        ),
+        migrations.AddField(
+            model_name='post',
+            name='preview_en_us',
+            field=models.CharField(blank=True, editable=False, max_length=127, null=True, verbose_name='Превью'),
+        ),
+        migrations.AddField(
+            model_name='post',
+            name='preview_ru',
+            field=models.CharField(blank=True, editable=False, max_length=127, null=True, verbose_name='Превью'),
+        ),
+    ]
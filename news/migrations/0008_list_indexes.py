@@ -0,0 +1,27 @@
+# Generated by Django 5.2.18 on 2026-10-18 19:22
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('news', '0007_post_updated_at'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='categorysubscription',
+            index=models.Index(fields=['category', 'user'], name='news_sub_category_user_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='post',
+            index=models.Index(fields=['post_type', '-created_at', '-id'], name='news_post_type_created_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='postcategory',
+            index=models.Index(fields=['category', 'post'], name='news_postcat_category_post_idx'),
+        ),
+    ]
@@ -0,0 +1,53 @@
+# Generated by Django 5.2.18 on 2026-10-18 19:34
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+FEED_COLUMNS = (
+    'created_at', 'post_type', 'title', 'title_en_us', 'title_ru', 'preview', 'preview_en_us', 'preview_ru',
+)
+
+
+def fill_feed(apps, schema_editor):
+    # One INSERT ... SELECT over the existing links; later changes are kept in
+    # sync by signals (manage.py rebuild_category_feed does the same from Python)
+    columns = ', '.join(FEED_COLUMNS)
+    selected = ', '.join(f'p.{column}' for column in FEED_COLUMNS)
+    schema_editor.execute(
+        f'INSERT INTO news_categoryfeedentry (category_id, post_id, {columns}) '
+        f'SELECT pc.category_id, pc.post_id, {selected} '
+        f'FROM news_postcategory pc INNER JOIN news_post p ON p.id = pc.post_id'
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('news', '0008_list_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CategoryFeedEntry',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('created_at', models.DateTimeField(verbose_name='Дата создания')),
+                ('post_type', models.CharField(choices=[('AR', 'Статья'), ('NE', 'Новость')], max_length=2, verbose_name='Тип')),
+                ('title', models.CharField(max_length=255, verbose_name='Заголовок')),
+                ('title_en_us', models.CharField(max_length=255, null=True, verbose_name='Заголовок')),
+                ('title_ru', models.CharField(max_length=255, null=True, verbose_name='Заголовок')),
+                ('preview', models.CharField(blank=True, max_length=127, verbose_name='Превью')),
+                ('preview_en_us', models.CharField(blank=True, max_length=127, null=True, verbose_name='Превью')),
+                ('preview_ru', models.CharField(blank=True, max_length=127, null=True, verbose_name='Превью')),
+                ('category', models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, related_name='feed_entries', to='news.category', verbose_name='Категория')),
+                ('post', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='feed_entries', to='news.post', verbose_name='Публикация')),
+            ],
+            options={
+                'verbose_name': 'Запись ленты категории',
+                'verbose_name_plural': 'Лента категорий',
+                'indexes': [models.Index(fields=['category', '-created_at', '-post'], name='news_feed_category_created_idx')],
+                'constraints': [models.UniqueConstraint(fields=('category', 'post'), name='news_feed_category_post_uniq')],
+            },
+        ),
+        migrations.RunPython(fill_feed, migrations.RunPython.noop),
+    ]
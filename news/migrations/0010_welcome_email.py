@@ -0,0 +1,32 @@
+# Generated by Django 5.2.18 on 2026-10-18 20:05
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('news', '0009_category_feed'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='WelcomeEmail',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('email', models.EmailField(max_length=254, verbose_name='Email')),
+                ('created_at', models.DateTimeField(auto_now_add=True, verbose_name='Дата создания')),
+                ('claimed_at', models.DateTimeField(blank=True, null=True, verbose_name='Взято в отправку')),
+                ('sent_at', models.DateTimeField(blank=True, null=True, verbose_name='Дата отправки')),
+                ('user', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, related_name='welcome_email', to=settings.AUTH_USER_MODEL, verbose_name='Пользователь')),
+            ],
+            options={
+                'verbose_name': 'Приветственное письмо',
+                'verbose_name_plural': 'Приветственные письма',
+                'indexes': [models.Index(fields=['sent_at', 'created_at'], name='news_welcome_pending_idx')],
+            },
+        ),
+    ]
@@ -0,0 +1,30 @@
+# Generated by Django 5.2.18 on 2026-10-18 20:15
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('news', '0010_welcome_email'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='OutboxMessage',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('task', models.CharField(max_length=200, verbose_name='Задача')),
+                ('key', models.CharField(max_length=200, verbose_name='Ключ')),
+                ('payload', models.JSONField(default=dict, verbose_name='Аргументы')),
+                ('created_at', models.DateTimeField(auto_now_add=True, verbose_name='Дата создания')),
+                ('claimed_at', models.DateTimeField(blank=True, null=True, verbose_name='Взято в отправку')),
+                ('attempts', models.PositiveIntegerField(default=0, verbose_name='Попыток')),
+                ('last_error', models.TextField(blank=True, verbose_name='Последняя ошибка')),
+            ],
+            options={
+                'verbose_name': 'Сообщение outbox',
+                'verbose_name_plural': 'Outbox',
+            },
+        ),
+    ]
@@ -0,0 +1,28 @@
+# Generated by Django 5.2.18 on 2026-10-18 20:32
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('news', '0011_outbox'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='NotificationDelivery',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('email', models.EmailField(max_length=254, verbose_name='Email')),
+                ('sent_at', models.DateTimeField(auto_now_add=True, verbose_name='Дата отправки')),
+                ('post', models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, to='news.post', verbose_name='Публикация')),
+            ],
+            options={
+                'verbose_name': 'Отправленное уведомление',
+                'verbose_name_plural': 'Отправленные уведомления',
+                'constraints': [models.UniqueConstraint(fields=('post', 'email'), name='news_delivery_post_email_uniq')],
+            },
+        ),
+    ]
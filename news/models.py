@@ -1,23 +1,58 @@
-from django.db import models
+from django.conf import settings
+from django.db import models, transaction
+from django.db.models import F, OuterRef, Subquery, Sum
+from django.db.models.functions import Coalesce
 from django.contrib.auth.models import User
 from django.urls import reverse
 from django.utils import timezone
 from django.utils.translation import gettext_lazy as _
+from modeltranslation.utils import build_localized_fieldname
+
+from .cache import bump_tags
+from .votes import get_vote_buffer
+
+
+# Weight of a post's rating in its author's rating
+POST_RATING_WEIGHT = 3
+
+# Length of the text kept in Post.preview, without the trailing '...'
+PREVIEW_LENGTH = 124
+
+
+def make_preview(text):
+    text = text or ''
+    return (text[:PREVIEW_LENGTH] + '...') if len(text) > PREVIEW_LENGTH else text
 
 
 class Author(models.Model):
     user = models.OneToOneField(User, on_delete=models.CASCADE, verbose_name=_('Пользователь'))
     rating = models.IntegerField(default=0, verbose_name=_('Рейтинг'))
 
+    @staticmethod
+    def computed_rating():
+        """
+        Expression with the rating recomputed from scratch: sum of the author's
+        post ratings * 3 + the user's own comments + comments under the
+        author's posts. Usable in annotate() and update() over all authors.
+        """
+        def total(qs, group_by):
+            return Coalesce(Subquery(qs.values(group_by).annotate(total=Sum('rating')).values('total')), 0)
+
+        posts_rating = total(Post.objects.filter(author=OuterRef('pk')), 'author')
+        comments_rating = total(Comment.objects.filter(user=OuterRef('user')), 'user')
+        comments_on_posts_rating = total(Comment.objects.filter(post__author=OuterRef('pk')), 'post__author')
+        return posts_rating * POST_RATING_WEIGHT + comments_rating + comments_on_posts_rating
+
+    @staticmethod
+    def add_comment_rating(user_id, post_id, delta):
+        # A comment counts both for its writer and for the author of the post
+        Author.objects.filter(user_id=user_id).update(rating=F('rating') + delta)
+        Author.objects.filter(post__pk=post_id).update(rating=F('rating') + delta)
+
     def update_rating(self):
-        # Sum of ratings for author's posts * 3
-        posts_rating = self.post_set.aggregate(total=models.Sum('rating'))['total'] or 0
-        # Sum of ratings for author's comments
-        comments_rating = self.user.comment_set.aggregate(total=models.Sum('rating'))['total'] or 0
-        # Sum of ratings for comments under author's posts
-        comments_on_posts_rating = Comment.objects.filter(post__author=self).aggregate(total=models.Sum('rating'))['total'] or 0
-        self.rating = posts_rating * 3 + comments_rating + comments_on_posts_rating
-        self.save()
+        # Ratings are kept current incrementally; this is a full recount for one author
+        self.rating = Author.objects.filter(pk=self.pk).annotate(computed=Author.computed_rating()).values_list('computed', flat=True).get()
+        self.save(update_fields=['rating'])
 
     def __str__(self):
         return self.user.username
@@ -38,6 +73,21 @@ class Category(models.Model):
         verbose_name_plural = _('Категории')
 
 
+class BannedWord(models.Model):
+    word = models.CharField(max_length=64, unique=True, verbose_name=_('Слово'))
+
+    def save(self, *args, **kwargs):
+        self.word = self.word.strip().lower()
+        super().save(*args, **kwargs)
+
+    def __str__(self):
+        return self.word
+
+    class Meta:
+        verbose_name = _('Запрещённое слово')
+        verbose_name_plural = _('Запрещённые слова')
+
+
 class CategorySubscription(models.Model):
     user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='category_subscriptions', verbose_name=_('Пользователь'))
     category = models.ForeignKey('Category', on_delete=models.CASCADE, related_name='subscriptions', verbose_name=_('Категория'))
@@ -47,11 +97,65 @@ class CategorySubscription(models.Model):
         unique_together = ('user', 'category')
         verbose_name = _('Подписка на категорию')
         verbose_name_plural = _('Подписки на категории')
+        indexes = [
+            # Subscribers of a category (notifications, digest): the index
+            # alone yields user ids, without reading the table
+            models.Index(fields=['category', 'user'], name='news_sub_category_user_idx'),
+        ]
 
     def __str__(self):
         return f"{self.user.username} -> {self.category.name}"
 
 
+class OutboxMessage(models.Model):
+    """
+    A Celery task call written by a signal in the same transaction as the
+    change that caused it (news/outbox.py). The relay sends committed rows to
+    the broker and deletes them; rows with the same key are merged into one
+    call. A rolled back transaction takes its rows with it.
+    """
+
+    task = models.CharField(max_length=200, verbose_name=_('Задача'))
+    key = models.CharField(max_length=200, verbose_name=_('Ключ'))
+    payload = models.JSONField(default=dict, verbose_name=_('Аргументы'))
+    created_at = models.DateTimeField(auto_now_add=True, verbose_name=_('Дата создания'))
+    claimed_at = models.DateTimeField(null=True, blank=True, verbose_name=_('Взято в отправку'))
+    attempts = models.PositiveIntegerField(default=0, verbose_name=_('Попыток'))
+    last_error = models.TextField(blank=True, verbose_name=_('Последняя ошибка'))
+
+    class Meta:
+        verbose_name = _('Сообщение outbox')
+        verbose_name_plural = _('Outbox')
+
+    def __str__(self):
+        return f"{self.task} {self.key}"
+
+
+class WelcomeEmail(models.Model):
+    """
+    Pending welcome email of a new user. news.tasks.onboard_user creates it,
+    send_welcome_emails claims a batch (claimed_at) and marks every
+    delivered message (sent_at).
+    """
+
+    user = models.OneToOneField(User, on_delete=models.CASCADE, related_name='welcome_email', verbose_name=_('Пользователь'))
+    email = models.EmailField(verbose_name=_('Email'))
+    created_at = models.DateTimeField(auto_now_add=True, verbose_name=_('Дата создания'))
+    claimed_at = models.DateTimeField(null=True, blank=True, verbose_name=_('Взято в отправку'))
+    sent_at = models.DateTimeField(null=True, blank=True, verbose_name=_('Дата отправки'))
+
+    class Meta:
+        verbose_name = _('Приветственное письмо')
+        verbose_name_plural = _('Приветственные письма')
+        indexes = [
+            # Pending emails in signup order
+            models.Index(fields=['sent_at', 'created_at'], name='news_welcome_pending_idx'),
+        ]
+
+    def __str__(self):
+        return self.email
+
+
 class Post(models.Model):
     ARTICLE = 'AR'
     NEWS = 'NE'
@@ -63,24 +167,58 @@ class Post(models.Model):
     author = models.ForeignKey(Author, on_delete=models.CASCADE, verbose_name=_('Автор'))
     post_type = models.CharField(max_length=2, choices=POST_TYPES, default=NEWS, verbose_name=_('Тип'))
     created_at = models.DateTimeField(auto_now_add=True, verbose_name=_('Дата создания'))
+    # Change marker for HTTP validators (ETag / Last-Modified), see news/conditional.py
+    updated_at = models.DateTimeField(auto_now=True, verbose_name=_('Дата изменения'))
     categories = models.ManyToManyField(Category, through='PostCategory', related_name='posts', verbose_name=_('Категории'))
     title = models.CharField(max_length=255, verbose_name=_('Заголовок'))
     text = models.TextField(verbose_name=_('Текст'))
+    # Denormalised start of `text` (per language), so lists never load the full text
+    preview = models.CharField(max_length=PREVIEW_LENGTH + 3, blank=True, editable=False, verbose_name=_('Превью'))
     rating = models.IntegerField(default=0, verbose_name=_('Рейтинг'))
 
-    def like(self):
-        self.rating = models.F('rating') + 1
-        self.save(update_fields=['rating'])
+    def fill_previews(self):
+        """Recomputes `preview` and its translation columns from `text`; returns the changed field names."""
+        names = [
+            (build_localized_fieldname('preview', code), build_localized_fieldname('text', code))
+            for code, _name in settings.LANGUAGES
+        ]
+        # The base column goes through __dict__, the translation descriptor
+        # would write the value into the active language column as well
+        self.__dict__['preview'] = make_preview(self.__dict__.get('text'))
+        for preview_field, text_field in names:
+            text = getattr(self, text_field)
+            # Keep untranslated languages empty, so modeltranslation falls back
+            setattr(self, preview_field, None if text is None else make_preview(text))
+        return ['preview'] + [preview_field for preview_field, _text_field in names]
+
+    def save(self, *args, **kwargs):
+        update_fields = kwargs.get('update_fields')
+        if update_fields is None:
+            self.fill_previews()
+        elif any(name == 'text' or name.startswith('text_') for name in update_fields):
+            kwargs['update_fields'] = set(update_fields) | set(self.fill_previews())
+        super().save(*args, **kwargs)
+
+    def _vote(self, delta):
+        buffer = get_vote_buffer()
+        if buffer is not None:
+            # Written later in a batch; the in-memory rating is approximate
+            buffer.add(Post, self.pk, delta)
+            self.rating += delta
+            return
+        with transaction.atomic():
+            # update() skips auto_now, so the change marker is set explicitly
+            Post.objects.filter(pk=self.pk).update(rating=F('rating') + delta, updated_at=timezone.now())
+            Author.objects.filter(pk=self.author_id).update(rating=F('rating') + delta * POST_RATING_WEIGHT)
+        bump_tags([f'ratings:{self.post_type}'])
         # refresh value from DB after F-expression
-        self.refresh_from_db(fields=['rating'])
+        self.refresh_from_db(fields=['rating', 'updated_at'])
 
-    def dislike(self):
-        self.rating = models.F('rating') - 1
-        self.save(update_fields=['rating'])
-        self.refresh_from_db(fields=['rating'])
+    def like(self):
+        self._vote(1)
 
-    def preview(self):
-        return (self.text[:124] + '...') if len(self.text) > 124 else self.text
+    def dislike(self):
+        self._vote(-1)
 
     def get_absolute_url(self):
         if self.post_type == Post.NEWS:
@@ -93,6 +231,12 @@ class Post(models.Model):
     class Meta:
         verbose_name = _('Публикация')
         verbose_name_plural = _('Публикации')
+        indexes = [
+            # List views, API and digest: filter(post_type=...) ordered by the keyset (-created_at, -id)
+            models.Index(fields=['post_type', '-created_at', '-id'], name='news_post_type_created_idx'),
+            # Last-Modified of the post lists: Max('updated_at') per post type
+            models.Index(fields=['post_type', 'updated_at'], name='news_post_type_updated_idx'),
+        ]
 
 
 class PostCategory(models.Model):
@@ -103,11 +247,76 @@ class PostCategory(models.Model):
         unique_together = ('post', 'category')
         verbose_name = _('Категория публикации')
         verbose_name_plural = _('Категории публикаций')
+        indexes = [
+            # Posts of a category; unique_together only covers (post, category)
+            models.Index(fields=['category', 'post'], name='news_postcat_category_post_idx'),
+        ]
 
     def __str__(self):
         return f"{self.post.title} | {self.category.name}"
 
 
+class CategoryFeedEntry(models.Model):
+    """
+    Denormalised copy of what a category page lists, one row per (category,
+    post). A page is a single range scan of (category, -created_at, -post)
+    without joining Post. Kept in sync by the signals in news/signals.py
+    (see news/feed.py); `manage.py rebuild_category_feed` fills it from scratch.
+    """
+
+    # The composite index below starts with the category
+    category = models.ForeignKey(
+        Category, on_delete=models.CASCADE, db_index=False, related_name='feed_entries', verbose_name=_('Категория'),
+    )
+    post = models.ForeignKey(Post, on_delete=models.CASCADE, related_name='feed_entries', verbose_name=_('Публикация'))
+    created_at = models.DateTimeField(verbose_name=_('Дата создания'))
+    post_type = models.CharField(max_length=2, choices=Post.POST_TYPES, verbose_name=_('Тип'))
+    title = models.CharField(max_length=255, verbose_name=_('Заголовок'))
+    preview = models.CharField(max_length=PREVIEW_LENGTH + 3, blank=True, verbose_name=_('Превью'))
+
+    class Meta:
+        verbose_name = _('Запись ленты категории')
+        verbose_name_plural = _('Лента категорий')
+        constraints = [
+            models.UniqueConstraint(fields=['category', 'post'], name='news_feed_category_post_uniq'),
+        ]
+        indexes = [
+            # Category page keyset: filter(category=...) ordered by (-created_at, -post)
+            models.Index(fields=['category', '-created_at', '-post'], name='news_feed_category_created_idx'),
+        ]
+
+    def get_absolute_url(self):
+        if self.post_type == Post.NEWS:
+            return reverse('news:detail', args=[self.post_id])
+        return reverse('news:article_detail', args=[self.post_id])
+
+    def __str__(self):
+        return f"{self.category_id} | {self.title}"
+
+
+class NotificationDelivery(models.Model):
+    """
+    An article notification delivered to one address. Written right after
+    every message by news.tasks.send_article_notification_chunk, so a retry
+    in any worker skips the recipients that already got the email.
+    """
+
+    post = models.ForeignKey(Post, on_delete=models.CASCADE, db_index=False, verbose_name=_('Публикация'))
+    email = models.EmailField(verbose_name=_('Email'))
+    sent_at = models.DateTimeField(auto_now_add=True, verbose_name=_('Дата отправки'))
+
+    class Meta:
+        verbose_name = _('Отправленное уведомление')
+        verbose_name_plural = _('Отправленные уведомления')
+        constraints = [
+            # Also serves the lookup by post, hence no separate post index
+            models.UniqueConstraint(fields=['post', 'email'], name='news_delivery_post_email_uniq'),
+        ]
+
+    def __str__(self):
+        return f"{self.post_id} | {self.email}"
+
+
 class Comment(models.Model):
     post = models.ForeignKey(Post, on_delete=models.CASCADE, verbose_name=_('Публикация'))
     user = models.ForeignKey(User, on_delete=models.CASCADE, verbose_name=_('Пользователь'))
@@ -115,15 +324,22 @@ class Comment(models.Model):
     created_at = models.DateTimeField(auto_now_add=True, verbose_name=_('Дата создания'))
     rating = models.IntegerField(default=0, verbose_name=_('Рейтинг'))
 
-    def like(self):
-        self.rating = models.F('rating') + 1
-        self.save(update_fields=['rating'])
+    def _vote(self, delta):
+        buffer = get_vote_buffer()
+        if buffer is not None:
+            buffer.add(Comment, self.pk, delta)
+            self.rating += delta
+            return
+        with transaction.atomic():
+            Comment.objects.filter(pk=self.pk).update(rating=F('rating') + delta)
+            Author.add_comment_rating(self.user_id, self.post_id, delta)
         self.refresh_from_db(fields=['rating'])
 
+    def like(self):
+        self._vote(1)
+
     def dislike(self):
-        self.rating = models.F('rating') - 1
-        self.save(update_fields=['rating'])
-        self.refresh_from_db(fields=['rating'])
+        self._vote(-1)
 
     def __str__(self):
         return f"Комментарий от {self.user.username} к {self.post.title}"
@@ -0,0 +1,137 @@
+"""
+Transactional outbox for the Celery tasks started by signals.
+
+A signal calls enqueue() instead of task.delay(): the task call becomes an
+OutboxMessage row of the current transaction, so the request never waits for
+the broker and a rolled back change sends nothing. relay() (the periodic
+task news.tasks.relay_outbox_task or `manage.py relay_outbox --loop`) sends
+committed rows to Celery in batches and deletes them.
+
+Rows with the same key are merged into one call: list arguments are united,
+so an article added to three categories by three post_add events is one
+send_article_notification(post_id, [c1, c2, c3]). If the broker is down the
+rows stay and are retried on the next run, nothing is lost.
+
+Every run stores its figures in the default cache (outbox_stats()): backlog,
+age of the oldest pending row, lag of the last relayed batch (commit to
+broker) and running totals.
+"""
+import logging
+import time
+from datetime import timedelta
+
+from celery import current_app
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models import F, Min, Q
+from django.utils import timezone
+
+from .models import OutboxMessage
+
+logger = logging.getLogger('news.outbox')
+
+STATS_KEY = 'outbox:stats'
+
+
+def enqueue(task, key, **kwargs):
+    """Records a call of the Celery task `task` (its name) in the current transaction."""
+    return OutboxMessage.objects.create(task=task, key=key, payload=kwargs)
+
+
+def merge_payloads(payloads):
+    """One set of arguments from several: lists are united, other values taken from the first."""
+    merged = dict(payloads[0])
+    for payload in payloads[1:]:
+        for name, value in payload.items():
+            if isinstance(value, list) and isinstance(merged.get(name), list):
+                merged[name] = merged[name] + value
+    return {
+        name: sorted(set(value)) if isinstance(value, list) else value
+        for name, value in merged.items()
+    }
+
+
+def _claim(size):
+    now = timezone.now()
+    # A claim older than this belongs to a relay that died mid-batch
+    stale = now - timedelta(seconds=getattr(settings, 'NEWS_OUTBOX_CLAIM_TIMEOUT', 300))
+    claimable = OutboxMessage.objects.filter(Q(claimed_at__isnull=True) | Q(claimed_at__lt=stale))
+    ids = list(claimable.order_by('id').values_list('id', flat=True)[:size])
+    # The update only claims rows no other relay claimed in between
+    claimable.filter(id__in=ids).update(claimed_at=now)
+    return list(OutboxMessage.objects.filter(id__in=ids, claimed_at=now).order_by('id'))
+
+
+def relay(batch_size=None):
+    """
+    Sends one batch of pending rows to the broker. Returns the run's figures:
+    rows relayed, task calls sent, rows still pending and the lag of the
+    oldest relayed row in seconds.
+    """
+    batch_size = batch_size or getattr(settings, 'NEWS_OUTBOX_BATCH_SIZE', 500)
+    rows = _claim(batch_size)
+    groups = {}
+    for row in rows:
+        groups.setdefault((row.task, row.key), []).append(row)
+
+    relayed = calls = 0
+    lag = 0.0
+    error = None
+    for (task, _key), group in groups.items():
+        try:
+            current_app.tasks[task].apply_async(kwargs=merge_payloads([row.payload for row in group]))
+        except Exception as exc:
+            # Broker unavailable: this group and the rest of the batch stay for the next run
+            error = exc
+            logger.exception('Outbox relay could not send %s', task)
+            OutboxMessage.objects.filter(pk__in=[row.pk for row in group]).update(
+                attempts=F('attempts') + 1, last_error=repr(exc),
+            )
+            break
+        now = timezone.now()
+        lag = max(lag, max((now - row.created_at).total_seconds() for row in group))
+        OutboxMessage.objects.filter(pk__in=[row.pk for row in group]).delete()
+        relayed += len(group)
+        calls += 1
+    if error is not None:
+        OutboxMessage.objects.filter(pk__in=[row.pk for row in rows]).update(claimed_at=None)
+
+    result = {'relayed': relayed, 'calls': calls, 'backlog': OutboxMessage.objects.count(), 'lag': round(lag, 3)}
+    _record(result, failed=error is not None)
+    if relayed or error is not None:
+        logger.info('outbox relay %s', result)
+    return result
+
+
+def relay_all(batch_size=None):
+    """Relays batches until the outbox is empty or the broker fails."""
+    total = {'relayed': 0, 'calls': 0, 'lag': 0.0}
+    while True:
+        result = relay(batch_size)
+        total['relayed'] += result['relayed']
+        total['calls'] += result['calls']
+        total['lag'] = max(total['lag'], result['lag'])
+        if not result['relayed'] or not result['backlog']:
+            return dict(result, **total)
+
+
+def _record(result, failed):
+    stats = cache.get(STATS_KEY) or {'relayed': 0, 'calls': 0, 'failures': 0}
+    stats['relayed'] += result['relayed']
+    stats['calls'] += result['calls']
+    stats['failures'] += int(failed)
+    stats['last_run_at'] = time.time()
+    if result['relayed']:
+        stats['last_lag'] = result['lag']
+    cache.set(STATS_KEY, stats, None)
+
+
+def outbox_stats():
+    """Backlog and lag figures for monitoring (`manage.py relay_outbox --stats`)."""
+    oldest = OutboxMessage.objects.aggregate(oldest=Min('created_at'))['oldest']
+    stats = cache.get(STATS_KEY) or {'relayed': 0, 'calls': 0, 'failures': 0}
+    return dict(
+        stats,
+        backlog=OutboxMessage.objects.count(),
+        oldest_age=round((timezone.now() - oldest).total_seconds(), 3) if oldest else 0.0,
+    )
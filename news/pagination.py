@@ -0,0 +1,362 @@
+import asyncio
+import base64
+import binascii
+import json
+from collections import OrderedDict
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.db import connections
+from django.db.models import Q
+from django.http import Http404
+from django.utils.dateparse import parse_datetime
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import BasePagination
+from rest_framework.response import Response
+from rest_framework.utils.urls import replace_query_param
+
+
+class InvalidCursor(ValueError):
+    pass
+
+
+def encode_cursor(data: dict) -> str:
+    raw = json.dumps(data, separators=(',', ':'), default=str).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip('=')
+
+
+def decode_cursor(token: str) -> dict:
+    try:
+        padded = token + '=' * (-len(token) % 4)
+        data = json.loads(base64.urlsafe_b64decode(padded.encode()))
+    except (binascii.Error, ValueError, UnicodeDecodeError):
+        raise InvalidCursor(token)
+    if not isinstance(data, dict):
+        raise InvalidCursor(token)
+    return data
+
+
+async def _alist(queryset):
+    # Evaluates the queryset in a single hop to the ORM thread
+    return [row async for row in queryset]
+
+
+class KeysetPage:
+    """
+    One page of a keyset-paginated result. Mimics the parts of Django's Page
+    that templates use, but navigates with opaque cursor tokens instead of
+    page numbers.
+    """
+
+    def __init__(self, object_list, next_cursor=None, previous_cursor=None, total=None, total_is_capped=False):
+        self.object_list = object_list
+        self.next_cursor = next_cursor
+        self.previous_cursor = previous_cursor
+        self.total = total
+        self.total_is_capped = total_is_capped
+        self.last_cursor = None
+
+    def has_next(self):
+        return self.next_cursor is not None
+
+    def has_previous(self):
+        return self.previous_cursor is not None
+
+    def has_other_pages(self):
+        return self.has_next() or self.has_previous()
+
+    def __iter__(self):
+        return iter(self.object_list)
+
+    def __len__(self):
+        return len(self.object_list)
+
+
+class KeysetPaginator:
+    """
+    Paginates a queryset by a (timestamp, id) key, newest first.
+
+    Each page is a single index range scan `WHERE (created_at, id) < cursor
+    ORDER BY created_at DESC, id DESC LIMIT n+1`, so its cost does not
+    depend on how deep the page is. The total is optional: either skipped,
+    counted up to `count_limit` rows, or taken from planner statistics.
+    """
+
+    COUNT_NONE = 'none'
+    COUNT_CAPPED = 'capped'
+    COUNT_APPROXIMATE = 'approximate'
+
+    def __init__(self, queryset, per_page, key_fields=('created_at', 'id'), count_mode=None, count_limit=None):
+        self.queryset = queryset
+        self.per_page = int(per_page)
+        self.ts_field, self.id_field = key_fields
+        self.count_mode = count_mode or getattr(settings, 'NEWS_PAGINATION_COUNT_MODE', self.COUNT_CAPPED)
+        self.count_limit = count_limit or getattr(settings, 'NEWS_PAGINATION_COUNT_LIMIT', 1000)
+
+    def _key(self, item):
+        if isinstance(item, dict):
+            return item[self.ts_field], item[self.id_field]
+        return getattr(item, self.ts_field), getattr(item, self.id_field)
+
+    def _cursor_for(self, item, direction):
+        ts, pk = self._key(item)
+        return encode_cursor({'t': ts.isoformat(), 'i': pk, 'd': direction})
+
+    def _parse(self, token):
+        data = decode_cursor(token)
+        direction = data.get('d')
+        if direction == 'l':
+            return None, None, 'p'
+        try:
+            # A well-formed but impossible date (2024-02-30) raises ValueError
+            ts = parse_datetime(str(data.get('t', '')))
+        except (ValueError, TypeError):
+            raise InvalidCursor(token)
+        pk = data.get('i')
+        if ts is None or not isinstance(pk, int) or direction not in ('n', 'p'):
+            raise InvalidCursor(token)
+        return ts, pk, direction
+
+    def last_cursor(self):
+        return encode_cursor({'d': 'l'})
+
+    def page(self, cursor=None):
+        qs, ts, direction = self._page_queryset(cursor)
+        rows = list(qs[:self.per_page + 1])
+        total, capped = self.count()
+        return self._make_page(rows, cursor, ts, direction, total, capped)
+
+    async def apage(self, cursor=None):
+        """page() through the async ORM; the rows and the total are queried concurrently."""
+        qs, ts, direction = self._page_queryset(cursor)
+        rows, (total, capped) = await asyncio.gather(
+            _alist(qs[:self.per_page + 1]),
+            self.acount(),
+        )
+        return self._make_page(rows, cursor, ts, direction, total, capped)
+
+    def _page_queryset(self, cursor):
+        ts_field, id_field = self.ts_field, self.id_field
+        qs = self.queryset
+        ts = None
+        direction = 'n'
+        if cursor:
+            ts, pk, direction = self._parse(cursor)
+        if ts is not None:
+            # The redundant __lte/__gte bound lets the planner start a range
+            # scan on the (type, created_at, id) index at the cursor; the OR
+            # alone is evaluated row by row from the top of the index
+            if direction == 'n':
+                qs = qs.filter(Q(**{f'{ts_field}__lte': ts}),
+                               Q(**{f'{ts_field}__lt': ts}) | Q(**{ts_field: ts, f'{id_field}__lt': pk}))
+            else:
+                qs = qs.filter(Q(**{f'{ts_field}__gte': ts}),
+                               Q(**{f'{ts_field}__gt': ts}) | Q(**{ts_field: ts, f'{id_field}__gt': pk}))
+
+        if direction == 'n':
+            qs = qs.order_by(f'-{ts_field}', f'-{id_field}')
+        else:
+            qs = qs.order_by(ts_field, id_field)
+
+        return qs, ts, direction
+
+    def _make_page(self, rows, cursor, ts, direction, total, capped):
+        has_more = len(rows) > self.per_page
+        rows = rows[:self.per_page]
+        if direction == 'p':
+            rows.reverse()
+
+        next_cursor = previous_cursor = None
+        if rows:
+            if direction == 'n':
+                if has_more:
+                    next_cursor = self._cursor_for(rows[-1], 'n')
+                if cursor:
+                    previous_cursor = self._cursor_for(rows[0], 'p')
+            else:
+                # A backwards page always has newer rows after it, unless it
+                # was requested from the very end of the list.
+                if ts is not None:
+                    next_cursor = self._cursor_for(rows[-1], 'n')
+                if has_more:
+                    previous_cursor = self._cursor_for(rows[0], 'p')
+
+        page = KeysetPage(rows, next_cursor, previous_cursor, total, capped)
+        page.last_cursor = self.last_cursor() if next_cursor else None
+        return page
+
+    def count(self):
+        """Returns (total, is_capped); total is None when counting is disabled."""
+        if self.count_mode == self.COUNT_NONE:
+            return None, False
+        if self.count_mode == self.COUNT_APPROXIMATE:
+            estimate = self._estimate()
+            if estimate is not None:
+                return estimate, True
+        qs = self.queryset.order_by()
+        total = qs[:self.count_limit + 1].count()
+        if total > self.count_limit:
+            return self.count_limit, True
+        return total, False
+
+    async def acount(self):
+        if self.count_mode == self.COUNT_NONE:
+            return None, False
+        if self.count_mode == self.COUNT_APPROXIMATE:
+            estimate = await sync_to_async(self._estimate)()
+            if estimate is not None:
+                return estimate, True
+        total = await self.queryset.order_by()[:self.count_limit + 1].acount()
+        if total > self.count_limit:
+            return self.count_limit, True
+        return total, False
+
+    def _estimate(self):
+        # Planner statistics are only meaningful for the unfiltered table.
+        if self.queryset.query.where:
+            return None
+        connection = connections[self.queryset.db]
+        if connection.vendor != 'postgresql':
+            return None
+        with connection.cursor() as cursor:
+            cursor.execute(
+                'SELECT reltuples::bigint FROM pg_class WHERE relname = %s',
+                [self.queryset.model._meta.db_table],
+            )
+            row = cursor.fetchone()
+        if not row or row[0] < 0:
+            return None
+        return int(row[0])
+
+
+class RankedPaginator:
+    """
+    Pages through an already ranked list of ids (e.g. search results ordered
+    by relevance). The list is bounded by the search backend, so the cursor
+    simply carries an offset into it.
+    """
+
+    def __init__(self, queryset, ranked_ids, per_page, is_capped=False):
+        self.queryset = queryset
+        self.ranked_ids = list(ranked_ids)
+        self.per_page = int(per_page)
+        self.is_capped = is_capped
+
+    def _offset(self, cursor):
+        offset = 0
+        if cursor:
+            offset = decode_cursor(cursor).get('o')
+            if not isinstance(offset, int) or offset < 0:
+                raise InvalidCursor(cursor)
+        return offset
+
+    def page(self, cursor=None):
+        offset = self._offset(cursor)
+        allowed = set(self.queryset.filter(pk__in=self.ranked_ids).values_list('pk', flat=True))
+        ordered = [pk for pk in self.ranked_ids if pk in allowed]
+        chunk = ordered[offset:offset + self.per_page]
+        objects = self.queryset.in_bulk(chunk)
+        return self._make_page(ordered, chunk, objects, offset)
+
+    async def apage(self, cursor=None):
+        offset = self._offset(cursor)
+        allowed = set(await _alist(self.queryset.filter(pk__in=self.ranked_ids).values_list('pk', flat=True)))
+        ordered = [pk for pk in self.ranked_ids if pk in allowed]
+        chunk = ordered[offset:offset + self.per_page]
+        objects = await self.queryset.ain_bulk(chunk)
+        return self._make_page(ordered, chunk, objects, offset)
+
+    def _make_page(self, ordered, chunk, objects, offset):
+        rows = [objects[pk] for pk in chunk if pk in objects]
+
+        next_cursor = previous_cursor = None
+        if offset + self.per_page < len(ordered):
+            next_cursor = encode_cursor({'o': offset + self.per_page})
+        if offset > 0:
+            previous_cursor = encode_cursor({'o': max(0, offset - self.per_page)})
+        page = KeysetPage(rows, next_cursor, previous_cursor, len(ordered), self.is_capped)
+        if next_cursor:
+            last_offset = (len(ordered) - 1) // self.per_page * self.per_page
+            page.last_cursor = encode_cursor({'o': last_offset})
+        return page
+
+
+class KeysetPaginationMixin:
+    """
+    ListView mixin that swaps Django's offset Paginator for KeysetPaginator.
+    Templates get `page_obj` with `next_cursor`/`previous_cursor` tokens and
+    navigate with `?cursor=<token>`. A view may set `ranked_ids` in
+    get_queryset() to page through relevance-ordered results instead.
+    """
+
+    cursor_query_param = 'cursor'
+    key_fields = ('created_at', 'id')
+    ranked_ids = None
+    ranked_ids_capped = False
+
+    def get_keyset_paginator(self, queryset, page_size):
+        if self.ranked_ids is not None:
+            return RankedPaginator(queryset, self.ranked_ids, page_size, self.ranked_ids_capped)
+        return KeysetPaginator(queryset, page_size, key_fields=self.key_fields)
+
+    def paginate_queryset(self, queryset, page_size):
+        paginator = self.get_keyset_paginator(queryset, page_size)
+        cursor = self.request.GET.get(self.cursor_query_param)
+        try:
+            page = paginator.page(cursor)
+        except InvalidCursor:
+            raise Http404('Invalid cursor')
+        return paginator, page, page.object_list, page.has_other_pages()
+
+
+class PostKeysetPagination(BasePagination):
+    """DRF pagination class built on the same KeysetPaginator as the HTML views."""
+
+    page_size = 10
+    max_page_size = 100
+    cursor_query_param = 'cursor'
+    page_size_query_param = 'page_size'
+    key_fields = ('created_at', 'id')
+
+    def get_page_size(self, request):
+        try:
+            size = int(request.query_params.get(self.page_size_query_param, self.page_size))
+        except (TypeError, ValueError):
+            return self.page_size
+        return max(1, min(size, self.max_page_size))
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.request = request
+        paginator = KeysetPaginator(queryset, self.get_page_size(request), key_fields=self.key_fields)
+        try:
+            self.page = paginator.page(request.query_params.get(self.cursor_query_param))
+        except InvalidCursor:
+            raise NotFound('Invalid cursor')
+        return list(self.page.object_list)
+
+    def _link(self, token):
+        if token is None:
+            return None
+        url = self.request.build_absolute_uri()
+        return replace_query_param(url, self.cursor_query_param, token)
+
+    def get_paginated_response(self, data):
+        return Response(OrderedDict([
+            ('next', self._link(self.page.next_cursor)),
+            ('previous', self._link(self.page.previous_cursor)),
+            ('count', self.page.total),
+            ('count_is_capped', self.page.total_is_capped),
+            ('results', data),
+        ]))
+
+    def get_paginated_response_schema(self, schema):
+        return {
+            'type': 'object',
+            'properties': {
+                'next': {'type': 'string', 'nullable': True, 'format': 'uri'},
+                'previous': {'type': 'string', 'nullable': True, 'format': 'uri'},
+                'count': {'type': 'integer', 'nullable': True},
+                'count_is_capped': {'type': 'boolean'},
+                'results': schema,
+            },
+        }
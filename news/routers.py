@@ -0,0 +1,153 @@
+import itertools
+import logging
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, DatabaseError, connections
+
+logger = logging.getLogger(__name__)
+
+# True (or a switched-on ReplicaSwitch) while the current request / task
+# may read from a replica
+_use_replica = ContextVar('news_use_replica', default=False)
+
+
+class ReplicaSwitch:
+    """Replica reads for a block that only later learns whether it may use them."""
+
+    enabled = False
+
+    def __bool__(self):
+        return self.enabled
+
+
+@contextmanager
+def use_replica(enabled=True):
+    """Routes reads inside the block to a replica (writes always go to the primary)."""
+    token = _use_replica.set(enabled)
+    try:
+        yield
+    finally:
+        _use_replica.reset(token)
+
+
+@contextmanager
+def replica_switch():
+    """
+    Like use_replica(), but starts switched off; setting `enabled` on the
+    yielded switch turns replica reads on for the rest of the block. The
+    switch is a plain object, so it can be flipped from code running in
+    another context (sync middleware hooks under ASGI run in a thread).
+    """
+    switch = ReplicaSwitch()
+    token = _use_replica.set(switch)
+    try:
+        yield switch
+    finally:
+        _use_replica.reset(token)
+
+
+def replica_aliases():
+    return [alias for alias in connections.settings if alias.startswith('replica')]
+
+
+class ReplicaPool:
+    """
+    Picks a replica alias for a read, round-robin. With
+    NEWS_DB_REPLICA_SELECTION = 'health' every replica is checked at most
+    every NEWS_DB_REPLICA_CHECK_INTERVAL seconds and skipped while it is
+    unreachable or lags more than NEWS_DB_REPLICA_MAX_LAG seconds (PostgreSQL).
+    Without a usable replica reads fall back to the primary.
+    """
+
+    def __init__(self, aliases, selection='round-robin', check_interval=10, max_lag=30):
+        self.aliases = list(aliases)
+        self.selection = selection
+        self.check_interval = check_interval
+        self.max_lag = max_lag
+        self._counter = itertools.count()
+        self._lock = threading.Lock()
+        # alias -> (checked_at, healthy)
+        self._health = {}
+
+    def check(self, alias):
+        connection = connections[alias]
+        try:
+            with connection.cursor() as cursor:
+                if connection.vendor == 'postgresql':
+                    cursor.execute(
+                        'SELECT COALESCE(EXTRACT(EPOCH FROM now() - pg_last_xact_replay_timestamp()), 0)'
+                    )
+                    lag = cursor.fetchone()[0]
+                    if lag > self.max_lag:
+                        logger.warning('Replica %s lags %.1fs behind the primary', alias, lag)
+                        return False
+                else:
+                    cursor.execute('SELECT 1 FROM django_migrations LIMIT 1')
+            return True
+        except DatabaseError:
+            logger.warning('Replica %s is unavailable', alias, exc_info=True)
+            return False
+
+    def is_healthy(self, alias):
+        now = time.monotonic()
+        checked_at, healthy = self._health.get(alias, (None, True))
+        if checked_at is None or now - checked_at >= self.check_interval:
+            healthy = self.check(alias)
+            self._health[alias] = (now, healthy)
+        return healthy
+
+    def choose(self):
+        if not self.aliases:
+            return DEFAULT_DB_ALIAS
+        with self._lock:
+            start = next(self._counter)
+        candidates = [self.aliases[(start + i) % len(self.aliases)] for i in range(len(self.aliases))]
+        if self.selection != 'health':
+            return candidates[0]
+        for alias in candidates:
+            if self.is_healthy(alias):
+                return alias
+        return DEFAULT_DB_ALIAS
+
+
+class ReplicaRouter:
+    """
+    Sends reads of news models to a replica inside use_replica() blocks
+    (read-only views via ReplicaPinMiddleware, digest and notification
+    recipient queries), every other query to the primary. Sessions and users
+    are always read from the primary, and so are reads inside a transaction
+    on the primary, which must see its own writes.
+    """
+
+    replica_apps = {'news'}
+
+    def __init__(self):
+        self.pool = ReplicaPool(
+            replica_aliases(),
+            selection=getattr(settings, 'NEWS_DB_REPLICA_SELECTION', 'round-robin'),
+            check_interval=getattr(settings, 'NEWS_DB_REPLICA_CHECK_INTERVAL', 10),
+            max_lag=getattr(settings, 'NEWS_DB_REPLICA_MAX_LAG', 30),
+        )
+
+    def db_for_read(self, model, **hints):
+        if (
+            not _use_replica.get()
+            or model._meta.app_label not in self.replica_apps
+            or connections[DEFAULT_DB_ALIAS].in_atomic_block
+        ):
+            return DEFAULT_DB_ALIAS
+        return self.pool.choose()
+
+    def db_for_write(self, model, **hints):
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # Replicas hold the same data as the primary
+        return True
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        return db == DEFAULT_DB_ALIAS
@@ -0,0 +1,234 @@
+import re
+from functools import lru_cache
+
+from django.conf import settings
+from django.db import connections, router
+from django.db.models import Q
+from django.db.models.expressions import RawSQL
+from django.utils.module_loading import import_string
+from modeltranslation.utils import build_localized_fieldname
+
+from .models import Post
+
+try:
+    # Stemming is optional: without it the index still works, queries just
+    # rely on prefix matching instead of proper word stems.
+    import snowballstemmer
+except ImportError:  # pragma: no cover
+    snowballstemmer = None
+
+TOKEN_RE = re.compile(r'\w+', re.UNICODE)
+CYRILLIC_RE = re.compile(r'[а-яё]')
+
+INDEXED_FIELDS = ('title', 'text')
+
+
+def localized_values(post, field):
+    """Values of `field` in the base column and every translation column, without duplicates."""
+    values = []
+    names = [field] + [build_localized_fieldname(field, code) for code, _name in settings.LANGUAGES]
+    for name in names:
+        # Stored values straight from __dict__: the translation descriptor
+        # would resolve language fallbacks on every access
+        value = post.__dict__[name] if name in post.__dict__ else getattr(post, name, None)
+        if value and value not in values:
+            values.append(value)
+    return values
+
+
+class Analyzer:
+    """Lower-cases, tokenizes and stems text; Cyrillic words use the Russian stemmer, the rest English."""
+
+    # Distinct words memoized per analyzer; the pure-Python stemmers are the
+    # slowest part of indexing and real texts repeat most of their words
+    stem_cache_size = 100000
+
+    def __init__(self):
+        if snowballstemmer is not None:
+            self._ru = snowballstemmer.stemmer('russian')
+            self._en = snowballstemmer.stemmer('english')
+        else:
+            self._ru = self._en = None
+        self.stem = lru_cache(maxsize=self.stem_cache_size)(self._stem)
+
+    def _stem(self, word):
+        if self._ru is None:
+            return word
+        if CYRILLIC_RE.search(word):
+            return self._ru.stemWord(word)
+        return self._en.stemWord(word)
+
+    def tokens(self, text):
+        return [self.stem(word) for word in TOKEN_RE.findall((text or '').lower().replace('ё', 'е'))]
+
+    def analyze(self, text):
+        return ' '.join(self.tokens(text))
+
+
+class BaseSearchBackend:
+    supports_ranking = False
+
+    def __init__(self):
+        self.analyzer = Analyzer()
+
+    def index_posts(self, posts, replace=True):
+        """Adds `posts` to the index; replace=False skips removing old entries (new posts only)."""
+        raise NotImplementedError
+
+    def remove_posts(self, post_ids):
+        raise NotImplementedError
+
+    def filter(self, queryset, query, fields=INDEXED_FIELDS):
+        """Restricts `queryset` to posts matching every term of `query` in `fields`."""
+        raise NotImplementedError
+
+    def ranked_ids(self, query, limit, queryset=None):
+        """
+        Post ids matching `query`, best match first, or None if ranking is
+        unsupported. With `queryset` only its posts are ranked, so filters
+        apply before the limit.
+        """
+        return None
+
+    def index_post(self, post):
+        self.index_posts([post])
+
+    def clear(self):
+        pass
+
+    def rebuild(self, batch_size=1000):
+        self.clear()
+        total = 0
+        batch = []
+        for post in Post.objects.order_by('pk').iterator(chunk_size=batch_size):
+            batch.append(post)
+            if len(batch) >= batch_size:
+                self.index_posts(batch, replace=False)
+                total += len(batch)
+                batch = []
+        if batch:
+            self.index_posts(batch, replace=False)
+            total += len(batch)
+        return total
+
+
+class DatabaseSearchBackend(BaseSearchBackend):
+    """
+    Fallback without an index: `icontains` over every language column.
+    Works on any database, but every search is a full scan.
+    """
+
+    def index_posts(self, posts, replace=True):
+        pass
+
+    def remove_posts(self, post_ids):
+        pass
+
+    def filter(self, queryset, query, fields=INDEXED_FIELDS):
+        terms = TOKEN_RE.findall(query or '')
+        for term in terms:
+            cond = Q()
+            for field in fields:
+                cond |= Q(**{f'{field}__icontains': term})
+                for code, _name in settings.LANGUAGES:
+                    cond |= Q(**{f'{build_localized_fieldname(field, code)}__icontains': term})
+            queryset = queryset.filter(cond)
+        return queryset
+
+
+class SQLiteFTS5Backend(BaseSearchBackend):
+    """
+    Inverted index in an SQLite FTS5 virtual table, ranked with bm25.
+
+    Rows are keyed by the post id (rowid). Title and text of every language
+    are stemmed in Python and stored in two columns, so one MATCH covers all
+    translations. The table is created by migration 0004.
+    """
+
+    supports_ranking = True
+    table = 'news_post_fts'
+    title_weight = 10.0
+    text_weight = 1.0
+
+    def _connection(self, write=True):
+        return connections[router.db_for_write(Post) if write else router.db_for_read(Post)]
+
+    def ensure_table(self):
+        with self._connection().cursor() as cursor:
+            cursor.execute(
+                f"CREATE VIRTUAL TABLE IF NOT EXISTS {self.table} "
+                f"USING fts5(title, text, tokenize='unicode61 remove_diacritics 2')"
+            )
+
+    def _document(self, post):
+        return (
+            post.pk,
+            self.analyzer.analyze(' '.join(localized_values(post, 'title'))),
+            self.analyzer.analyze(' '.join(localized_values(post, 'text'))),
+        )
+
+    def index_posts(self, posts, replace=True):
+        rows = [self._document(post) for post in posts if post.pk is not None]
+        if not rows:
+            return
+        with self._connection().cursor() as cursor:
+            if replace:
+                cursor.executemany(f'DELETE FROM {self.table} WHERE rowid = %s', [(row[0],) for row in rows])
+            cursor.executemany(f'INSERT INTO {self.table}(rowid, title, text) VALUES (%s, %s, %s)', rows)
+
+    def remove_posts(self, post_ids):
+        post_ids = [(pk,) for pk in post_ids]
+        if not post_ids:
+            return
+        with self._connection().cursor() as cursor:
+            cursor.executemany(f'DELETE FROM {self.table} WHERE rowid = %s', post_ids)
+
+    def clear(self):
+        self.ensure_table()
+        with self._connection().cursor() as cursor:
+            cursor.execute(f'DELETE FROM {self.table}')
+
+    def match_expression(self, query, fields=INDEXED_FIELDS):
+        terms = self.analyzer.tokens(query)
+        if not terms:
+            return None
+        # Every term is a quoted prefix query, so partial words still match.
+        expr = ' AND '.join('"%s"*' % term.replace('"', '""') for term in terms)
+        return '{%s} : (%s)' % (' '.join(fields), expr)
+
+    def filter(self, queryset, query, fields=INDEXED_FIELDS):
+        match = self.match_expression(query, fields)
+        if match is None:
+            return queryset
+        return queryset.filter(pk__in=RawSQL(f'SELECT rowid FROM {self.table} WHERE {self.table} MATCH %s', [match]))
+
+    def ranked_ids(self, query, limit, queryset=None):
+        match = self.match_expression(query)
+        if match is None:
+            return []
+        connection = self._connection(write=False)
+        restrict, restrict_params = '', []
+        if queryset is not None:
+            # The filtered posts join the MATCH, so the LIMIT keeps the best
+            # matches among them rather than among all posts
+            connection = connections[queryset.db]
+            sql, restrict_params = queryset.order_by().values('pk').query.sql_with_params()
+            restrict = f' AND rowid IN ({sql})'
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f'SELECT rowid FROM {self.table} WHERE {self.table} MATCH %s{restrict} '
+                f'ORDER BY bm25({self.table}, %s, %s) LIMIT %s',
+                [match, *restrict_params, self.title_weight, self.text_weight, limit],
+            )
+            return [row[0] for row in cursor.fetchall()]
+
+
+_backend = None
+
+
+def get_search_backend():
+    global _backend
+    if _backend is None:
+        path = getattr(settings, 'NEWS_SEARCH_BACKEND', 'news.search.DatabaseSearchBackend')
+        _backend = import_string(path)()
+    return _backend
@@ -1,5 +1,5 @@
 from rest_framework import serializers
-from .models import Post, Author, Category
+from .models import Post, Author, Category, PostCategory
 
 class CategorySerializer(serializers.ModelSerializer):
     class Meta:
@@ -22,3 +22,81 @@ class PostSerializer(serializers.ModelSerializer):
         model = Post
         fields = ['id', 'author', 'post_type', 'post_type_display', 'created_at', 'categories', 'title', 'text', 'rating']
         read_only_fields = ['created_at', 'rating']
+
+
+class PostValuesSerializer:
+    """
+    Read-only counterpart of PostSerializer for list/detail GET requests.
+
+    Works on `.values()` rows instead of model instances: no Post objects are
+    built, `post_type_display` is a dict lookup and the categories of a whole
+    page are loaded with one PostCategory query. The output has the same shape
+    as PostSerializer; `fields` limits it to a subset (sparse fieldsets).
+    """
+
+    FIELDS = ('id', 'author', 'post_type', 'post_type_display', 'created_at', 'categories', 'title', 'text', 'rating')
+    # Model columns behind every output field; categories and the display
+    # value are computed, keyset pagination always needs created_at and id.
+    COLUMNS = {
+        'id': 'id',
+        'author': 'author',
+        'post_type': 'post_type',
+        'post_type_display': 'post_type',
+        'created_at': 'created_at',
+        'title': 'title',
+        'text': 'text',
+        'rating': 'rating',
+    }
+    REQUIRED_COLUMNS = ('id', 'created_at')
+
+    def __init__(self, rows, fields=None):
+        self.rows = rows
+        self.fields = tuple(fields) if fields else self.FIELDS
+
+    @classmethod
+    def parse_fields(cls, value):
+        """`?fields=` value -> tuple of field names; raises ValidationError on unknown names."""
+        if not value:
+            return None
+        fields = tuple(dict.fromkeys(name.strip() for name in value.split(',') if name.strip()))
+        unknown = [name for name in fields if name not in cls.FIELDS]
+        if unknown:
+            raise serializers.ValidationError({'fields': [f'Unknown field: {name}' for name in unknown]})
+        return fields or None
+
+    @classmethod
+    def columns(cls, fields=None):
+        columns = list(cls.REQUIRED_COLUMNS)
+        for name in fields or cls.FIELDS:
+            column = cls.COLUMNS.get(name)
+            if column and column not in columns:
+                columns.append(column)
+        return columns
+
+    @property
+    def data(self):
+        rows = list(self.rows)
+        fields = self.fields
+        categories = {}
+        if 'categories' in fields and rows:
+            categories = {row['id']: [] for row in rows}
+            pairs = PostCategory.objects.filter(post_id__in=categories).order_by('category_id')
+            for post_id, category_id in pairs.values_list('post_id', 'category_id'):
+                categories[post_id].append(category_id)
+        display = {value: str(label) for value, label in Post.POST_TYPES}
+        created_at = serializers.DateTimeField()
+
+        data = []
+        for row in rows:
+            item = {}
+            for name in fields:
+                if name == 'categories':
+                    item[name] = categories.get(row['id'], [])
+                elif name == 'post_type_display':
+                    item[name] = display.get(row['post_type'], row['post_type'])
+                elif name == 'created_at':
+                    item[name] = created_at.to_representation(row['created_at'])
+                else:
+                    item[name] = row[self.COLUMNS[name]]
+            data.append(item)
+        return data
@@ -1,15 +1,17 @@
 from django.contrib.auth import get_user_model
 from django.contrib.auth.models import Group, Permission
 from django.contrib.contenttypes.models import ContentType
-from django.db.models.signals import post_save, post_migrate, m2m_changed
+from django.db import transaction
+from django.db.models import F
+from django.db.models.signals import post_save, post_delete, pre_delete, post_migrate, m2m_changed
 from django.dispatch import receiver
-from django.core.mail import send_mail
-from django.conf import settings
-from django.contrib.sites.models import Site
 
-from .tasks import send_article_notification
+from .tasks import onboard_user, send_article_notification
 
-from .models import Post, CategorySubscription
+from . import auth, events, feed, outbox, subscriptions
+from .cache import bump_tags
+from .models import Author, BannedWord, Category, Comment, Post, PostCategory, CategorySubscription, POST_RATING_WEIGHT
+from .search import get_search_backend
 
 COMMON_GROUP = 'common'
 AUTHORS_GROUP = 'authors'
@@ -32,26 +34,19 @@ def ensure_groups_and_permissions():
 
 @receiver(post_migrate)
 def create_groups_on_migrate(sender, **kwargs):
-    # ensure groups after migrations for any app
-    ensure_groups_and_permissions()
+    # Once per migrate: post_migrate is sent for every installed app. The news
+    # app's content types and permissions are created by receivers of
+    # contenttypes and auth, which are connected (and called) before this one.
+    if sender.name == 'news':
+        ensure_groups_and_permissions()
 
 
 @receiver(post_save, sender=get_user_model())
 def add_new_user_to_common(sender, instance, created, **kwargs):
     if created:
-        group, _ = Group.objects.get_or_create(name=COMMON_GROUP)
-        instance.groups.add(group)
-        # Welcome email
-        if instance.email:
-            current_site = Site.objects.get_current()
-            subject = 'Добро пожаловать в NewsPortal!'
-            message = (
-                f"Здравствуйте, {instance.get_username()}!\n\n"
-                f"Спасибо за регистрацию в NewsPortal. Вы можете подписываться на любимые категории, "
-                f"получать мгновенные уведомления о новых статьях и еженедельные дайджесты.\n\n"
-                f"Перейти на сайт: https://{current_site.domain}/\n"
-            )
-            send_mail(subject, message, getattr(settings, 'DEFAULT_FROM_EMAIL', None), [instance.email], fail_silently=True)
+        # Группа и приветственное письмо — в Celery через outbox (news/outbox.py):
+        # регистрация не ждёт ни брокер, ни SMTP
+        outbox.enqueue(onboard_user.name, f'onboard:{instance.pk}', user_id=instance.pk)
 
 
 @receiver(m2m_changed, sender=Post.categories.through)
@@ -59,14 +54,238 @@ def notify_on_article_in_category(sender, instance: Post, action, reverse, pk_se
     # Отправляем уведомления асинхронно через Celery, когда статья связана с категориями
     if action != 'post_add':
         return
-    if instance.post_type != Post.ARTICLE:
-        return
     if not pk_set:
         return
+    if reverse:
+        # category.posts.add(...): instance — категория, pk_set — посты
+        notifications = [
+            (post_id, [instance.pk])
+            for post_id in Post.objects.filter(pk__in=pk_set, post_type=Post.ARTICLE).values_list('pk', flat=True)
+        ]
+    elif instance.post_type == Post.ARTICLE:
+        notifications = [(instance.id, list(pk_set))]
+    else:
+        return
+
+    # Задача Celery ставится через outbox в той же транзакции: запрос не ждёт
+    # брокер, а при недоступном брокере уведомление дождётся следующего relay.
+    # Несколько post_add одной статьи сливаются в один вызов (ключ — id статьи).
+    for post_id, category_ids in notifications:
+        outbox.enqueue(
+            send_article_notification.name, f'article-notification:{post_id}',
+            post_id=post_id, category_ids=sorted(category_ids),
+        )
+
+
+@receiver(post_save, sender=Post)
+def index_post_for_search(sender, instance: Post, **kwargs):
+    # Обновляем поисковый индекс после коммита, чтобы не индексировать откатившиеся изменения
+    transaction.on_commit(lambda: get_search_backend().index_post(instance))
+
+
+@receiver(post_delete, sender=Post)
+def remove_post_from_search(sender, instance: Post, **kwargs):
+    post_id = instance.pk
+    transaction.on_commit(lambda: get_search_backend().remove_posts([post_id]))
+
+
+# Инкрементальное обновление рейтинга авторов (см. Author.computed_rating для полного пересчёта)
+
+@receiver(post_save, sender=Comment)
+def add_comment_to_ratings(sender, instance: Comment, created, **kwargs):
+    if created and instance.rating:
+        Author.add_comment_rating(instance.user_id, instance.post_id, instance.rating)
+
+
+@receiver(post_delete, sender=Comment)
+def remove_comment_from_ratings(sender, instance: Comment, **kwargs):
+    # При каскадном удалении поста комментарии удаляются раньше самого поста,
+    # поэтому автор поста здесь ещё находится
+    if instance.rating:
+        Author.add_comment_rating(instance.user_id, instance.post_id, -instance.rating)
+
+
+@receiver(pre_delete, sender=Post)
+def remove_post_from_ratings(sender, instance: Post, **kwargs):
+    post_rating = Post.objects.filter(pk=instance.pk).values_list('rating', flat=True).first()
+    if post_rating:
+        Author.objects.filter(pk=instance.author_id).update(rating=F('rating') - post_rating * POST_RATING_WEIGHT)
+
+
+# Лента категорий (CategoryFeedEntry, см. news/feed.py). Обработчики стоят
+# до инвалидации кэша, чтобы страница категории перерисовывалась уже по новой ленте
+
+@receiver(post_save, sender=Post)
+def refresh_category_feed(sender, instance: Post, created, update_fields=None, **kwargs):
+    # У нового поста ещё нет категорий, строки появятся при post_add
+    if not created:
+        feed.refresh_entries(instance, update_fields)
+
+
+@receiver(m2m_changed, sender=Post.categories.through)
+def sync_category_feed(sender, instance, action, reverse, pk_set, **kwargs):
+    if action == 'post_add':
+        if reverse:
+            feed.add_entries((post_id, instance.pk) for post_id in pk_set)
+        else:
+            feed.add_entries((instance.pk, category_id) for category_id in pk_set)
+    elif action == 'post_remove':
+        if reverse:
+            feed.remove_entries(post_ids=pk_set, category_ids=[instance.pk])
+        else:
+            feed.remove_entries(post_ids=[instance.pk], category_ids=pk_set)
+    elif action == 'post_clear':
+        if reverse:
+            feed.remove_entries(category_ids=[instance.pk])
+        else:
+            feed.remove_entries(post_ids=[instance.pk])
+
+
+@receiver(post_save, sender=PostCategory)
+def add_post_category_row_to_feed(sender, instance: PostCategory, created, **kwargs):
+    if created:
+        feed.add_entries([(instance.post_id, instance.category_id)])
+
+
+@receiver(post_delete, sender=PostCategory)
+def remove_post_category_row_from_feed(sender, instance: PostCategory, **kwargs):
+    feed.remove_entries(post_ids=[instance.post_id], category_ids=[instance.category_id])
+
+
+# Инвалидация кэша прав и профиля автора (см. news/auth.py)
+
+@receiver(m2m_changed, sender=get_user_model().groups.through)
+@receiver(m2m_changed, sender=get_user_model().user_permissions.through)
+def invalidate_user_access_on_m2m(sender, instance, action, reverse, pk_set, **kwargs):
+    if action not in ('post_add', 'post_remove', 'post_clear') or action != 'post_clear' and not pk_set:
+        return
+    if not reverse:
+        auth.invalidate_user_access([instance.pk])
+    elif pk_set:
+        # group.user_set.add(...) / permission.user_set.add(...): pk_set — пользователи
+        auth.invalidate_user_access(pk_set)
+    elif action == 'post_clear':
+        # Список пользователей уже неизвестен
+        auth.invalidate_group_permissions()
+
+
+@receiver(m2m_changed, sender=Group.permissions.through)
+def invalidate_group_permissions_on_m2m(sender, action, **kwargs):
+    if action in ('post_add', 'post_remove', 'post_clear'):
+        auth.invalidate_group_permissions()
+
+
+@receiver(post_save, sender=Author)
+@receiver(post_delete, sender=Author)
+def invalidate_author_access(sender, instance: Author, **kwargs):
+    auth.invalidate_user_access([instance.user_id])
+
+
+@receiver(post_save, sender=Group)
+@receiver(post_delete, sender=Group)
+def forget_cached_groups(sender, instance: Group, **kwargs):
+    # Переименование или удаление группы: id, закэшированный по имени, устарел
+    for name in (COMMON_GROUP, AUTHORS_GROUP, instance.name):
+        auth.forget_group(name)
+    if kwargs.get('signal') is post_delete:
+        # Удаление группы не отправляет m2m_changed для её участников
+        auth.invalidate_group_permissions()
+
+
+# Индекс подписок пользователя в сессии (см. news/subscriptions.py)
+
+@receiver(post_save, sender=CategorySubscription)
+@receiver(post_delete, sender=CategorySubscription)
+def invalidate_user_subscriptions(sender, instance: CategorySubscription, **kwargs):
+    subscriptions.invalidate_subscriptions([instance.user_id])
+
+
+# Поток событий о новых публикациях (см. news/events.py)
+
+@receiver(post_save, sender=Post)
+def publish_new_post(sender, instance: Post, created, **kwargs):
+    if created:
+        events.publish_post(instance)
+
+
+@receiver(m2m_changed, sender=Post.categories.through)
+def publish_post_categories(sender, instance, action, reverse, pk_set, **kwargs):
+    if action != 'post_add' or not pk_set or not events.has_listeners():
+        return
+    if reverse:
+        # category.posts.add(...): instance — категория, pk_set — посты
+        for post in Post.objects.filter(pk__in=pk_set):
+            events.publish_post(post, [instance.pk], events.CATEGORIZED)
+    else:
+        events.publish_post(instance, pk_set, events.CATEGORIZED)
+
+
+@receiver(post_save, sender=PostCategory)
+def publish_post_category_row(sender, instance: PostCategory, created, **kwargs):
+    if created and events.has_listeners():
+        events.publish_post(instance.post, [instance.category_id], events.CATEGORIZED)
+
+
+# Инвалидация кэша отрендеренных страниц (см. news/cache.py)
+
+@receiver(post_save, sender=Post)
+def invalidate_post_pages(sender, instance: Post, created, **kwargs):
+    tags = [f'post:{instance.pk}', f'posts:{instance.post_type}']
+    if not created:
+        category_ids = PostCategory.objects.filter(post_id=instance.pk).values_list('category_id', flat=True)
+        tags += [f'category:{cid}' for cid in category_ids]
+    bump_tags(tags)
+
+
+@receiver(pre_delete, sender=Post)
+def remember_post_categories(sender, instance: Post, **kwargs):
+    # После удаления связи с категориями уже не найти
+    instance._page_cache_category_ids = list(
+        PostCategory.objects.filter(post_id=instance.pk).values_list('category_id', flat=True)
+    )
+
+
+@receiver(post_delete, sender=Post)
+def invalidate_deleted_post_pages(sender, instance: Post, **kwargs):
+    category_ids = getattr(instance, '_page_cache_category_ids', [])
+    bump_tags([f'post:{instance.pk}', f'posts:{instance.post_type}'] + [f'category:{cid}' for cid in category_ids])
+
+
+@receiver(m2m_changed, sender=Post.categories.through)
+def invalidate_post_category_pages(sender, instance, action, reverse, pk_set, **kwargs):
+    if action == 'pre_clear':
+        if reverse:
+            ids = PostCategory.objects.filter(category_id=instance.pk).values_list('post_id', flat=True)
+        else:
+            ids = PostCategory.objects.filter(post_id=instance.pk).values_list('category_id', flat=True)
+        instance._page_cache_cleared_ids = list(ids)
+        return
+    if action not in ('post_add', 'post_remove', 'post_clear'):
+        return
+    ids = pk_set if action != 'post_clear' else getattr(instance, '_page_cache_cleared_ids', [])
+    # post-categories: списки API отдают id категорий каждого поста
+    if reverse:
+        # category.posts.add(...): instance — категория, ids — посты
+        bump_tags([f'category:{instance.pk}', 'post-categories'] + [f'post:{pk}' for pk in ids])
+    else:
+        bump_tags([f'post:{instance.pk}', 'post-categories'] + [f'category:{pk}' for pk in ids])
+
+
+@receiver(post_save, sender=PostCategory)
+@receiver(post_delete, sender=PostCategory)
+def invalidate_post_category_row_pages(sender, instance: PostCategory, **kwargs):
+    # Прямое создание/удаление связей (например, инлайн в админке) не вызывает m2m_changed
+    bump_tags([f'post:{instance.post_id}', f'category:{instance.category_id}', 'post-categories'])
+
+
+@receiver(post_save, sender=Category)
+@receiver(post_delete, sender=Category)
+def invalidate_category_pages(sender, instance: Category, **kwargs):
+    bump_tags([f'category:{instance.pk}', 'categories'])
+
 
-    # Делегируем отправку писем задаче Celery
-    try:
-        send_article_notification.delay(instance.id, list(pk_set))
-    except Exception:
-        # В крайнем случае молча игнорируем, чтобы не падать в сигналах
-        pass
+@receiver(post_save, sender=BannedWord)
+@receiver(post_delete, sender=BannedWord)
+def reload_censor_words(sender, **kwargs):
+    # Цензор перекомпилирует шаблон, кэш страниц с устаревшей цензурой сбрасывается
+    bump_tags(['censor-words'])
@@ -0,0 +1,83 @@
+"""
+Per-user index of subscribed categories.
+
+The ids are kept in the session next to the version of the user's
+`subscriptions:<id>` cache tag (news/cache.py). A request compares the
+stored version with the current one, a cache read, and only queries
+CategorySubscription when they differ. The signals in news/signals.py bump
+the tag whenever one of the user's subscriptions is created or deleted, so
+a change made in another session or by a bulk call is seen on the next
+request.
+
+Without a shared cache backend a bump would only reach the current process,
+so the ids are then read from the database on every request instead.
+
+Templates get the set through the `subscribed_category_ids` context
+variable (news.context_processors.subscriptions), loaded only when used.
+"""
+from .cache import bump_tags, get_tag_versions, has_shared_cache
+from .models import CategorySubscription
+
+SESSION_KEY = 'news_subscriptions'
+
+
+def subscriptions_tag(user_id):
+    return f'subscriptions:{user_id}'
+
+
+def _load(user):
+    return frozenset(CategorySubscription.objects.filter(user=user).values_list('category_id', flat=True))
+
+
+def get_subscribed_category_ids(request):
+    """Frozenset of the category ids the request's user is subscribed to."""
+    cached = getattr(request, '_subscribed_category_ids', None)
+    if cached is not None:
+        return cached
+    user = request.user
+    if not user.is_authenticated:
+        ids = frozenset()
+    elif not has_shared_cache():
+        ids = _load(user)
+    else:
+        tag = subscriptions_tag(user.pk)
+        version = get_tag_versions([tag])[tag]
+        stored = request.session.get(SESSION_KEY)
+        if stored and stored['user'] == user.pk and stored['version'] == version:
+            ids = frozenset(stored['ids'])
+        else:
+            ids = _load(user)
+            request.session[SESSION_KEY] = {'user': user.pk, 'version': version, 'ids': sorted(ids)}
+    request._subscribed_category_ids = ids
+    return ids
+
+
+def forget_subscribed_category_ids(request):
+    """Drops the per-request copy, e.g. after the view changed the subscriptions."""
+    request.__dict__.pop('_subscribed_category_ids', None)
+
+
+def invalidate_subscriptions(user_ids):
+    user_ids = set(user_ids)
+    if user_ids:
+        bump_tags([subscriptions_tag(user_id) for user_id in user_ids])
+
+
+def subscribe(user, category_ids):
+    """Subscribes `user` to every category in `category_ids` with one INSERT; existing ones are kept."""
+    category_ids = set(category_ids)
+    if category_ids:
+        CategorySubscription.objects.bulk_create(
+            [CategorySubscription(user=user, category_id=category_id) for category_id in category_ids],
+            ignore_conflicts=True,
+        )
+        # bulk_create sends no post_save
+        invalidate_subscriptions([user.pk])
+
+
+def unsubscribe(user, category_ids):
+    """Removes the subscriptions of `user` to `category_ids`; the signals bump the version."""
+    category_ids = set(category_ids)
+    if not category_ids:
+        return 0
+    return CategorySubscription.objects.filter(user=user, category_id__in=category_ids).delete()[0]
@@ -1,36 +1,214 @@
+import logging
+from datetime import timedelta
+from smtplib import SMTPConnectError, SMTPException, SMTPRecipientsRefused, SMTPServerDisconnected
+
 from celery import shared_task
 from django.contrib.sites.models import Site
-from django.core.mail import send_mail
+from django.core.cache import cache
+from django.core.mail import EmailMessage, get_connection
 from django.conf import settings
 from django.core.management import call_command
+from django.db.models import Q
+from django.utils import timezone
+
+from .auth import get_group_id
+from .digest import send_digests
+from .models import Post, CategorySubscription, NotificationDelivery, WelcomeEmail
+from .routers import use_replica
+
+logger = logging.getLogger('news.tasks')
 
-from .models import Post, CategorySubscription
+WELCOME_SCHEDULED_KEY = 'welcome:batch-scheduled'
 
 
 @shared_task
 def send_article_notification(post_id: int, category_ids: list[int]):
+    # Fan-out: stream subscriber emails and hand them to per-chunk subtasks
+    if not Post.objects.filter(id=post_id).exists():
+        return 0
+
+    chunk_size = getattr(settings, 'NEWS_NOTIFICATION_CHUNK_SIZE', 500)
+    emails = (
+        CategorySubscription.objects
+        .filter(category_id__in=list(category_ids))
+        .exclude(user__email='')
+        .exclude(user__email__isnull=True)
+        .values_list('user__email', flat=True)
+        .distinct()
+        .order_by('user__email')
+    )
+    chunks = 0
+    chunk = []
+    # Recipients may come from a replica; the post itself was checked on the
+    # primary above, since it may have been created a moment ago
+    with use_replica():
+        for email in emails.iterator(chunk_size=chunk_size):
+            chunk.append(email)
+            if len(chunk) >= chunk_size:
+                send_article_notification_chunk.delay(post_id, chunk)
+                chunks += 1
+                chunk = []
+    if chunk:
+        send_article_notification_chunk.delay(post_id, chunk)
+        chunks += 1
+    return chunks
+
+
+@shared_task(
+    bind=True,
+    # Connection-level failures only: a refused address is skipped, not retried
+    autoretry_for=(SMTPServerDisconnected, SMTPConnectError, OSError),
+    retry_backoff=True,
+    retry_backoff_max=600,
+    max_retries=5,
+)
+def send_article_notification_chunk(self, post_id: int, emails: list[str]):
+    """
+    Sends one personal message per address over a single SMTP connection.
+    Every delivered address is recorded as a NotificationDelivery row, so a
+    retried chunk skips the recipients that already got the email, whichever
+    worker runs the retry. An address the server refuses is logged and
+    skipped; the rest of the chunk still gets the email.
+    """
     try:
-        post = Post.objects.get(id=post_id)
+        # The message needs the preview only, not the full text
+        post = Post.objects.only('id', 'post_type', 'title', 'preview').get(id=post_id)
     except Post.DoesNotExist:
-        return
+        return 0
+
+    already_sent = set(
+        NotificationDelivery.objects.filter(post_id=post_id, email__in=[email.lower() for email in emails])
+        .values_list('email', flat=True)
+    )
+    pending = [email for email in emails if email.lower() not in already_sent]
+    if not pending:
+        return 0
 
     # Build absolute URL and message
     current_site = Site.objects.get_current()
     link = f"https://{current_site.domain}{post.get_absolute_url()}"
     subject = f"Новая статья в ваших категориях: {post.title}"
-    preview = post.preview()
-    message = f"{preview}\n\nЧитать полностью: {link}"
+    message = f"{post.preview}\n\nЧитать полностью: {link}"
+    from_email = getattr(settings, 'DEFAULT_FROM_EMAIL', None)
 
-    emails = set(
-        CategorySubscription.objects
-        .filter(category_id__in=list(category_ids))
-        .values_list('user__email', flat=True)
+    sent = 0
+    with get_connection() as connection:
+        for email in pending:
+            try:
+                connection.send_messages([EmailMessage(subject, message, from_email, [email], connection=connection)])
+            except SMTPRecipientsRefused as exc:
+                logger.warning('Article %s notification to %s refused: %s', post_id, email, exc.recipients.get(email))
+                continue
+            # Committed at once (autocommit), before the next message can fail
+            NotificationDelivery.objects.bulk_create(
+                [NotificationDelivery(post_id=post_id, email=email.lower())], ignore_conflicts=True,
+            )
+            sent += 1
+    return sent
+
+
+@shared_task
+def onboard_user(user_id: int):
+    """
+    Out-of-band part of signup (see add_new_user_to_common): adds the user
+    to the default group and queues the welcome email. Emails of signups
+    that arrive within NEWS_WELCOME_BATCH_DELAY seconds go out together.
+    """
+    from django.contrib.auth import get_user_model
+
+    from .signals import COMMON_GROUP
+
+    user = get_user_model().objects.filter(pk=user_id).only('id', 'email').first()
+    if user is None:
+        return False
+    user.groups.add(get_group_id(COMMON_GROUP))
+    if not user.email:
+        return False
+    _, created = WelcomeEmail.objects.get_or_create(user=user, defaults={'email': user.email})
+    if created:
+        delay = getattr(settings, 'NEWS_WELCOME_BATCH_DELAY', 10)
+        # Only the first signup of a window schedules the batch
+        if cache.add(WELCOME_SCHEDULED_KEY, 1, delay):
+            send_welcome_emails.apply_async(countdown=delay)
+    return created
+
+
+def _welcome_message(email, username, domain, connection):
+    subject = 'Добро пожаловать в NewsPortal!'
+    message = (
+        f"Здравствуйте, {username}!\n\n"
+        f"Спасибо за регистрацию в NewsPortal. Вы можете подписываться на любимые категории, "
+        f"получать мгновенные уведомления о новых статьях и еженедельные дайджесты.\n\n"
+        f"Перейти на сайт: https://{domain}/\n"
     )
-    emails.discard('')
-    emails.discard(None)
+    return EmailMessage(subject, message, getattr(settings, 'DEFAULT_FROM_EMAIL', None), [email], connection=connection)
+
+
+def _claim_welcome_batch(size):
+    """Claims up to `size` pending emails; returns them, or [] when none are left."""
+    now = timezone.now()
+    # A claim older than this belongs to a worker that died mid-batch
+    stale = now - timedelta(seconds=getattr(settings, 'NEWS_WELCOME_CLAIM_TIMEOUT', 600))
+    claimable = WelcomeEmail.objects.filter(Q(claimed_at__isnull=True) | Q(claimed_at__lt=stale), sent_at__isnull=True)
+    ids = list(claimable.order_by('created_at').values_list('id', flat=True)[:size])
+    # The update only claims rows no other worker claimed in between
+    claimable.filter(id__in=ids).update(claimed_at=now)
+    return list(WelcomeEmail.objects.filter(id__in=ids, claimed_at=now).select_related('user'))
+
 
-    if emails:
-        send_mail(subject, message, getattr(settings, 'DEFAULT_FROM_EMAIL', None), list(emails), fail_silently=True)
+@shared_task(
+    bind=True,
+    autoretry_for=(SMTPException, OSError),
+    retry_backoff=True,
+    retry_backoff_max=600,
+    max_retries=5,
+)
+def send_welcome_emails(self):
+    """
+    Sends pending welcome emails, NEWS_WELCOME_BATCH_SIZE per SMTP session.
+    Every delivered email is marked at once, so a retry after an SMTP error
+    only sends the rest.
+    """
+    size = getattr(settings, 'NEWS_WELCOME_BATCH_SIZE', 100)
+    domain = Site.objects.get_current().domain
+    sent = 0
+    while True:
+        batch = _claim_welcome_batch(size)
+        if not batch:
+            return sent
+        try:
+            with get_connection() as connection:
+                for welcome in batch:
+                    connection.send_messages([
+                        _welcome_message(welcome.email, welcome.user.get_username(), domain, connection),
+                    ])
+                    WelcomeEmail.objects.filter(pk=welcome.pk).update(sent_at=timezone.now())
+                    sent += 1
+        except BaseException:
+            # Unsent emails of the batch go back to the queue for the retry
+            WelcomeEmail.objects.filter(pk__in=[w.pk for w in batch], sent_at__isnull=True).update(claimed_at=None)
+            raise
+
+
+@shared_task
+def relay_outbox_task():
+    # Periodic relay of the transactional outbox (see news/outbox.py)
+    from .outbox import relay_all
+
+    return relay_all()
+
+
+@shared_task
+def send_import_summary_task(post_ids: list[int]):
+    # One digest-style email per subscriber for a whole bulk import (see import_posts)
+    stats = send_digests(
+        post_ids=post_ids,
+        subject='Новые статьи в ваших категориях',
+        heading='Новые статьи в категориях, на которые вы подписаны:',
+        # Just imported, a replica may not have these posts yet
+        replica=False,
+    )
+    return stats['sent']
 
 
 @shared_task
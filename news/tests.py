@@ -0,0 +1,250 @@
+import json
+import tempfile
+from smtplib import SMTPRecipientsRefused
+from io import StringIO
+from unittest import mock, skipIf, skipUnless
+
+from django.conf import settings
+from django.contrib.auth.models import Group, Permission, User
+from django.contrib.sessions.middleware import SessionMiddleware
+from django.core import mail
+from django.core.cache import cache
+from django.core.mail.backends.locmem import EmailBackend as LocmemEmailBackend
+from django.core.exceptions import MiddlewareNotUsed
+from django.core.management.base import CommandError
+from django.core.management import call_command
+from django.http import HttpResponse
+from django.test import AsyncRequestFactory, RequestFactory, SimpleTestCase, TestCase, override_settings
+
+from .async_views import PostEventStreamView
+from .auth import get_user_access
+from .cache import has_shared_cache
+from .middleware import ReplicaPinMiddleware
+from .models import POST_RATING_WEIGHT, Author, Category, CategorySubscription, Post
+from .pagination import encode_cursor
+from .search import get_search_backend
+from .tasks import send_article_notification_chunk
+
+
+class SearchRankingTests(TestCase):
+    def setUp(self):
+        self.author = Author.objects.create(user=User.objects.create(username='author'))
+        self.category = Category.objects.create(name='Sport')
+
+    def create_post(self, title, text, post_type=Post.NEWS):
+        with self.captureOnCommitCallbacks(execute=True):
+            return Post.objects.create(author=self.author, title=title, text=text, post_type=post_type)
+
+    @override_settings(NEWS_SEARCH_MAX_RESULTS=3)
+    def test_filters_apply_before_the_result_limit(self):
+        if not get_search_backend().supports_ranking:
+            self.skipTest('search backend does not rank')
+        # Better matches than the wanted post: articles and news outside the category
+        for number in range(3):
+            self.create_post(f'Football {number}', 'football football', post_type=Post.ARTICLE)
+            self.create_post(f'Football news {number}', 'football football')
+        wanted = self.create_post('Weekend', 'A football match')
+        wanted.categories.add(self.category)
+
+        response = self.client.get('/search/', {'q': 'football', 'category': self.category.pk})
+        self.assertEqual([post.pk for post in response.context['news_list']], [wanted.pk])
+
+        response = self.client.get('/search/', {'q': 'football'})
+        posts = response.context['news_list']
+        self.assertEqual(len(posts), 3)
+        self.assertTrue(all(post.post_type == Post.NEWS for post in posts))
+
+
+class CursorPaginationTests(TestCase):
+    def test_impossible_cursor_date_is_not_found(self):
+        cursor = encode_cursor({'d': 'n', 't': '2024-02-30T10:00:00+00:00', 'i': 1})
+        self.assertEqual(self.client.get('/', {'cursor': cursor}).status_code, 404)
+
+
+class PostEventStreamTests(SimpleTestCase):
+    @skipIf(settings.NEWS_ASYNC_VIEWS, 'the stream is mounted with NEWS_ASYNC_VIEWS')
+    def test_not_mounted_without_async_views(self):
+        self.assertEqual(self.client.get('/events/posts/').status_code, 404)
+
+    @skipUnless(settings.NEWS_ASYNC_VIEWS, 'the stream is mounted with NEWS_ASYNC_VIEWS')
+    def test_wsgi_request_is_refused(self):
+        response = self.client.get('/events/posts/')
+        self.assertEqual(response.status_code, 501)
+        self.assertFalse(response.streaming)
+
+    async def test_wsgi_request_to_view_is_refused(self):
+        response = await PostEventStreamView.as_view()(RequestFactory().get('/events/posts/'))
+        self.assertEqual(response.status_code, 501)
+
+    async def test_asgi_request_streams(self):
+        response = await PostEventStreamView.as_view()(AsyncRequestFactory().get('/events/posts/'))
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.streaming)
+        self.assertEqual(response['Content-Type'], 'text/event-stream')
+
+
+class UserAccessTests(TestCase):
+    def test_revoked_group_applies_without_shared_cache(self):
+        if has_shared_cache():
+            self.skipTest('signals invalidate a shared cache')
+        group = Group.objects.create(name='editors')
+        group.permissions.add(Permission.objects.get(codename='add_post'))
+        user = User.objects.create(username='editor')
+        user.groups.add(group)
+        self.assertIn('news.add_post', get_user_access(User.objects.get(pk=user.pk))['permissions'])
+        # As another worker would: the signals of this process do not run
+        User.groups.through.objects.filter(user=user).delete()
+        self.assertNotIn('news.add_post', get_user_access(User.objects.get(pk=user.pk))['permissions'])
+
+
+class ArticleNotificationTests(TestCase):
+    def test_retried_chunk_skips_delivered_recipients(self):
+        author = Author.objects.create(user=User.objects.create(username='author'))
+        post = Post.objects.create(author=author, title='Title', text='text', post_type=Post.ARTICLE)
+        emails = ['a@example.com', 'b@example.com']
+        self.assertEqual(send_article_notification_chunk.apply(args=(post.pk, emails)).get(), 2)
+        # A retry in another worker shares nothing but the database
+        cache.clear()
+        self.assertEqual(send_article_notification_chunk.apply(args=(post.pk, emails + ['C@example.com'])).get(), 1)
+        self.assertEqual([message.to for message in mail.outbox], [['a@example.com'], ['b@example.com'], ['C@example.com']])
+
+    def test_refused_recipient_does_not_stop_the_chunk(self):
+        author = Author.objects.create(user=User.objects.create(username='author'))
+        post = Post.objects.create(author=author, title='Title', text='text', post_type=Post.ARTICLE)
+        send_messages = LocmemEmailBackend.send_messages
+
+        def refuse_b(backend, messages):
+            if messages[0].to == ['b@example.com']:
+                raise SMTPRecipientsRefused({'b@example.com': (550, b'No such user')})
+            return send_messages(backend, messages)
+
+        emails = ['a@example.com', 'b@example.com', 'c@example.com']
+        with mock.patch.object(LocmemEmailBackend, 'send_messages', refuse_b), \
+                self.assertLogs('news.tasks', 'WARNING'):
+            result = send_article_notification_chunk.apply(args=(post.pk, emails))
+        self.assertEqual(result.get(), 2)
+        self.assertEqual([message.to for message in mail.outbox], [['a@example.com'], ['c@example.com']])
+
+
+class CategorySubscriptionsViewTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create(username='reader')
+        self.category = Category.objects.create(name='Sport')
+        self.client.force_login(self.user)
+
+    def post(self, data):
+        return self.client.post('/categories/subscriptions/', data, content_type='application/json')
+
+    def test_rejects_anything_but_lists_of_ids(self):
+        for data in ({'subscribe': '12'}, {'subscribe': ['x']}, {'subscribe': 5}, {'subscribe': [True]},
+                     {'unsubscribe': [1.5]}, [self.category.pk]):
+            with self.subTest(data=data):
+                self.assertEqual(self.post(data).status_code, 400)
+        self.assertFalse(CategorySubscription.objects.exists())
+
+        response = self.post({'subscribe': [self.category.pk]})
+        self.assertEqual(response.json(), {'subscribed': [self.category.pk]})
+
+    def test_change_from_another_process_is_seen(self):
+        if has_shared_cache():
+            self.skipTest('signals invalidate a shared cache')
+        self.assertEqual(self.client.get('/categories/subscriptions/').json(), {'subscribed': []})
+        # bulk_create sends no signals: no bump reaches this process, as with a change made in another worker
+        CategorySubscription.objects.bulk_create([CategorySubscription(user=self.user, category=self.category)])
+        self.assertEqual(self.client.get('/categories/subscriptions/').json(), {'subscribed': [self.category.pk]})
+
+
+class ReplicaPinMiddlewareTests(TestCase):
+    def get_response(self, request):
+        request.session['seen'] = True
+        request.session.save()
+        if request.method == 'POST':
+            Category.objects.create(name='New')
+        return HttpResponse()
+
+    def test_unused_without_replicas(self):
+        with mock.patch('news.middleware.replica_aliases', return_value=[]):
+            with self.assertRaises(MiddlewareNotUsed):
+                ReplicaPinMiddleware(self.get_response)
+
+    def test_only_content_writes_pin(self):
+        with mock.patch('news.middleware.replica_aliases', return_value=['replica1']):
+            middleware = SessionMiddleware(ReplicaPinMiddleware(self.get_response))
+        factory = RequestFactory()
+        self.assertNotIn(ReplicaPinMiddleware.cookie_name, middleware(factory.get('/')).cookies)
+        self.assertIn(ReplicaPinMiddleware.cookie_name, middleware(factory.post('/')).cookies)
+
+
+class ImportPostsTests(TestCase):
+    def setUp(self):
+        self.author = Author.objects.create(user=User.objects.create(username='author'))
+
+    def import_records(self, records, *args):
+        with tempfile.NamedTemporaryFile('w', suffix='.jsonl', encoding='utf-8') as file:
+            file.write('\n'.join(json.dumps(record) for record in records))
+            file.flush()
+            stderr = StringIO()
+            call_command('import_posts', file.name, *args, stdout=StringIO(), stderr=stderr)
+        return stderr.getvalue()
+
+    def record(self, **values):
+        return dict({'author': 'author', 'title': 'Title', 'text': 'text'}, **values)
+
+    def test_invalid_rating_is_skipped(self):
+        errors = self.import_records([self.record(rating='high'), self.record(title='Valid', rating=3)])
+        self.assertIn('line 1: invalid rating', errors)
+        self.assertEqual(list(Post.objects.values_list('title', 'rating')), [('Valid', 3)])
+
+    def test_invalid_date_is_skipped(self):
+        errors = self.import_records([
+            self.record(created_at='2024-02-30T10:00:00'),
+            self.record(updated_at=20240301),
+            self.record(title=['Title']),
+            self.record(title='Valid', rating=2, created_at='2024-03-01T10:00:00'),
+        ])
+        self.assertIn('line 1: invalid date', errors)
+        self.assertIn('line 2: invalid date', errors)
+        self.assertIn('line 3: invalid title', errors)
+        self.assertEqual(list(Post.objects.values_list('title', flat=True)), ['Valid'])
+        self.author.refresh_from_db()
+        self.assertEqual(self.author.rating, 2 * POST_RATING_WEIGHT)
+
+    def test_summary_names_only_imported_articles(self):
+        # Kept ids on both sides of an article that is already there
+        free = Post.objects.create(author=self.author, title='Deleted', text='text')
+        free_id = free.pk
+        free.delete()
+        existing = Post.objects.create(author=self.author, title='Existing', text='text', post_type=Post.ARTICLE)
+        records = [
+            self.record(id=free_id, post_type=Post.ARTICLE),
+            self.record(id=existing.pk + 1, post_type=Post.ARTICLE),
+        ]
+        with mock.patch('news.management.commands.import_posts.send_import_summary_task') as task:
+            self.import_records(records, '--keep-ids', '--notify', 'summary')
+        task.delay.assert_called_once_with([free_id, existing.pk + 1])
+        # The sequence is past the kept ids
+        self.assertGreater(Post.objects.create(author=self.author, title='Next', text='text').pk, existing.pk + 1)
+
+    def test_existing_ids_are_skipped(self):
+        existing = Post.objects.create(author=self.author, title='Existing', text='text')
+        errors = self.import_records(
+            [self.record(id=existing.pk), self.record(id=1000, title='New'), self.record(id=1000, title='Again')],
+            '--keep-ids',
+        )
+        self.assertIn(f'line 1: post id {existing.pk} already exists', errors)
+        self.assertIn('line 3: post id 1000 already exists', errors)
+        self.assertEqual(Post.objects.get(pk=1000).title, 'New')
+        self.assertEqual(Post.objects.count(), 2)
+
+
+class DeleteNewsTests(TestCase):
+    def test_invalid_batch_size_fails_before_the_prompt(self):
+        author = Author.objects.create(user=User.objects.create(username='author'))
+        category = Category.objects.create(name='Sport')
+        Post.objects.create(author=author, title='Title', text='text').categories.add(category)
+        for batch_size in ('0', '-5'):
+            with self.subTest(batch_size=batch_size), mock.patch('builtins.input') as prompt:
+                with self.assertRaises(CommandError):
+                    call_command('delete_news', 'Sport', '--batch-size', batch_size, stdout=StringIO())
+                prompt.assert_not_called()
+        self.assertEqual(Post.objects.count(), 1)
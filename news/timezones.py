@@ -0,0 +1,32 @@
+"""
+Time zones offered by the selector in the page header.
+
+The list is served once by TimezoneListView as static JSON and loaded by
+the browser when the selector is opened, instead of being rendered as ~440
+<option> elements into every page. TimezoneMiddleware activates the
+session's zone through get_zone(), a memoized zoneinfo lookup.
+"""
+import hashlib
+import json
+from functools import lru_cache
+from zoneinfo import ZoneInfo, ZoneInfoNotFoundError
+
+import pytz
+
+COMMON_TIMEZONES = tuple(pytz.common_timezones)
+COMMON_TIMEZONE_SET = frozenset(COMMON_TIMEZONES)
+
+TIMEZONES_JSON = json.dumps(COMMON_TIMEZONES, separators=(',', ':')).encode()
+TIMEZONES_ETAG = '"%s"' % hashlib.md5(TIMEZONES_JSON).hexdigest()
+
+
+@lru_cache(maxsize=1024)
+def get_zone(name):
+    """ZoneInfo for a selectable zone name, None for anything else."""
+    if name not in COMMON_TIMEZONE_SET:
+        return None
+    try:
+        return ZoneInfo(name)
+    except ZoneInfoNotFoundError:
+        # Listed by pytz, missing from the system tz database
+        return None
@@ -0,0 +1,58 @@
+"""
+JSONL format shared by the import_posts and export_posts commands.
+
+One post per line:
+    {"id": 1, "post_type": "AR", "author": "<username>", "created_at": "...",
+     "updated_at": "...", "rating": 0, "title": "...", "text": "...",
+     "title_ru": "...", "title_en_us": "...", "text_ru": "...", "text_en_us": "...",
+     "categories": ["<category name>", ...]}
+
+Authors are referenced by username and categories by name (natural keys),
+so a file can be moved between databases.
+"""
+from contextlib import contextmanager
+from datetime import datetime
+
+from django.conf import settings
+from modeltranslation.utils import build_localized_fieldname
+
+from .models import Post
+
+TRANSLATED_FIELDS = ('title', 'text')
+
+
+def translation_columns(field):
+    return [build_localized_fieldname(field, code) for code, _name in settings.LANGUAGES]
+
+
+def value_columns():
+    """Columns read by export_posts, base and translation columns included."""
+    columns = ['id', 'post_type', 'author__user__username', 'created_at', 'updated_at', 'rating']
+    for field in TRANSLATED_FIELDS:
+        columns += [field] + translation_columns(field)
+    return columns
+
+
+def json_default(value):
+    # Full microsecond precision, DjangoJSONEncoder would cut it to milliseconds
+    if isinstance(value, datetime):
+        return value.isoformat()
+    raise TypeError(f'{type(value).__name__} is not JSON serializable')
+
+
+@contextmanager
+def keep_timestamps():
+    """
+    Lets bulk_create() store created_at/updated_at from the file instead of
+    overwriting them with auto_now_add/auto_now. Only for single-threaded
+    management commands: the flags are switched on the shared model fields.
+    """
+    fields = [Post._meta.get_field('created_at'), Post._meta.get_field('updated_at')]
+    saved = [(field.auto_now, field.auto_now_add) for field in fields]
+    for field in fields:
+        field.auto_now = field.auto_now_add = False
+    try:
+        yield
+    finally:
+        for field, (auto_now, auto_now_add) in zip(fields, saved):
+            field.auto_now, field.auto_now_add = auto_now, auto_now_add
@@ -1,5 +1,5 @@
 from modeltranslation.translator import register, TranslationOptions
-from .models import Category, Post
+from .models import Category, CategoryFeedEntry, Post
 
 @register(Category)
 class CategoryTranslationOptions(TranslationOptions):
@@ -7,4 +7,8 @@ class CategoryTranslationOptions(TranslationOptions):
 
 @register(Post)
 class PostTranslationOptions(TranslationOptions):
-    fields = ('title', 'text',)
+    fields = ('title', 'text', 'preview',)
+
+@register(CategoryFeedEntry)
+class CategoryFeedEntryTranslationOptions(TranslationOptions):
+    fields = ('title', 'preview',)
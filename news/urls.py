@@ -1,3 +1,4 @@
+from django.conf import settings
 from django.urls import path
 from .views import (
     NewsListView,
@@ -6,10 +7,19 @@ from .views import (
     NewsCreateView, NewsUpdateView, NewsDeleteView,
     ArticleCreateView, ArticleUpdateView, ArticleDeleteView,
     ProfileUpdateView, BecomeAuthorView,
-    CategoryDetailView, CategorySubscribeView, CategoryUnsubscribeView,
-    ArticleDetailView, SetTimezoneView,
+    CategoryDetailView, CategorySubscribeView, CategoryUnsubscribeView, CategorySubscriptionsView,
+    ArticleDetailView, SetTimezoneView, TimezoneListView,
 )
 
+if getattr(settings, 'NEWS_ASYNC_VIEWS', False):
+    # ASGI deployments: async variants of the read-heavy pages
+    from .async_views import (
+        AsyncCategoryDetailView as CategoryDetailView,
+        AsyncNewsDetailView as NewsDetailView,
+        AsyncNewsListView as NewsListView,
+        AsyncNewsSearchView as NewsSearchView,
+    )
+
 app_name = 'news'
 
 urlpatterns = [
@@ -28,10 +38,18 @@ urlpatterns = [
     path('articles/<int:pk>/edit/', ArticleUpdateView.as_view(), name='article_edit'),
     path('articles/<int:pk>/delete/', ArticleDeleteView.as_view(), name='article_delete'),
 
+    path('categories/subscriptions/', CategorySubscriptionsView.as_view(), name='category_subscriptions'),
     path('categories/<int:pk>/', CategoryDetailView.as_view(), name='category_detail'),
     path('categories/<int:pk>/subscribe/', CategorySubscribeView.as_view(), name='category_subscribe'),
     path('categories/<int:pk>/unsubscribe/', CategoryUnsubscribeView.as_view(), name='category_unsubscribe'),
 
     path('<int:pk>/', NewsDetailView.as_view(), name='detail'),
     path('set-timezone/', SetTimezoneView.as_view(), name='set_timezone'),
+    path('timezones/', TimezoneListView.as_view(), name='timezones'),
 ]
+
+if getattr(settings, 'NEWS_ASYNC_VIEWS', False):
+    # Under WSGI an event stream would hold a worker thread forever without sending a byte
+    from .async_views import PostEventStreamView
+
+    urlpatterns.append(path('events/posts/', PostEventStreamView.as_view(), name='post_events'))
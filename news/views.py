@@ -1,24 +1,39 @@
-from django.db.models import Q
+import json
+from datetime import datetime, time
+
+from django.conf import settings
+from django.utils import timezone
 from django.utils.dateparse import parse_date
 from django.urls import reverse_lazy
 from django.contrib.auth.mixins import LoginRequiredMixin, PermissionRequiredMixin
-from django.contrib.auth.models import Group
 from django.contrib.auth import get_user_model
 from django.views.generic import ListView, DetailView, CreateView, UpdateView, DeleteView, FormView, View
 from django.views.generic.edit import UpdateView as UserUpdateView
 from django.shortcuts import redirect, get_object_or_404
 from django.contrib import messages
 from django.urls import reverse
-from django.http import HttpResponseRedirect
+from django.db import transaction
+from django.http import HttpResponse, HttpResponseRedirect, JsonResponse
+from django.utils.cache import patch_cache_control
+from django.utils.decorators import method_decorator
 from django import forms
 from django.utils.http import url_has_allowed_host_and_scheme
-from urllib.parse import quote as urlquote
+from urllib.parse import quote as urlquote, urlencode
 from django.utils.translation import gettext_lazy as _
-import pytz
+from django.http import Http404
 from rest_framework import viewsets, permissions
-from .models import Post, Author, Category, CategorySubscription
-from .serializers import PostSerializer
+from rest_framework.response import Response
+from django.views.decorators.http import condition
+from .auth import get_author_id, get_group_id
+from .cache import FragmentCacheMixin
+from .conditional import ConditionalViewMixin, compute_etag, compute_last_modified
+from .models import Post, Category, CategoryFeedEntry
+from .pagination import InvalidCursor, KeysetPaginationMixin, KeysetPaginator, PostKeysetPagination
+from .search import get_search_backend
+from .serializers import PostSerializer, PostValuesSerializer
 from .signals import AUTHORS_GROUP
+from .subscriptions import forget_subscribed_category_ids, get_subscribed_category_ids, subscribe, unsubscribe
+from .timezones import COMMON_TIMEZONE_SET, TIMEZONES_ETAG, TIMEZONES_JSON
 
 
 class AuthorPermissionRedirectMixin:
@@ -34,27 +49,50 @@ class AuthorPermissionRedirectMixin:
         return super().handle_no_permission()
 
 
-class CategoryDetailView(DetailView):
+class CategoryDetailView(FragmentCacheMixin, DetailView):
     model = Category
     template_name = 'news/category_detail.html'
+    fragment_template_name = 'news/partials/category_detail.html'
     context_object_name = 'category'
+    # GET requests may read from a replica (ReplicaPinMiddleware)
+    read_from_replica = True
+    paginate_by = 20
+
+    def get_cache_tags(self):
+        return [f"category:{self.kwargs['pk']}"]
+
+    def get_page_title(self, context):
+        return f"{_('Категория')}: {self.object.name}"
+
+    def get_feed_paginator(self, category_id):
+        # Pages of the denormalised feed: one range scan of its
+        # (category, -created_at, -post) index, however big the category.
+        # No total, counting a big category would read all of it.
+        entries = CategoryFeedEntry.objects.filter(category_id=category_id).only('post', 'post_type', 'title', 'created_at')
+        return KeysetPaginator(
+            entries, self.paginate_by, key_fields=('created_at', 'post_id'), count_mode=KeysetPaginator.COUNT_NONE,
+        )
 
     def get_context_data(self, **kwargs):
         ctx = super().get_context_data(**kwargs)
         category = self.object
-        posts = category.posts.order_by('-created_at')
-        ctx['posts'] = posts
-        user = self.request.user
-        ctx['is_subscribed'] = False
-        if user.is_authenticated:
-            ctx['is_subscribed'] = CategorySubscription.objects.filter(user=user, category=category).exists()
+        paginator = self.get_feed_paginator(category.pk)
+        try:
+            page = paginator.page(self.request.GET.get('cursor'))
+        except InvalidCursor:
+            raise Http404('Invalid cursor')
+        ctx['posts'] = page
+        ctx['page_obj'] = page
+        ctx['is_paginated'] = page.has_other_pages()
+        # Session-cached index, no query per page view
+        ctx['is_subscribed'] = category.pk in get_subscribed_category_ids(self.request)
         return ctx
 
 
 class CategorySubscribeView(LoginRequiredMixin, View):
     def post(self, request, pk):
         category = get_object_or_404(Category, pk=pk)
-        CategorySubscription.objects.get_or_create(user=request.user, category=category)
+        subscribe(request.user, [category.pk])
         messages.success(request, _('Вы подписались на категорию: %(name)s') % {'name': category.name})
         return HttpResponseRedirect(reverse('news:category_detail', args=[pk]))
 
@@ -62,78 +100,182 @@ class CategorySubscribeView(LoginRequiredMixin, View):
 class CategoryUnsubscribeView(LoginRequiredMixin, View):
     def post(self, request, pk):
         category = get_object_or_404(Category, pk=pk)
-        CategorySubscription.objects.filter(user=request.user, category=category).delete()
+        unsubscribe(request.user, [category.pk])
         messages.info(request, _('Вы отписались от категории: %(name)s') % {'name': category.name})
         return HttpResponseRedirect(reverse('news:category_detail', args=[pk]))
 
 
-class ArticleDetailView(DetailView):
+class CategorySubscriptionsView(View):
+    """
+    JSON API of the user's subscriptions. GET returns the subscribed category
+    ids; POST {"subscribe": [ids], "unsubscribe": [ids]} changes many at
+    once (one INSERT, one DELETE) and returns the new list. Unknown
+    categories are rejected with 400 and nothing is changed.
+    """
+
+    def dispatch(self, request, *args, **kwargs):
+        if not request.user.is_authenticated:
+            return JsonResponse({'error': 'authentication required'}, status=403)
+        return super().dispatch(request, *args, **kwargs)
+
+    def get(self, request):
+        return JsonResponse({'subscribed': sorted(get_subscribed_category_ids(request))})
+
+    @staticmethod
+    def _ids(data, name):
+        value = data.get(name, [])
+        # bool is an int subclass; strings and floats are not ids either
+        if not isinstance(value, list) or not all(type(pk) is int for pk in value):
+            raise ValueError(name)
+        return set(value)
+
+    def post(self, request):
+        try:
+            data = json.loads(request.body or b'{}')
+            if not isinstance(data, dict):
+                raise ValueError('body')
+            to_add = self._ids(data, 'subscribe')
+            to_remove = self._ids(data, 'unsubscribe')
+        except ValueError:
+            return JsonResponse({'error': 'expected {"subscribe": [ids], "unsubscribe": [ids]}'}, status=400)
+        if to_add & to_remove:
+            return JsonResponse({'error': 'same category in subscribe and unsubscribe'}, status=400)
+        unknown = to_add - set(Category.objects.filter(pk__in=to_add).values_list('pk', flat=True))
+        if unknown:
+            return JsonResponse({'error': 'unknown categories', 'categories': sorted(unknown)}, status=400)
+        with transaction.atomic():
+            subscribe(request.user, to_add)
+            unsubscribe(request.user, to_remove)
+        forget_subscribed_category_ids(request)
+        return JsonResponse({'subscribed': sorted(get_subscribed_category_ids(request))})
+
+
+class ArticleDetailView(ConditionalViewMixin, FragmentCacheMixin, DetailView):
     model = Post
     template_name = 'news/article_detail.html'
+    fragment_template_name = 'news/partials/article_detail.html'
     context_object_name = 'article'
 
+    def get_cache_tags(self):
+        return [f"post:{self.kwargs['pk']}", 'categories']
+
+    def get_page_title(self, context):
+        return f"{_('Статья')} #{self.object.pk}"
+
+    def get_validator_tags(self):
+        return self.get_cache_tags() + ['censor-words']
+
+    def get_validator_queryset(self):
+        return self.get_queryset().filter(pk=self.kwargs['pk'])
+
     def get_queryset(self):
         return Post.objects.filter(post_type=Post.ARTICLE)
 
 
-class NewsListView(ListView):
+class NewsListView(ConditionalViewMixin, FragmentCacheMixin, KeysetPaginationMixin, ListView):
     model = Post
     template_name = 'news/news_list.html'
+    fragment_template_name = 'news/partials/news_list.html'
+    page_title = _('Все новости')
     context_object_name = 'news_list'
+    read_from_replica = True
     paginate_by = 10
 
+    def get_cache_tags(self):
+        return [f'posts:{Post.NEWS}']
+
+    def get_validator_tags(self):
+        return self.get_cache_tags() + ['censor-words']
+
+    def get_validator_queryset(self):
+        return self.get_queryset()
+
     def get_queryset(self):
-        # Only news, newest first
+        # Only news, newest first (ordering is applied by the keyset paginator)
         return (
             Post.objects.filter(post_type=Post.NEWS)
-            .order_by('-created_at')
-            .only('id', 'title', 'text', 'created_at')
+            .only('id', 'title', 'preview', 'created_at')
         )
 
 
-class NewsDetailView(DetailView):
+class NewsDetailView(ConditionalViewMixin, FragmentCacheMixin, DetailView):
     model = Post
     template_name = 'news/news_detail.html'
+    fragment_template_name = 'news/partials/news_detail.html'
     context_object_name = 'news_item'
 
+    def get_cache_tags(self):
+        return [f"post:{self.kwargs['pk']}", 'categories']
+
+    def get_page_title(self, context):
+        return f"{_('Новость')} #{self.object.pk}"
+
+    def get_context_data(self, **kwargs):
+        ctx = super().get_context_data(**kwargs)
+        ctx['categories'] = self.object.categories.all()
+        return ctx
+
+    def get_validator_tags(self):
+        return self.get_cache_tags() + ['censor-words']
+
+    def get_validator_queryset(self):
+        return self.get_queryset().filter(pk=self.kwargs['pk'])
+
     def get_queryset(self):
         # Ensure details are only for news type as per requirement
         return Post.objects.filter(post_type=Post.NEWS)
 
 
-class NewsSearchView(ListView):
+class NewsSearchView(KeysetPaginationMixin, ListView):
     model = Post
     template_name = 'news/news_search.html'
     context_object_name = 'news_list'
     paginate_by = 10
+    read_from_replica = True
 
     def get_queryset(self):
-        qs = Post.objects.filter(post_type=Post.NEWS).order_by('-created_at')
+        qs = Post.objects.filter(post_type=Post.NEWS).only('id', 'title', 'preview', 'created_at')
+        backend = get_search_backend()
+        q = self.request.GET.get('q')
         title = self.request.GET.get('title')
         author = self.request.GET.get('author')
         date_after = self.request.GET.get('date_after')
         category = self.request.GET.get('category')
+        sort = self.request.GET.get('sort')
         if title:
-            qs = qs.filter(title__icontains=title)
+            qs = backend.filter(qs, title, fields=('title',))
         if author:
             qs = qs.filter(author__user__username__icontains=author)
         if date_after:
             d = parse_date(date_after)
             if d:
-                qs = qs.filter(created_at__date__gte=d)
+                # A range on the raw column instead of created_at__date, so
+                # the (post_type, created_at) index can be used
+                start = timezone.make_aware(datetime.combine(d, time.min))
+                qs = qs.filter(created_at__gte=start)
         if category:
             qs = qs.filter(categories__id=category)
+        if q:
+            if backend.supports_ranking and sort != 'date':
+                # Relevance order: the backend ranks only the posts left by the filters above
+                limit = getattr(settings, 'NEWS_SEARCH_MAX_RESULTS', 500)
+                self.ranked_ids = backend.ranked_ids(q, limit, queryset=qs)
+                self.ranked_ids_capped = len(self.ranked_ids) >= limit
+            else:
+                qs = backend.filter(qs, q)
         return qs
 
+    def get_filters(self):
+        filters = {
+            name: self.request.GET.get(name, '')
+            for name in ('q', 'sort', 'title', 'author', 'date_after', 'category')
+        }
+        return {'filters': filters, 'filters_query': urlencode(filters)}
+
     def get_context_data(self, **kwargs):
         ctx = super().get_context_data(**kwargs)
         ctx['categories'] = Category.objects.all()
-        ctx['filters'] = {
-            'title': self.request.GET.get('title', ''),
-            'author': self.request.GET.get('author', ''),
-            'date_after': self.request.GET.get('date_after', ''),
-            'category': self.request.GET.get('category', ''),
-        }
+        ctx.update(self.get_filters())
         return ctx
 
 
@@ -155,10 +297,9 @@ class BecomeAuthorView(LoginRequiredMixin, FormView):
     form_class = forms.Form  # simple empty form
 
     def post(self, request, *args, **kwargs):
-        group, _ = Group.objects.get_or_create(name=AUTHORS_GROUP)
-        request.user.groups.add(group)
+        request.user.groups.add(get_group_id(AUTHORS_GROUP))
         # Ensure Author object exists for this user
-        Author.objects.get_or_create(user=request.user)
+        get_author_id(request.user)
         messages.success(request, _('Вы стали автором! Теперь вам доступны создание и редактирование публикаций.'))
         next_url = request.POST.get('next') or request.GET.get('next')
         if next_url and url_has_allowed_host_and_scheme(next_url, allowed_hosts={request.get_host()}, require_https=request.is_secure()):
@@ -182,8 +323,7 @@ class NewsCreateView(AuthorPermissionRedirectMixin, PermissionRequiredMixin, Cre
 
     def form_valid(self, form):
         # Assign current user as author (create Author profile if missing)
-        author, _ = Author.objects.get_or_create(user=self.request.user)
-        form.instance.author = author
+        form.instance.author_id = get_author_id(self.request.user)
         form.instance.post_type = Post.NEWS
         return super().form_valid(form)
 
@@ -218,8 +358,7 @@ class ArticleCreateView(AuthorPermissionRedirectMixin, PermissionRequiredMixin,
 
     def form_valid(self, form):
         # Assign current user as author (create Author profile if missing)
-        author, _ = Author.objects.get_or_create(user=self.request.user)
-        form.instance.author = author
+        form.instance.author_id = get_author_id(self.request.user)
         form.instance.post_type = Post.ARTICLE
         return super().form_valid(form)
 
@@ -247,26 +386,102 @@ class ArticleDeleteView(DeleteView):
 class SetTimezoneView(View):
     def post(self, request):
         tzname = request.POST.get('timezone')
-        if tzname in pytz.common_timezones:
+        if tzname in COMMON_TIMEZONE_SET:
             request.session['django_timezone'] = tzname
         return redirect(request.META.get('HTTP_REFERER', '/'))
 
 
-class NewsViewSet(viewsets.ModelViewSet):
-    queryset = Post.objects.filter(post_type=Post.NEWS)
+class TimezoneListView(View):
+    """
+    Time zones of the header selector as JSON (news/timezones.py). The list
+    never changes while the process runs, so browsers may cache it for a day
+    and revalidate with the ETag.
+    """
+
+    @method_decorator(condition(etag_func=lambda request: TIMEZONES_ETAG))
+    def get(self, request):
+        response = HttpResponse(TIMEZONES_JSON, content_type='application/json')
+        patch_cache_control(response, public=True, max_age=86400)
+        return response
+
+
+class PostReadMixin:
+    """
+    Fast read path for the post viewsets: list and retrieve serialize
+    `.values()` rows with PostValuesSerializer and accept `?fields=a,b` to
+    return (and select) only some fields. Writes still go through PostSerializer.
+
+    Both answer If-None-Match / If-Modified-Since with 304 before any query
+    for the rows runs (see news/conditional.py).
+    """
+
+    fields_query_param = 'fields'
+    post_type = None
+    # list/retrieve may read from a replica; writes are never GET requests
+    read_from_replica = True
+
+    def get_values_queryset(self, fields):
+        return self.filter_queryset(self.get_queryset()).values(*PostValuesSerializer.columns(fields))
+
+    def get_validator_tags(self):
+        if self.action == 'retrieve':
+            return [f"post:{self.kwargs['pk']}", f'ratings:{self.post_type}']
+        return [f'posts:{self.post_type}', f'ratings:{self.post_type}', 'post-categories']
+
+    def get_etag(self, request, *args, **kwargs):
+        # The same URL is rendered as JSON or as the browsable API
+        return compute_etag(request, type(self).__name__, self.get_validator_tags(), [request.META.get('HTTP_ACCEPT', '')])
+
+    def get_last_modified(self, request, *args, **kwargs):
+        queryset = self.get_queryset()
+        if self.action == 'retrieve':
+            queryset = queryset.filter(pk=kwargs['pk'])
+        return compute_last_modified(queryset, self.get_validator_tags())
+
+    def conditional(self, handler):
+        return condition(etag_func=self.get_etag, last_modified_func=self.get_last_modified)(handler)
+
+    def list(self, request, *args, **kwargs):
+        return self.conditional(self._list)(request, *args, **kwargs)
+
+    def retrieve(self, request, *args, **kwargs):
+        return self.conditional(self._retrieve)(request, *args, **kwargs)
+
+    def _list(self, request, *args, **kwargs):
+        fields = PostValuesSerializer.parse_fields(request.query_params.get(self.fields_query_param))
+        rows = self.get_values_queryset(fields)
+        page = self.paginate_queryset(rows)
+        if page is not None:
+            return self.get_paginated_response(PostValuesSerializer(page, fields).data)
+        return Response(PostValuesSerializer(rows, fields).data)
+
+    def _retrieve(self, request, *args, **kwargs):
+        fields = PostValuesSerializer.parse_fields(request.query_params.get(self.fields_query_param))
+        rows = self.get_values_queryset(fields).filter(pk=kwargs[self.lookup_url_kwarg or self.lookup_field])
+        data = PostValuesSerializer(rows[:1], fields).data
+        if not data:
+            raise Http404
+        return Response(data[0])
+
+
+class NewsViewSet(PostReadMixin, viewsets.ModelViewSet):
+    # categories are prefetched for the write responses of PostSerializer
+    queryset = Post.objects.filter(post_type=Post.NEWS).prefetch_related('categories')
+    post_type = Post.NEWS
     serializer_class = PostSerializer
+    pagination_class = PostKeysetPagination
     permission_classes = [permissions.IsAuthenticatedOrReadOnly]
 
     def perform_create(self, serializer):
-        author, _ = Author.objects.get_or_create(user=self.request.user)
-        serializer.save(author=author, post_type=Post.NEWS)
+        serializer.save(author_id=get_author_id(self.request.user), post_type=Post.NEWS)
 
 
-class ArticlesViewSet(viewsets.ModelViewSet):
-    queryset = Post.objects.filter(post_type=Post.ARTICLE)
+class ArticlesViewSet(PostReadMixin, viewsets.ModelViewSet):
+    queryset = Post.objects.filter(post_type=Post.ARTICLE).prefetch_related('categories')
+    post_type = Post.ARTICLE
     serializer_class = PostSerializer
+    pagination_class = PostKeysetPagination
     permission_classes = [permissions.IsAuthenticatedOrReadOnly]
 
     def perform_create(self, serializer):
-        author, _ = Author.objects.get_or_create(user=self.request.user)
-        serializer.save(author=author, post_type=Post.ARTICLE)
+        serializer.save(author_id=get_author_id(self.request.user), post_type=Post.ARTICLE)
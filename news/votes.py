@@ -0,0 +1,214 @@
+import atexit
+import logging
+import threading
+import time
+from collections import defaultdict
+
+from celery.signals import worker_process_shutdown
+
+from django.conf import settings
+from django.core.cache import caches
+from django.db import transaction
+from django.db.models import Case, F, IntegerField, Value, When
+from django.utils import timezone
+
+from .cache import bump_tags
+
+logger = logging.getLogger(__name__)
+
+# Rows per UPDATE ... CASE statement, keeps SQL size and parameter count bounded
+FLUSH_CHUNK_SIZE = 200
+
+
+class VoteBuffer:
+    """
+    Write-behind buffer for Post/Comment votes.
+
+    Votes are coalesced per object in process memory and written in batched
+    `UPDATE ... SET rating = rating + CASE id WHEN .. END` statements, either
+    every `flush_interval` seconds (background thread) or as soon as
+    `max_pending` objects are dirty. Author ratings are derived from the same
+    batch at flush time, so a vote itself costs no database round trip.
+
+    With `cache_alias` the pending deltas are mirrored into a shared cache
+    (e.g. Redis), so every process can read an approximate live rating
+    including votes not yet flushed by other processes.
+    """
+
+    def __init__(self, flush_interval=2.0, max_pending=500, cache_alias=None, cache_timeout=300):
+        self.flush_interval = flush_interval
+        self.max_pending = max_pending
+        self.cache = caches[cache_alias] if cache_alias else None
+        self.cache_timeout = cache_timeout
+        self._pending = defaultdict(int)
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+        self.metrics = {
+            'votes': 0,
+            'flushes': 0,
+            'failed_flushes': 0,
+            'objects_flushed': 0,
+            'rows_updated': 0,
+            'last_flush_seconds': 0.0,
+            'last_flush_at': None,
+        }
+
+    @staticmethod
+    def _cache_key(label, pk):
+        return f'votes:{label}:{pk}'
+
+    def _ensure_thread(self):
+        if self._thread is None and self.flush_interval:
+            self._thread = threading.Thread(target=self._run, name='vote-buffer-flush', daemon=True)
+            self._thread.start()
+
+    def _run(self):
+        while not self._stop.wait(self.flush_interval):
+            self.flush()
+
+    def add(self, model, pk, delta):
+        label = model._meta.label
+        with self._lock:
+            self._pending[(label, pk)] += delta
+            self.metrics['votes'] += 1
+            full = len(self._pending) >= self.max_pending
+            self._ensure_thread()
+        if self.cache is not None:
+            key = self._cache_key(label, pk)
+            try:
+                self.cache.incr(key, delta)
+            except ValueError:
+                self.cache.set(key, delta, self.cache_timeout)
+        if full:
+            self.flush()
+
+    def pending_delta(self, model, pk):
+        label = model._meta.label
+        if self.cache is not None:
+            return self.cache.get(self._cache_key(label, pk), 0)
+        with self._lock:
+            return self._pending.get((label, pk), 0)
+
+    def live_rating(self, obj):
+        """Stored rating plus votes that are not flushed yet."""
+        return obj.rating + self.pending_delta(type(obj), obj.pk)
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self.metrics)
+            stats['pending_objects'] = len(self._pending)
+        return stats
+
+    def flush(self):
+        """Writes all pending deltas; returns the number of updated rows."""
+        with self._flush_lock:
+            with self._lock:
+                batch = {key: delta for key, delta in self._pending.items() if delta}
+                self._pending = defaultdict(int)
+            if not batch:
+                return 0
+
+            started = time.monotonic()
+            try:
+                with transaction.atomic():
+                    rows = self._write(batch)
+            except Exception:
+                # Keep the votes for the next attempt
+                with self._lock:
+                    for key, delta in batch.items():
+                        self._pending[key] += delta
+                    self.metrics['failed_flushes'] += 1
+                logger.exception('Vote buffer flush failed, %d objects kept pending', len(batch))
+                return 0
+
+            if self.cache is not None:
+                for (label, pk), delta in batch.items():
+                    try:
+                        self.cache.decr(self._cache_key(label, pk), delta)
+                    except ValueError:
+                        pass
+
+            elapsed = time.monotonic() - started
+            with self._lock:
+                self.metrics['flushes'] += 1
+                self.metrics['objects_flushed'] += len(batch)
+                self.metrics['rows_updated'] += rows
+                self.metrics['last_flush_seconds'] = elapsed
+                self.metrics['last_flush_at'] = time.time()
+            logger.debug('Vote buffer flushed %d objects (%d rows) in %.4fs', len(batch), rows, elapsed)
+            return rows
+
+    def _write(self, batch):
+        from .models import Author, Comment, Post, POST_RATING_WEIGHT
+
+        post_deltas = {pk: d for (label, pk), d in batch.items() if label == Post._meta.label}
+        comment_deltas = {pk: d for (label, pk), d in batch.items() if label == Comment._meta.label}
+
+        # Author deltas follow the same rules as Author.computed_rating()
+        author_deltas = defaultdict(int)
+        for pk, author_id in Post.objects.filter(pk__in=post_deltas).values_list('pk', 'author_id'):
+            author_deltas[author_id] += post_deltas[pk] * POST_RATING_WEIGHT
+        if comment_deltas:
+            comments = list(Comment.objects.filter(pk__in=comment_deltas).values_list('pk', 'user_id', 'post__author_id'))
+            user_authors = dict(
+                Author.objects.filter(user_id__in={user_id for _pk, user_id, _a in comments}).values_list('user_id', 'pk')
+            )
+            for pk, user_id, post_author_id in comments:
+                if user_id in user_authors:
+                    author_deltas[user_authors[user_id]] += comment_deltas[pk]
+                author_deltas[post_author_id] += comment_deltas[pk]
+
+        rows = 0
+        now = timezone.now()
+        for model, deltas in ((Post, post_deltas), (Comment, comment_deltas), (Author, author_deltas)):
+            items = [(pk, d) for pk, d in deltas.items() if d]
+            for i in range(0, len(items), FLUSH_CHUNK_SIZE):
+                chunk = items[i:i + FLUSH_CHUNK_SIZE]
+                increment = Case(
+                    *[When(pk=pk, then=Value(d)) for pk, d in chunk],
+                    default=Value(0),
+                    output_field=IntegerField(),
+                )
+                changes = {'rating': F('rating') + increment}
+                if model is Post:
+                    # Change marker for HTTP validators, update() skips auto_now
+                    changes['updated_at'] = now
+                rows += model.objects.filter(pk__in=[pk for pk, _d in chunk]).update(**changes)
+        if post_deltas:
+            bump_tags([f'ratings:{Post.ARTICLE}', f'ratings:{Post.NEWS}'])
+        return rows
+
+    def close(self):
+        self._stop.set()
+        self.flush()
+
+
+_buffer = None
+_buffer_lock = threading.Lock()
+
+
+def get_vote_buffer():
+    """The process-wide VoteBuffer, or None when NEWS_VOTE_BUFFER is disabled."""
+    global _buffer
+    config = getattr(settings, 'NEWS_VOTE_BUFFER', {})
+    if not config.get('ENABLED'):
+        return None
+    if _buffer is None:
+        with _buffer_lock:
+            if _buffer is None:
+                _buffer = VoteBuffer(
+                    flush_interval=config.get('FLUSH_INTERVAL', 2.0),
+                    max_pending=config.get('MAX_PENDING', 500),
+                    cache_alias=config.get('CACHE'),
+                )
+                atexit.register(_buffer.close)
+    return _buffer
+
+
+@worker_process_shutdown.connect
+def flush_vote_buffer(**kwargs):
+    # Celery pool processes may exit without running atexit hooks
+    if _buffer is not None:
+        _buffer.close()
@@ -1,7 +1,9 @@
+import copy
 import os
 from pathlib import Path
 from celery.schedules import crontab
 
+import django
 from django.utils.translation import gettext_lazy as _
 
 BASE_DIR = Path(__file__).resolve().parent.parent
@@ -34,6 +36,8 @@ INSTALLED_APPS = [
 
 MIDDLEWARE = [
     'django.middleware.security.SecurityMiddleware',
+    'news.middleware.QueryInstrumentationMiddleware',
+    'news.middleware.ReplicaPinMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.locale.LocaleMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -58,7 +62,7 @@ TEMPLATES = [
                 'django.template.context_processors.request',
                 'django.contrib.auth.context_processors.auth',
                 'django.contrib.messages.context_processors.messages',
-                'news.context_processors.all_timezones',
+                'news.context_processors.subscriptions',
             ],
         },
     },
@@ -67,12 +71,119 @@ TEMPLATES = [
 WSGI_APPLICATION = 'newsportal.wsgi.application'
 ASGI_APPLICATION = 'newsportal.asgi.application'
 
-DATABASES = {
-    'default': {
+# Database profile: 'sqlite' (default, WAL-tuned) or 'postgres'
+NEWS_DB_PROFILE = os.getenv('NEWS_DB_PROFILE', 'sqlite')
+# Seconds a connection is reused between requests (0 = close after every request)
+NEWS_DB_CONN_MAX_AGE = int(os.getenv('NEWS_DB_CONN_MAX_AGE', '60'))
+# Set to 0 to get SQLite's stock settings (rollback journal, deferred transactions)
+NEWS_SQLITE_TUNING = os.getenv('NEWS_SQLITE_TUNING', '1') == '1'
+
+_sqlite_options = {
+    # Seconds to wait for a lock before "database is locked"
+    'timeout': int(os.getenv('NEWS_SQLITE_TIMEOUT', '20')),
+}
+if NEWS_SQLITE_TUNING and django.VERSION >= (5, 1):
+    # Writers take the lock at BEGIN, so a read transaction never has to be
+    # upgraded to a write one (that upgrade fails at once, busy timeout or not)
+    _sqlite_options['transaction_mode'] = 'IMMEDIATE'
+
+# Applied to every new SQLite connection by news/db.py
+NEWS_SQLITE_PRAGMAS = {
+    'journal_mode': 'WAL',
+    'synchronous': 'NORMAL',
+    'mmap_size': int(os.getenv('NEWS_SQLITE_MMAP_SIZE', str(256 * 1024 * 1024))),
+    'busy_timeout': _sqlite_options['timeout'] * 1000,
+    'temp_store': 'MEMORY',
+} if NEWS_SQLITE_TUNING else {}
+
+_DB_PROFILES = {
+    'sqlite': {
         'ENGINE': 'django.db.backends.sqlite3',
-        'NAME': BASE_DIR / 'db.sqlite3',
+        'NAME': os.getenv('NEWS_DB_NAME', str(BASE_DIR / 'db.sqlite3')),
+        'OPTIONS': _sqlite_options,
+        'CONN_MAX_AGE': NEWS_DB_CONN_MAX_AGE,
+        'CONN_HEALTH_CHECKS': True,
+    },
+    'postgres': {
+        'ENGINE': 'django.db.backends.postgresql',
+        'NAME': os.getenv('NEWS_DB_NAME', 'newsportal'),
+        'USER': os.getenv('NEWS_DB_USER', 'newsportal'),
+        'PASSWORD': os.getenv('NEWS_DB_PASSWORD', ''),
+        'HOST': os.getenv('NEWS_DB_HOST', 'localhost'),
+        'PORT': os.getenv('NEWS_DB_PORT', '5432'),
+        # Persistent connections, checked before reuse after a server restart
+        'CONN_MAX_AGE': NEWS_DB_CONN_MAX_AGE,
+        'CONN_HEALTH_CHECKS': True,
+        # QuerySet.iterator() (digest, notifications, exports) streams rows
+        # through server-side cursors; disable behind PgBouncer in
+        # transaction pooling mode
+        'DISABLE_SERVER_SIDE_CURSORS': os.getenv('NEWS_DB_SERVER_SIDE_CURSORS', '1') != '1',
+        'OPTIONS': {
+            'connect_timeout': 5,
+        },
+    },
+}
+DATABASES = {
+    'default': _DB_PROFILES[NEWS_DB_PROFILE],
+}
+if NEWS_DB_PROFILE == 'postgres' and os.getenv('NEWS_DB_POOL', '') == '1':
+    # psycopg 3 connection pool (Django 5.1+, needs psycopg[pool]); the pool
+    # owns connection lifetime, so persistent connections are turned off
+    DATABASES['default']['OPTIONS']['pool'] = {
+        'min_size': int(os.getenv('NEWS_DB_POOL_MIN', '2')),
+        'max_size': int(os.getenv('NEWS_DB_POOL_MAX', '10')),
     }
+    DATABASES['default']['CONN_MAX_AGE'] = 0
+
+# Read replicas: comma-separated SQLite files or PostgreSQL hosts (same
+# credentials as the primary), available as aliases replica1, replica2, ...
+NEWS_DB_REPLICAS = [name.strip() for name in os.getenv('NEWS_DB_REPLICAS', '').split(',') if name.strip()]
+for _number, _replica in enumerate(NEWS_DB_REPLICAS, 1):
+    _replica_settings = copy.deepcopy(DATABASES['default'])
+    _replica_settings['NAME' if NEWS_DB_PROFILE == 'sqlite' else 'HOST'] = _replica
+    # Tests read "replica" data from the test copy of the primary
+    _replica_settings['TEST'] = {'MIRROR': 'default'}
+    DATABASES[f'replica{_number}'] = _replica_settings
+if NEWS_DB_REPLICAS:
+    DATABASE_ROUTERS = ['news.routers.ReplicaRouter']
+# 'round-robin' or 'health' (skip unreachable or lagging replicas)
+NEWS_DB_REPLICA_SELECTION = os.getenv('NEWS_DB_REPLICA_SELECTION', 'round-robin')
+NEWS_DB_REPLICA_CHECK_INTERVAL = 10
+NEWS_DB_REPLICA_MAX_LAG = 30
+# Seconds a browser stays on the primary after one of its requests wrote to it
+NEWS_DB_REPLICA_PIN_SECONDS = int(os.getenv('NEWS_DB_REPLICA_PIN_SECONDS', '5'))
+
+# Cache backend: 'locmem' (per process), 'file' or 'redis' (shared between processes)
+NEWS_CACHE_BACKEND = os.getenv('NEWS_CACHE_BACKEND', 'locmem')
+_CACHE_BACKENDS = {
+    'locmem': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    },
+    'file': {
+        'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+        'LOCATION': os.getenv('NEWS_CACHE_LOCATION', '/var/tmp/newsportal_cache'),
+    },
+    'redis': {
+        'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+        'LOCATION': os.getenv('NEWS_CACHE_LOCATION', 'redis://localhost:6379/2'),
+    },
 }
+CACHES = {
+    'default': _CACHE_BACKENDS[NEWS_CACHE_BACKEND],
+}
+
+# Rendered fragment cache for list/detail/category pages (see news/cache.py)
+NEWS_PAGE_CACHE_ALIAS = 'default'
+NEWS_PAGE_CACHE_TIMEOUT = 300
+# Cached permissions and Author id per user (news/auth.py), invalidated by signals;
+# used only with a shared cache backend (file, redis)
+NEWS_ACCESS_CACHE_TIMEOUT = 3600
+
+# Censor filter (see news/censor.py): optional word file (one word per line) used
+# instead of the built-in list, plus words from the BannedWord table
+NEWS_CENSOR_WORDS_FILE = os.getenv('NEWS_CENSOR_WORDS_FILE')
+NEWS_CENSOR_RELOAD_INTERVAL = 5
+NEWS_CENSOR_MEMO_SIZE = 10000
 
 AUTH_PASSWORD_VALIDATORS = []
 
@@ -97,11 +208,73 @@ STATIC_URL = '/static/'
 
 DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 
+# Cursor (keyset) pagination for list views and the API.
+# Total count mode: 'none', 'capped' (COUNT up to the limit) or 'approximate' (planner stats on PostgreSQL).
+NEWS_PAGINATION_COUNT_MODE = os.getenv('NEWS_PAGINATION_COUNT_MODE', 'capped')
+NEWS_PAGINATION_COUNT_LIMIT = 1000
+
+# Full-text search backend for NewsSearchView (see news/search.py).
+# SQLiteFTS5Backend needs SQLite; use DatabaseSearchBackend on other databases.
+NEWS_SEARCH_BACKEND = os.getenv(
+    'NEWS_SEARCH_BACKEND',
+    'news.search.SQLiteFTS5Backend' if NEWS_DB_PROFILE == 'sqlite' else 'news.search.DatabaseSearchBackend',
+)
+# Upper bound of relevance-ranked results returned for one query
+NEWS_SEARCH_MAX_RESULTS = 500
+
+# Write-behind buffer for Post/Comment votes (see news/votes.py).
+# When enabled, like()/dislike() only record the vote in memory; deltas are
+# flushed in batches every FLUSH_INTERVAL seconds or once MAX_PENDING objects
+# are dirty. CACHE names a shared cache alias for cross-process live ratings.
+NEWS_VOTE_BUFFER = {
+    'ENABLED': os.getenv('NEWS_VOTE_BUFFER', '') == '1',
+    'FLUSH_INTERVAL': 2.0,
+    'MAX_PENDING': 500,
+    'CACHE': None,
+}
+
+# Async variants of the list, detail, search and category pages
+# (news/async_views.py), for ASGI servers: uvicorn newsportal.asgi:application
+NEWS_ASYNC_VIEWS = os.getenv('NEWS_ASYNC_VIEWS', '') == '1'
+
+# Server-sent event stream of new posts (news/events.py, /events/posts/, ASGI only).
+# InProcessBackend serves a single process; with several workers, or posts
+# created by Celery workers, use news.events.RedisBackend.
+NEWS_EVENTS_BACKEND = os.getenv('NEWS_EVENTS_BACKEND', 'news.events.InProcessBackend')
+NEWS_EVENTS_REDIS_URL = os.getenv('NEWS_EVENTS_REDIS_URL', 'redis://localhost:6379/3')
+NEWS_EVENTS_CHANNEL = 'newsportal:post-events'
+# Per-connection queue limits; a client that falls behind loses its oldest events
+NEWS_EVENTS_QUEUE_SIZE = 100
+NEWS_EVENTS_QUEUE_BYTES = 64 * 1024
+# Seconds between keep-alive comments on an idle stream
+NEWS_EVENTS_HEARTBEAT = 15
+NEWS_EVENTS_MAX_CONNECTIONS = 10000
+
+# Per-request SQL metrics (see news.middleware.QueryInstrumentationMiddleware).
+# Server-Timing reveals DB timings to the client, so it is on in DEBUG only.
+NEWS_SERVER_TIMING = DEBUG
+# Maximum number of SQL queries per URL name; exceeding it logs a warning,
+# or raises QueryBudgetExceeded when NEWS_QUERY_BUDGET_STRICT is on (test runs).
+NEWS_QUERY_BUDGETS = {
+    'news:list': 6,
+    'news:detail': 6,
+    'news:article_detail': 6,
+    'news:category_detail': 6,
+    'news:search': 6,
+    'news-api-list': 6,
+    'news-api-detail': 6,
+    'articles-api-list': 6,
+    'articles-api-detail': 6,
+}
+NEWS_QUERY_BUDGET_STRICT = os.getenv('NEWS_QUERY_BUDGET_STRICT', '') == '1'
+
 # django-allauth basic configuration
 SITE_ID = 1
 
 AUTHENTICATION_BACKENDS = (
-    'django.contrib.auth.backends.ModelBackend',
+    # ModelBackend with permissions and the Author profile cached per user (news/auth.py).
+    # Only with a shared cache: locmem would keep revoked permissions in other workers.
+    'django.contrib.auth.backends.ModelBackend' if NEWS_CACHE_BACKEND == 'locmem' else 'news.auth.CachedModelBackend',
     'allauth.account.auth_backends.AuthenticationBackend',
 )
 
@@ -123,12 +296,33 @@ CELERY_RESULT_BACKEND = os.getenv('CELERY_RESULT_BACKEND', 'redis://localhost:63
 CELERY_TIMEZONE = TIME_ZONE
 CELERY_ENABLE_UTC = False
 
+# Article notifications: subscribers per Celery subtask (one SMTP session each).
+# Delivered recipients are recorded in NotificationDelivery, so retries are idempotent.
+NEWS_NOTIFICATION_CHUNK_SIZE = 500
+# Welcome emails (news.tasks.send_welcome_emails): signups within BATCH_DELAY
+# seconds share one SMTP session of up to BATCH_SIZE messages; a batch claimed
+# by a worker that died is taken over after CLAIM_TIMEOUT seconds.
+NEWS_WELCOME_BATCH_SIZE = 100
+NEWS_WELCOME_BATCH_DELAY = 10
+NEWS_WELCOME_CLAIM_TIMEOUT = 600
+
+# Transactional outbox of signal-started tasks (news/outbox.py): relayed to the
+# broker every RELAY_INTERVAL seconds by Celery Beat (or `manage.py relay_outbox
+# --loop`), BATCH_SIZE rows per batch.
+NEWS_OUTBOX_RELAY_INTERVAL = 5
+NEWS_OUTBOX_BATCH_SIZE = 500
+NEWS_OUTBOX_CLAIM_TIMEOUT = 300
+
 # Celery Beat schedule: every Monday at 08:00 local time
 CELERY_BEAT_SCHEDULE = {
     'send-weekly-digest-every-monday-08-00': {
         'task': 'news.tasks.send_weekly_digest_task',
         'schedule': crontab(minute=0, hour=8, day_of_week='mon'),
     },
+    'relay-outbox': {
+        'task': 'news.tasks.relay_outbox_task',
+        'schedule': NEWS_OUTBOX_RELAY_INTERVAL,
+    },
 }
 
 LOGGING = {
@@ -236,5 +430,22 @@ LOGGING = {
             'handlers': ['security_file'],
             'propagate': True,
         },
+        'news.performance': {
+            'handlers': ['console', 'general_file'],
+            'level': 'INFO',
+            'propagate': False,
+        },
+        # Celery tasks: e.g. notification recipients refused by the SMTP server (news/tasks.py)
+        'news.tasks': {
+            'handlers': ['console', 'general_file'],
+            'level': 'INFO',
+            'propagate': False,
+        },
+        # Outbox relay runs: relayed rows, backlog, lag (news/outbox.py)
+        'news.outbox': {
+            'handlers': ['console', 'general_file'],
+            'level': 'INFO',
+            'propagate': False,
+        },
     }
 }